@@ -1,9 +1,16 @@
 import streamlit as st
 import gspread
+from gspread.utils import rowcol_to_a1
 import pandas as pd
 from oauth2client.service_account import ServiceAccountCredentials
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import json
+import re
+import threading
+import time
+import uuid
+from inventario import obtener_inventario
+from cola_escritura_tareas import cantidad_pendientes, encolar_creacion, encolar_estados, iniciar as iniciar_cola, pausada as cola_pausada, pendientes, vaciar as vaciar_cola
 
 # Configuración de credenciales
 info = st.secrets["google_service_account"]
@@ -16,6 +23,30 @@ cliente = gspread.authorize(credenciales)
 ASIGNACION_SHEET_ID = st.secrets["google_sheets"]["asignacion_tareas_id"]
 BASE_DATOS_SHEET_ID = st.secrets["google_sheets"]["base_datos_id"]
 
+# Columnas de la hoja de asignación (ID_Tarea identifica cada fila de forma estable)
+COLUMNAS_TAREAS = [
+    "Emisor", "Encargado", "Tarea", "Fecha", "Hora", "Estado",
+    "Numero_Equipo", "Numero_Serie", "Nombre_Equipo", "Area_Equipo", "ID_Tarea"
+]
+
+# Segundos que se confía en el índice ID -> fila antes de reconstruirlo
+TTL_INDICE_TAREAS = 600
+
+# Segundos que se confía en el orden de columnas antes de releer el encabezado
+TTL_ESQUEMA = 300
+
+# Segundos que se reutiliza el repositorio de tareas en memoria antes de releer la hoja
+TTL_TAREAS = 60
+COLUMNAS_CATEGORICAS = ["Estado", "Encargado", "Area_Equipo"]
+
+# Archivo: las tareas cerradas con fecha límite de hace más de DIAS_ARCHIVO días
+# pasan a hojas mensuales "Archivo_AAAA_MM" del mismo libro
+DIAS_ARCHIVO = 30
+ESTADOS_ARCHIVABLES = ("Completada", "Cancelada")
+PREFIJO_ARCHIVO = "Archivo_"
+INTERVALO_ARCHIVO = 24 * 60 * 60  # archivado automático como máximo una vez al día
+TTL_ARCHIVO = 3600
+
 def cargar_roles():
     """Carga los roles desde secrets"""
     try:
@@ -55,20 +86,13 @@ def obtener_pasantes_disponibles(nivel_asignador):
     pasantes_disponibles.sort(key=lambda x: x['nivel'])
     return pasantes_disponibles
 
-@st.cache_data(ttl=300)  # Cache por 5 minutos
 def cargar_equipos_base_datos():
-    """Carga los equipos desde la hoja de base de datos con las columnas exactas de tu Excel"""
+    """Carga los equipos desde el inventario compartido con las columnas exactas de tu Excel"""
     try:
-        # Abrir la hoja de base de datos
-        hoja_base = cliente.open_by_key(BASE_DATOS_SHEET_ID).sheet1
-        datos = hoja_base.get_all_records()
-        
-        # Debug: mostrar las primeras columnas para verificar nombres
-        if datos:
-            st.info(f"🔍 Columnas encontradas: {list(datos[0].keys())}")
+        df = obtener_inventario()
         
         equipos = []
-        for fila in datos:
+        for fila in df.to_dict('records'):
             # Usar las columnas EXACTAS de tu base de datos según tu imagen
             equipo_info = {
                 'numero_equipo': str(fila.get('Codigo nuevo', '')).strip(),  # Mantengo según tu código
@@ -93,38 +117,524 @@ def cargar_equipos_base_datos():
         st.error("Verifique que la cuenta de servicio tenga acceso a la hoja de base de datos.")
         return []
 
+@st.cache_resource(show_spinner=False)
+def _hoja_asignacion():
+    """Hoja de asignación abierta una sola vez por proceso"""
+    return cliente.open_by_key(ASIGNACION_SHEET_ID).sheet1
+
+@st.cache_resource(show_spinner=False)
+def _estado_esquema():
+    """Mapeo de columnas de la hoja de asignación compartido por el proceso"""
+    return {
+        "columnas": None,                # {columna: índice (base 1)}
+        "verificado_en": float("-inf"),  # time.monotonic() de la última lectura del encabezado
+        "completar_ids": True,           # hay filas sin ID_Tarea por completar
+        "lock": threading.Lock(),
+    }
+
+def esquema_tareas(forzar=False):
+    """
+    Devuelve {columna: índice (base 1)} de la hoja de asignación. El encabezado
+    (solo la fila 1) se relee cada TTL_ESQUEMA segundos, con forzar=True o tras
+    un fallo de escritura, así que reordenar columnas a mano no deja las
+    escrituras apuntando a otra columna hasta reiniciar. Las columnas requeridas
+    que falten se agregan al final del encabezado sin mover las existentes, y
+    las filas sin ID_Tarea reciben uno (es la única escritura fuera de la cola).
+    """
+    estado = _estado_esquema()
+    if not forzar and estado["columnas"] is not None and not estado["completar_ids"] \
+            and time.monotonic() - estado["verificado_en"] < TTL_ESQUEMA:
+        return estado["columnas"]
+
+    with estado["lock"]:
+        if forzar or estado["columnas"] is None or time.monotonic() - estado["verificado_en"] >= TTL_ESQUEMA:
+            hoja_tareas = _hoja_asignacion()
+            encabezado = hoja_tareas.row_values(1)
+            faltantes = [columna for columna in COLUMNAS_TAREAS if columna not in encabezado]
+            if faltantes:
+                inicio = len(encabezado) + 1
+                hoja_tareas.update(
+                    f"{rowcol_to_a1(1, inicio)}:{rowcol_to_a1(1, inicio + len(faltantes) - 1)}", [faltantes]
+                )
+                encabezado = encabezado + faltantes
+                print(f"Asignación de tareas: columnas agregadas al encabezado: {', '.join(faltantes)}")
+            esquema = {columna: indice for indice, columna in enumerate(encabezado, start=1) if columna}
+            if estado["columnas"] is not None and esquema != estado["columnas"]:
+                # El índice de filas se armó leyendo la columna ID_Tarea anterior
+                print("Asignación de tareas: cambió el orden de las columnas; se reconstruye el índice")
+                _estado_indice_tareas()["construido_en"] = float("-inf")
+            estado["columnas"] = esquema
+            estado["verificado_en"] = time.monotonic()
+        if estado["completar_ids"]:
+            _completar_ids(_hoja_asignacion(), estado["columnas"])
+            estado["completar_ids"] = False
+        return estado["columnas"]
+
+def _invalidar_esquema(completar_ids=False):
+    """El próximo uso del esquema vuelve a leer el encabezado (y completa IDs si se pide)"""
+    estado = _estado_esquema()
+    estado["verificado_en"] = float("-inf")
+    if completar_ids:
+        estado["completar_ids"] = True
+
+def _completar_ids(hoja_tareas, esquema):
+    """Asigna ID_Tarea a las filas con datos que no lo tienen (una sola escritura de la columna)"""
+    filas = hoja_tareas.get_all_values()[1:]
+    i_id = esquema["ID_Tarea"] - 1
+    ids = [fila[i_id] if len(fila) > i_id else '' for fila in filas]
+    sin_id = [n for n, fila in enumerate(filas) if not ids[n] and any(valor.strip() for valor in fila)]
+    if not sin_id:
+        return
+    for n in sin_id:
+        ids[n] = nuevo_id_tarea()
+    columna_id = rowcol_to_a1(1, esquema["ID_Tarea"])[:-1]
+    hoja_tareas.update(f"{columna_id}2:{columna_id}{len(ids) + 1}", [[id_tarea] for id_tarea in ids])
+    print(f"Asignación de tareas: IDs completados para {len(sin_id)} filas")
+
+def _letra_columna(columna):
+    """Letra A1 de una columna de la hoja de asignación (p. ej. 'Estado' -> 'F')"""
+    return rowcol_to_a1(1, esquema_tareas()[columna])[:-1]
+
+def _fila_hoja(registro):
+    """Registro {columna: valor} como lista ordenada según el encabezado real de la hoja"""
+    esquema = esquema_tareas()
+    fila = [''] * max(esquema.values())
+    for columna, indice in esquema.items():
+        fila[indice - 1] = registro.get(columna, '')
+    return fila
+
+@st.cache_resource(show_spinner=False)
+def _estado_indice_tareas():
+    """Índice ID_Tarea -> número de fila compartido por el proceso"""
+    return {"filas": None, "construido_en": float("-inf"), "lock": threading.Lock()}
+
+def nuevo_id_tarea():
+    return f"T-{uuid.uuid4().hex[:10]}"
+
+def _construir_indice_tareas(hoja_tareas):
+    """
+    Lee solo la columna ID_Tarea para armar el índice ID -> fila (las celdas
+    vacías intermedias conservan su posición, así que no desalinean las filas).
+    """
+    columna_id = _letra_columna("ID_Tarea")
+    ids = hoja_tareas.batch_get([f"{columna_id}2:{columna_id}"])[0]
+    return {fila[0]: numero_fila for numero_fila, fila in enumerate(ids, start=2) if fila and fila[0]}
+
+def _filas_vigentes(hoja_tareas, destinos):
+    """
+    True si el encabezado sigue coincidiendo con el esquema y cada fila de
+    destinos {ID_Tarea: fila} sigue teniendo ese ID (una sola lectura).
+    Un orden o borrado manual, o el archivado desde otra instancia, desplaza
+    las filas, y mover columnas cambia dónde está Estado: sin esta
+    verificación un estado se escribiría en otra tarea u otra columna.
+    """
+    esquema = esquema_tareas()
+    columna_id = rowcol_to_a1(1, esquema["ID_Tarea"])[:-1]
+    leidos = hoja_tareas.batch_get(["1:1"] + [f"{columna_id}{fila}" for fila in destinos.values()])
+    encabezado = leidos[0][0] if leidos[0] else []
+    if {columna: indice for indice, columna in enumerate(encabezado, start=1) if columna} != esquema:
+        return False
+    return all(
+        bool(valor) and bool(valor[0]) and valor[0][0] == id_tarea
+        for id_tarea, valor in zip(destinos, leidos[1:])
+    )
+
+def _indice_tareas(forzar=False):
+    """Índice ID_Tarea -> fila; se reconstruye cada TTL_INDICE_TAREAS segundos"""
+    estado = _estado_indice_tareas()
+    with estado["lock"]:
+        if forzar or estado["filas"] is None or time.monotonic() - estado["construido_en"] > TTL_INDICE_TAREAS:
+            estado["filas"] = _construir_indice_tareas(_hoja_asignacion())
+            estado["construido_en"] = time.monotonic()
+        return estado["filas"]
+
+def _registrar_filas_tareas(ids_tareas, respuesta_append):
+    """Agrega al índice las filas devueltas por append_rows (p. ej. 'Hoja 1'!A12:K14)"""
+    rango = respuesta_append.get('updates', {}).get('updatedRange', '')
+    coincidencia = re.search(r"![A-Z]+(\d+)", rango)
+    estado = _estado_indice_tareas()
+    with estado["lock"]:
+        if coincidencia and estado["filas"] is not None:
+            for numero_fila, id_tarea in enumerate(ids_tareas, start=int(coincidencia.group(1))):
+                estado["filas"][id_tarea] = numero_fila
+
+def _escribir_cola(creaciones, estados, reintento):
+    """
+    Escritura real de la cola de tareas. Si falla, el encabezado se vuelve a
+    leer antes del reintento por si se movieron columnas.
+    """
+    try:
+        _escribir_en_hoja(creaciones, estados, reintento)
+    except Exception:
+        _invalidar_esquema()
+        raise
+
+def _escribir_en_hoja(creaciones, estados, reintento):
+    """Un append_rows con todas las altas y un batch_update con todos los cambios de estado"""
+    hoja_tareas = _hoja_asignacion()
+    if creaciones and reintento:
+        # El envío fallido anterior pudo haber llegado a la hoja: no se duplican tareas
+        filas = _indice_tareas(forzar=True)
+        creaciones = [registro for registro in creaciones if registro['ID_Tarea'] not in filas]
+    if creaciones:
+        # Las filas nuevas se arman según el encabezado actual, no el de hace TTL_ESQUEMA
+        esquema_tareas(forzar=True)
+        respuesta = hoja_tareas.append_rows([_fila_hoja(registro) for registro in creaciones])
+        _registrar_filas_tareas([registro['ID_Tarea'] for registro in creaciones], respuesta)
+
+    if estados:
+        filas = _indice_tareas()
+        if any(id_tarea not in filas for id_tarea in estados):
+            filas = _indice_tareas(forzar=True)
+        destinos = {id_tarea: filas[id_tarea] for id_tarea in estados if id_tarea in filas}
+        if destinos and not _filas_vigentes(hoja_tareas, destinos):
+            # Filas reordenadas/borradas o columnas movidas: se releen encabezado e índice
+            print("Cola de tareas: filas desplazadas en la hoja; se reconstruye el índice")
+            esquema_tareas(forzar=True)
+            filas = _indice_tareas(forzar=True)
+            destinos = {id_tarea: filas[id_tarea] for id_tarea in estados if id_tarea in filas}
+        columna_estado = _letra_columna("Estado")
+        actualizaciones = [
+            {'range': f"{columna_estado}{fila}", 'values': [[estados[id_tarea]]]}
+            for id_tarea, fila in destinos.items()
+        ]
+        if len(actualizaciones) < len(estados):
+            print(f"Cola de tareas: {len(estados) - len(actualizaciones)} estados de tareas inexistentes descartados")
+        if actualizaciones:
+            hoja_tareas.batch_update(actualizaciones)
+
+    print(f"Cola de tareas: {len(creaciones)} altas y {len(estados)} cambios de estado escritos")
+
+# Las escrituras de tareas pasan por la cola; lo pendiente de una ejecución anterior se envía al iniciar
+iniciar_cola(_escribir_cola)
+
+def _leer_tareas():
+    """Tareas de la hoja más los cambios aún en la cola de escritura"""
+    # La cola se lee ANTES que la hoja: lo que se envíe entre ambas lecturas aparece en la hoja
+    creaciones, estados = pendientes()
+    esquema_tareas()  # las filas sin ID_Tarea se completan en la verificación del esquema
+    datos = _hoja_asignacion().get_all_records()
+
+    # Filas agregadas a mano sin ID: no se muestran hasta que la próxima
+    # verificación del esquema les asigne uno (la lectura no escribe en la hoja)
+    sin_id = [t for t in datos if not t.get('ID_Tarea') and any(str(v).strip() for v in t.values())]
+    if sin_id:
+        _invalidar_esquema(completar_ids=True)
+    datos = [t for t in datos if t.get('ID_Tarea')]
+
+    ids_en_hoja = {t.get('ID_Tarea') for t in datos}
+    datos += [registro for registro in creaciones if registro['ID_Tarea'] not in ids_en_hoja]
+    for tarea in datos:
+        if tarea.get('ID_Tarea') in estados:
+            tarea['Estado'] = estados[tarea['ID_Tarea']]
+    return datos
+
 def cargar_tareas_asignadas():
-    """Carga las tareas ya asignadas"""
+    """Carga las tareas ya asignadas (incluye los cambios aún en la cola de escritura)"""
     try:
-        hoja_tareas = cliente.open_by_key(ASIGNACION_SHEET_ID).sheet1
-        datos = hoja_tareas.get_all_records()
-        return datos
+        return _leer_tareas()
     except Exception as e:
         st.error(f"Error al cargar tareas: {e}")
         return []
 
+# Repositorio de tareas en memoria: DataFrame tipado (Estado, Encargado y Area_Equipo
+# categóricas) indexado por ID_Tarea, con conteos precalculados que se ajustan al
+# asignar o cambiar estados; la hoja solo se vuelve a leer cada TTL_TAREAS segundos.
+# Copy-on-write: DataFrame y conteos publicados nunca se modifican; cada cambio
+# arma copias nuevas y las reemplaza bajo el lock, así las sesiones que los están
+# leyendo (sin lock) no ven datos a medio actualizar.
+@st.cache_resource(show_spinner=False)
+def _estado_repositorio():
+    return {"df": None, "agregados": None, "cargado_en": float("-inf"), "generacion": 0,
+            "cargando": False, "lock": threading.Lock()}
+
+def _tipar_tareas(registros):
+    """DataFrame con las columnas de la hoja, texto limpio y categorías"""
+    df = pd.DataFrame(registros).reindex(columns=COLUMNAS_TAREAS).fillna('').astype(str)
+    for columna in COLUMNAS_CATEGORICAS:
+        df[columna] = df[columna].astype('category')
+    df = df.set_index('ID_Tarea', drop=False)
+
+    # Un ID repetido (p. ej. una fila copiada a mano) rompería las búsquedas por ID:
+    # se conserva la última fila, que es la que el índice de filas usa para escribir
+    repetidos = df.index.duplicated(keep='last')
+    if repetidos.any():
+        print(f"Asignación de tareas: ID_Tarea repetidos en la hoja, se ignoran: {', '.join(sorted(set(df.index[repetidos])))}")
+        df = df[~repetidos]
+    return df
+
+def _clave_equipo(tarea):
+    return f"{tarea.get('Numero_Equipo', '')} - {tarea.get('Nombre_Equipo', '')}"
+
+def _conteos(serie):
+    """value_counts como dict, sin las categorías sin filas"""
+    return {clave: int(cantidad) for clave, cantidad in serie.value_counts().items() if cantidad > 0}
+
+def _calcular_agregados(df):
+    """Conteos por estado, encargado, área y equipo (vectorizados)"""
+    con_equipo = df[df['Nombre_Equipo'] != '']
+    con_area = df[df['Area_Equipo'] != '']
+    return {
+        'por_estado': _conteos(df['Estado']),
+        'por_encargado': _conteos(df['Encargado']),
+        'por_area': _conteos(con_area['Area_Equipo']),
+        'por_equipo': _conteos(con_equipo['Numero_Equipo'] + ' - ' + con_equipo['Nombre_Equipo']),
+    }
+
+def _copiar_agregados(agregados):
+    return {nombre: dict(conteos) for nombre, conteos in agregados.items()}
+
+def _sumar(conteos, clave, cantidad):
+    conteos[clave] = conteos.get(clave, 0) + cantidad
+
+def _publicar(estado, df, agregados):
+    """Reemplaza DataFrame y conteos publicados (con el lock tomado)"""
+    estado["df"], estado["agregados"] = df, agregados
+    estado["generacion"] += 1
+
+def _repositorio_alta(registro):
+    """Agrega una tarea recién asignada al repositorio y a sus conteos"""
+    estado = _estado_repositorio()
+    with estado["lock"]:
+        if estado["df"] is None or registro['ID_Tarea'] in estado["df"].index:
+            return
+        df = pd.concat([estado["df"].astype({c: str for c in COLUMNAS_CATEGORICAS}), _tipar_tareas([registro]).astype(str)])
+        for columna in COLUMNAS_CATEGORICAS:
+            df[columna] = df[columna].astype('category')
+
+        agregados = _copiar_agregados(estado["agregados"])
+        _sumar(agregados['por_estado'], registro.get('Estado', ''), 1)
+        _sumar(agregados['por_encargado'], registro.get('Encargado', ''), 1)
+        if registro.get('Area_Equipo'):
+            _sumar(agregados['por_area'], registro['Area_Equipo'], 1)
+        if registro.get('Nombre_Equipo'):
+            _sumar(agregados['por_equipo'], _clave_equipo(registro), 1)
+        _publicar(estado, df, agregados)
+
+def _repositorio_estados(cambios):
+    """Aplica cambios de estado al repositorio y mueve los conteos por estado"""
+    estado = _estado_repositorio()
+    with estado["lock"]:
+        if estado["df"] is None:
+            return
+        df = estado["df"].copy()
+        nuevos = [e for e in set(cambios.values()) if e not in df['Estado'].cat.categories]
+        if nuevos:
+            df['Estado'] = df['Estado'].cat.add_categories(nuevos)
+        agregados = _copiar_agregados(estado["agregados"])
+        for id_tarea, nuevo_estado in cambios.items():
+            if id_tarea not in df.index:
+                continue
+            anterior = df.at[id_tarea, 'Estado']
+            df.at[id_tarea, 'Estado'] = nuevo_estado
+            _sumar(agregados['por_estado'], anterior, -1)
+            _sumar(agregados['por_estado'], nuevo_estado, 1)
+        _publicar(estado, df, agregados)
+
+def obtener_tareas(forzar=False):
+    """
+    (DataFrame de tareas, conteos) desde el repositorio en memoria; ambos son
+    de solo lectura. La hoja se lee fuera del lock: mientras una sesión recarga,
+    las demás siguen usando la copia publicada. Si no se puede leer la hoja se
+    sigue usando la última copia.
+    """
+    estado = _estado_repositorio()
+    with estado["lock"]:
+        vencido = time.monotonic() - estado["cargado_en"] > TTL_TAREAS
+        if estado["df"] is not None and not forzar and (not vencido or estado["cargando"]):
+            return estado["df"], estado["agregados"]
+        estado["cargando"] = True
+        generacion = estado["generacion"]
+
+    try:
+        df = _tipar_tareas(_leer_tareas())
+        agregados = _calcular_agregados(df)
+    except Exception as e:
+        with estado["lock"]:
+            estado["cargando"] = False
+            if estado["df"] is not None:
+                print(f"No se pudieron recargar las tareas, se usa la copia en memoria: {e}")
+                estado["cargado_en"] = time.monotonic()
+                return estado["df"], estado["agregados"]
+        st.error(f"Error al cargar tareas: {e}")
+        df = _tipar_tareas([])
+        return df, _calcular_agregados(df)
+
+    with estado["lock"]:
+        estado["cargando"] = False
+        if estado["generacion"] != generacion and estado["df"] is not None:
+            # Hubo altas/cambios locales durante la lectura: se conserva la copia
+            # publicada (ya los incluye) y la próxima consulta vuelve a leer la hoja
+            return estado["df"], estado["agregados"]
+        _publicar(estado, df, agregados)
+        estado["cargado_en"] = time.monotonic()
+        return df, agregados
+
+def _fecha_tarea(texto):
+    try:
+        return datetime.strptime(texto.strip(), '%d/%m/%Y').date()
+    except (ValueError, AttributeError):
+        return None
+
+def _rangos_contiguos(numeros):
+    """[(inicio, fin)] de filas consecutivas, de abajo hacia arriba (para borrar sin desplazar)"""
+    rangos = []
+    for numero in sorted(numeros):
+        if rangos and rangos[-1][1] == numero - 1:
+            rangos[-1][1] = numero
+        else:
+            rangos.append([numero, numero])
+    return [tuple(r) for r in reversed(rangos)]
+
+def _ids_en_cola():
+    """IDs de las tareas con altas o cambios de estado aún en la cola de escritura"""
+    creaciones, estados = pendientes()
+    return set(estados) | {registro['ID_Tarea'] for registro in creaciones}
+
+def _escribir_en_archivo(libro, hojas, titulo, encabezado, filas):
+    """
+    Copia las filas (listas según 'encabezado') a la hoja de archivo 'titulo'.
+    Las tareas que ya están en el archivo (p. ej. por un intento anterior que
+    falló antes de borrarlas de la hoja activa) se actualizan en su fila en
+    lugar de agregarse de nuevo.
+    """
+    hoja_archivo = hojas.get(titulo)
+    if hoja_archivo is None:
+        hoja_archivo = libro.add_worksheet(title=titulo, rows=1, cols=len(encabezado))
+        hoja_archivo.update('A1', [encabezado])
+        hojas[titulo] = hoja_archivo
+        encabezado_archivo, existentes = encabezado, {}
+    else:
+        encabezado_archivo = hoja_archivo.row_values(1)
+        columna_id = rowcol_to_a1(1, encabezado_archivo.index('ID_Tarea') + 1)[:-1]
+        ids = hoja_archivo.batch_get([f"{columna_id}2:{columna_id}"])[0]
+        existentes = {fila[0]: numero for numero, fila in enumerate(ids, start=2) if fila and fila[0]}
+
+    nuevas, actualizaciones = [], []
+    for fila in filas:
+        registro = dict(zip(encabezado, fila))
+        valores = [registro.get(columna, '') for columna in encabezado_archivo]
+        if registro['ID_Tarea'] in existentes:
+            actualizaciones.append({'range': f"A{existentes[registro['ID_Tarea']]}", 'values': [valores]})
+        else:
+            nuevas.append(valores)
+    if actualizaciones:
+        hoja_archivo.batch_update(actualizaciones)
+    if nuevas:
+        hoja_archivo.append_rows(nuevas)
+
+def archivar_tareas(dias=DIAS_ARCHIVO):
+    """
+    Mueve las tareas Completadas/Canceladas con fecha límite anterior a hoy - dias
+    a las hojas mensuales Archivo_AAAA_MM y las borra de la hoja activa.
+    Primero se copia al archivo y luego se borra: un fallo intermedio deja la
+    tarea duplicada (el lector unificado la muestra una sola vez), nunca perdida,
+    y el siguiente intento no la vuelve a agregar al archivo.
+    Las tareas con cambios aún en la cola se dejan para el próximo archivado.
+    Devuelve la cantidad de tareas archivadas.
+    """
+    limite = date.today() - timedelta(days=dias)
+    libro = cliente.open_by_key(ASIGNACION_SHEET_ID)
+    hoja_tareas = _hoja_asignacion()
+
+    # La cola no escribe mientras se mueven filas (sus números de fila cambian)
+    with cola_pausada():
+        vaciar_cola()
+        valores = hoja_tareas.get_all_values()
+        if len(valores) < 2:
+            return 0
+        encabezado = valores[0]
+        esquema = esquema_tareas(forzar=True)
+        i_estado, i_fecha, i_id = esquema['Estado'] - 1, esquema['Fecha'] - 1, esquema['ID_Tarea'] - 1
+
+        en_cola = _ids_en_cola()
+        por_mes, filas_archivadas = {}, {}
+        for numero_fila, fila in enumerate(valores[1:], start=2):
+            fila = fila + [''] * (len(encabezado) - len(fila))
+            fecha = _fecha_tarea(fila[i_fecha])
+            if (fila[i_estado] in ESTADOS_ARCHIVABLES and fecha and fecha < limite
+                    and fila[i_id] and fila[i_id] not in en_cola):
+                por_mes.setdefault(f"{PREFIJO_ARCHIVO}{fecha:%Y_%m}", []).append(fila)
+                filas_archivadas[numero_fila] = fila[i_id]
+        if not filas_archivadas:
+            return 0
+
+        hojas = {ws.title: ws for ws in libro.worksheets()}
+        for titulo, filas in sorted(por_mes.items()):
+            _escribir_en_archivo(libro, hojas, titulo, encabezado, filas)
+
+        # Un cambio de estado encolado durante la copia deja la tarea en la hoja
+        # activa (su copia en el archivo se actualiza en el próximo archivado)
+        en_cola = _ids_en_cola()
+        filas_archivadas = {fila: id_tarea for fila, id_tarea in filas_archivadas.items() if id_tarea not in en_cola}
+        if filas_archivadas:
+            libro.batch_update({'requests': [
+                {'deleteDimension': {'range': {
+                    'sheetId': hoja_tareas.id, 'dimension': 'ROWS',
+                    'startIndex': inicio - 1, 'endIndex': fin
+                }}}
+                for inicio, fin in _rangos_contiguos(filas_archivadas)
+            ]})
+
+        # Las filas se desplazaron: índice y repositorio se reconstruyen
+        _indice_tareas(forzar=True)
+    _estado_repositorio()["cargado_en"] = float("-inf")
+    _leer_archivo_tareas.clear()
+    print(f"Asignación de tareas: {len(filas_archivadas)} tareas archivadas en {len(por_mes)} hojas")
+    return len(filas_archivadas)
+
+@st.cache_resource(show_spinner=False)
+def _estado_archivo_automatico():
+    return {"ultimo": float("-inf"), "lock": threading.Lock()}
+
+def _archivar_en_segundo_plano():
+    try:
+        archivar_tareas()
+    except Exception as e:
+        print(f"Asignación de tareas: no se pudo archivar: {e}")
+
+def programar_archivo_tareas():
+    """Lanza el archivado en segundo plano como máximo una vez cada INTERVALO_ARCHIVO"""
+    estado = _estado_archivo_automatico()
+    with estado["lock"]:
+        if time.monotonic() - estado["ultimo"] < INTERVALO_ARCHIVO:
+            return
+        estado["ultimo"] = time.monotonic()
+    threading.Thread(target=_archivar_en_segundo_plano, name="archivo_tareas", daemon=True).start()
+
+@st.cache_data(ttl=TTL_ARCHIVO, show_spinner=False)
+def _leer_archivo_tareas():
+    """Tareas de todas las hojas Archivo_AAAA_MM (cambian solo al archivar)"""
+    registros = []
+    for hoja in cliente.open_by_key(ASIGNACION_SHEET_ID).worksheets():
+        if hoja.title.startswith(PREFIJO_ARCHIVO):
+            registros += hoja.get_all_records()
+    return registros
+
+def leer_tareas_historicas():
+    """
+    Lector unificado: DataFrame tipado con las tareas activas y las archivadas
+    (una tarea presente en ambas se cuenta una sola vez).
+    """
+    df_activas, _ = obtener_tareas()
+    try:
+        archivadas = _tipar_tareas(_leer_archivo_tareas())
+    except Exception as e:
+        st.error(f"Error al cargar el archivo de tareas: {e}")
+        return df_activas
+    # Una tarea puede repetirse dentro del archivo o estar también en la hoja activa
+    archivadas = archivadas[~archivadas.index.duplicated(keep='last')]
+    archivadas = archivadas[~archivadas.index.isin(df_activas.index)]
+    df = pd.concat([df_activas.astype({c: str for c in COLUMNAS_CATEGORICAS}),
+                    archivadas.astype({c: str for c in COLUMNAS_CATEGORICAS})])
+    for columna in COLUMNAS_CATEGORICAS:
+        df[columna] = df[columna].astype('category')
+    return df
+
 def verificar_columnas_hoja():
-    """Verifica y crea las columnas necesarias en la hoja de asignación"""
+    """Verifica las columnas de la hoja de asignación (se revisan cada TTL_ESQUEMA segundos, ver esquema_tareas)"""
     try:
-        hoja_tareas = cliente.open_by_key(ASIGNACION_SHEET_ID).sheet1
-        
-        # Columnas requeridas
-        columnas_requeridas = [
-            "Emisor", "Encargado", "Tarea", "Fecha", "Hora", "Estado",
-            "Numero_Equipo", "Numero_Serie", "Nombre_Equipo", "Area_Equipo"
-        ]
-        
-        # Verificar si la primera fila tiene headers
-        try:
-            primera_fila = hoja_tareas.row_values(1)
-        except:
-            primera_fila = []
-        
-        if not primera_fila or len(primera_fila) < len(columnas_requeridas):
-            # Actualizar headers
-            hoja_tareas.update('A1:J1', [columnas_requeridas])
-            st.success("✅ Headers de la hoja actualizados correctamente")
-        
+        esquema_tareas()
         return True
         
     except Exception as e:
@@ -132,28 +642,27 @@ def verificar_columnas_hoja():
         return False
 
 def asignar_nueva_tarea(datos_tarea):
-    """Asigna una nueva tarea en la hoja de cálculo"""
+    """Asigna una nueva tarea (se anota en la cola y se escribe en la hoja en segundo plano)"""
     try:
-        hoja_tareas = cliente.open_by_key(ASIGNACION_SHEET_ID).sheet1
-        
         # Agregar nueva fila con timestamp
         timestamp = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-        nueva_fila = [
-            datos_tarea['emisor'],
-            datos_tarea['encargado'],
-            datos_tarea['tarea'],
-            datos_tarea['fecha'],
-            datos_tarea['hora'],
-            datos_tarea['estado'],
-            datos_tarea.get('numero_equipo', ''),
-            datos_tarea.get('numero_serie', ''),
-            datos_tarea.get('nombre_equipo', ''),
-            datos_tarea.get('area_equipo', '')
-        ]
-        
-        hoja_tareas.append_row(nueva_fila)
+        id_tarea = nuevo_id_tarea()
+        registro = {
+            'Emisor': datos_tarea['emisor'],
+            'Encargado': datos_tarea['encargado'],
+            'Tarea': datos_tarea['tarea'],
+            'Fecha': datos_tarea['fecha'],
+            'Hora': datos_tarea['hora'],
+            'Estado': datos_tarea['estado'],
+            'Numero_Equipo': datos_tarea.get('numero_equipo', ''),
+            'Numero_Serie': datos_tarea.get('numero_serie', ''),
+            'Nombre_Equipo': datos_tarea.get('nombre_equipo', ''),
+            'Area_Equipo': datos_tarea.get('area_equipo', ''),
+            'ID_Tarea': id_tarea
+        }
         
-        cargar_equipos_base_datos.clear()
+        encolar_creacion(id_tarea, registro)
+        _repositorio_alta(registro)
         
         return True
         
@@ -161,28 +670,27 @@ def asignar_nueva_tarea(datos_tarea):
         st.error(f"Error al asignar tarea: {e}")
         return False
 
-def actualizar_estado_tarea(tarea_original, nuevo_estado):
-    """Actualiza el estado de una tarea específica buscando por contenido"""
+def actualizar_estados_tareas(cambios):
+    """
+    Actualiza varios estados; la cola los envía juntos en un solo batch_update.
+    cambios: {ID_Tarea: nuevo_estado}. Devuelve la cantidad de tareas actualizadas.
+    """
     try:
-        hoja_tareas = cliente.open_by_key(ASIGNACION_SHEET_ID).sheet1
-        todas_las_filas = hoja_tareas.get_all_values()
-        
-        # Buscar la fila que coincida con la tarea
-        for i, fila in enumerate(todas_las_filas[1:], start=2):  # Empezar desde fila 2
-            if (len(fila) >= 6 and 
-                fila[0] == tarea_original.get('Emisor', '') and
-                fila[1] == tarea_original.get('Encargado', '') and
-                fila[2] == tarea_original.get('Tarea', '')):
-                
-                # Actualizar la columna de estado (columna F, índice 6)
-                hoja_tareas.update_cell(i, 6, nuevo_estado)
-                return True
-        
-        return False
+        encolar_estados(cambios)
+        _repositorio_estados(cambios)
+        return len(cambios)
         
     except Exception as e:
-        st.error(f"Error al actualizar estado: {e}")
+        st.error(f"Error al actualizar estados: {e}")
+        return 0
+
+def actualizar_estado_tarea(tarea_original, nuevo_estado):
+    """Actualiza el estado de una tarea específica por su ID_Tarea (una sola escritura)"""
+    id_tarea = tarea_original.get('ID_Tarea', '')
+    if not id_tarea:
+        st.error("La tarea no tiene ID_Tarea; recarga la página e intenta nuevamente.")
         return False
+    return actualizar_estados_tareas({id_tarea: nuevo_estado}) == 1
 
 def mostrar_asignacion_tareas():
     """Función principal para mostrar la interfaz de asignación de tareas"""
@@ -202,6 +710,7 @@ def mostrar_asignacion_tareas():
     
     # Verificar columnas de la hoja
     verificar_columnas_hoja()
+    programar_archivo_tareas()
     
     # Mostrar información del asignador
     nivel_info = {
@@ -373,8 +882,6 @@ def mostrar_asignacion_tareas():
                         if asignar_nueva_tarea(datos_tarea):
                             st.success("✅ ¡Tarea asignada exitosamente!")
                             st.balloons()
-                            # Limpiar cache
-                            cargar_equipos_base_datos.clear()
                             st.rerun()
                         else:
                             st.error("❌ Error al asignar la tarea. Intenta nuevamente.")
@@ -384,9 +891,9 @@ def mostrar_asignacion_tareas():
         
         # Cargar tareas
         with st.spinner("🔄 Cargando tareas..."):
-            tareas = cargar_tareas_asignadas()
+            df_tareas, agregados = obtener_tareas()
         
-        if not tareas:
+        if df_tareas.empty:
             st.info("📝 No hay tareas asignadas aún.")
             st.info("💡 Usa la pestaña 'Nueva Tarea' para crear la primera asignación.")
             return
@@ -406,26 +913,38 @@ def mostrar_asignacion_tareas():
                 mostrar_solo_mias = st.checkbox("Solo mis asignaciones", value=False)
         
         with col3:
-            encargados_unicos = list(set([t.get('Encargado', '') for t in tareas if t.get('Encargado', '')]))
+            encargados_unicos = [e for e, cantidad in agregados['por_encargado'].items() if e and cantidad > 0]
             filtro_encargado = st.selectbox("👤 Encargado", ["Todos"] + sorted(encargados_unicos))
         
         with col4:
             ordenar_por = st.selectbox("📊 Ordenar", ["Fecha ↓", "Fecha ↑", "Estado", "Prioridad"])
         
         # Filtrar tareas
-        tareas_filtradas = tareas.copy()
+        filtro = pd.Series(True, index=df_tareas.index)
         
         if filtro_estado != "Todos":
-            tareas_filtradas = [t for t in tareas_filtradas if t.get('Estado', '') == filtro_estado]
+            filtro &= df_tareas['Estado'] == filtro_estado
         
         if filtro_encargado != "Todos":
-            tareas_filtradas = [t for t in tareas_filtradas if t.get('Encargado', '') == filtro_encargado]
+            filtro &= df_tareas['Encargado'] == filtro_encargado
         
         if mostrar_solo_mias:
-            tareas_filtradas = [t for t in tareas_filtradas if t.get('Emisor', '') == nombre_usuario]
+            filtro &= df_tareas['Emisor'] == nombre_usuario
+        
+        tareas_filtradas = df_tareas[filtro].to_dict('records')
         
         # Mostrar contador
-        st.info(f"📊 Mostrando {len(tareas_filtradas)} de {len(tareas)} tareas")
+        st.info(f"📊 Mostrando {len(tareas_filtradas)} de {len(df_tareas)} tareas")
+
+        en_cola = cantidad_pendientes()
+        if en_cola:
+            col_cola1, col_cola2 = st.columns([3, 1])
+            with col_cola1:
+                st.caption(f"⏳ {en_cola} cambios pendientes de guardar en la hoja (se envían automáticamente)")
+            with col_cola2:
+                if st.button("🔄 Guardar ahora", key="vaciar_cola_tareas"):
+                    vaciar_cola()
+                    st.rerun()
         
         # Mostrar tareas en cards
         if tareas_filtradas:
@@ -471,17 +990,46 @@ def mostrar_asignacion_tareas():
                                 "Cambiar Estado:",
                                 ["Pendiente", "En Proceso", "Completada", "Cancelada"],
                                 index=["Pendiente", "En Proceso", "Completada", "Cancelada"].index(tarea.get('Estado', 'Pendiente')),
-                                key=f"estado_{i}"
+                                key=f"estado_{tarea.get('ID_Tarea', i)}"
                             )
                         
                         with col_estado2:
-                            if st.button(f"✅ Actualizar", key=f"btn_{i}", type="secondary"):
+                            if st.button(f"✅ Actualizar", key=f"btn_{tarea.get('ID_Tarea', i)}", type="secondary"):
                                 if actualizar_estado_tarea(tarea, nuevo_estado):
                                     st.success("✅ Estado actualizado exitosamente")
-                                    cargar_equipos_base_datos.clear()
                                     st.rerun()
                                 else:
                                     st.error("❌ Error al actualizar el estado")
+
+            # Cambio de estado masivo (una sola escritura para todas las tareas elegidas)
+            tareas_editables = [
+                t for t in tareas_filtradas
+                if t.get('ID_Tarea') and (t.get('Emisor', '') == nombre_usuario or nivel_usuario >= 5)
+            ]
+            if tareas_editables:
+                with st.expander("🗂️ Cambiar estado de varias tareas"):
+                    etiquetas_tareas = {
+                        t['ID_Tarea']: f"{t.get('Tarea', '')[:60]} | {t.get('Encargado', '')}"
+                        for t in tareas_editables
+                    }
+                    ids_seleccionados = st.multiselect(
+                        "Tareas:",
+                        list(etiquetas_tareas),
+                        format_func=etiquetas_tareas.get,
+                        key="ids_cambio_masivo"
+                    )
+                    estado_masivo = st.selectbox(
+                        "Nuevo estado:",
+                        ["Pendiente", "En Proceso", "Completada", "Cancelada"],
+                        key="estado_cambio_masivo"
+                    )
+                    if st.button("✅ Actualizar seleccionadas", disabled=not ids_seleccionados):
+                        actualizadas = actualizar_estados_tareas({id_tarea: estado_masivo for id_tarea in ids_seleccionados})
+                        if actualizadas:
+                            st.success(f"✅ {actualizadas} tareas actualizadas")
+                            st.rerun()
+                        else:
+                            st.error("❌ No se pudo actualizar ninguna tarea")
         else:
             st.info("🔍 No se encontraron tareas con los filtros seleccionados.")
             st.info("💡 Ajusta los filtros o crea nuevas tareas.")
@@ -489,23 +1037,28 @@ def mostrar_asignacion_tareas():
     with tab3:
         st.subheader("📈 Estadísticas y Reportes")
         
-        # Cargar tareas para estadísticas
-        tareas = cargar_tareas_asignadas()
+        # Estadísticas desde los conteos precalculados del repositorio
+        df_tareas, agregados = obtener_tareas()
+        if st.checkbox("🗄️ Incluir tareas archivadas", key="estadisticas_con_archivo"):
+            df_tareas = leer_tareas_historicas()
+            agregados = _calcular_agregados(df_tareas)
         
-        if tareas:
+        if not df_tareas.empty:
+            por_estado = agregados['por_estado']
+            
             # Métricas generales
             col1, col2, col3, col4 = st.columns(4)
             
             with col1:
-                total_tareas = len(tareas)
+                total_tareas = len(df_tareas)
                 st.metric("📊 Total Tareas", total_tareas)
             
             with col2:
-                pendientes = len([t for t in tareas if t.get('Estado', '') == 'Pendiente'])
-                st.metric("⏳ Pendientes", pendientes)
+                pendientes_total = por_estado.get('Pendiente', 0)
+                st.metric("⏳ Pendientes", pendientes_total)
             
             with col3:
-                completadas = len([t for t in tareas if t.get('Estado', '') == 'Completada'])
+                completadas = por_estado.get('Completada', 0)
                 st.metric("✅ Completadas", completadas)
             
             with col4:
@@ -518,10 +1071,7 @@ def mostrar_asignacion_tareas():
             
             with col_graf1:
                 # Gráfico de distribución por estado
-                estados = {}
-                for tarea in tareas:
-                    estado = tarea.get('Estado', 'Sin Estado')
-                    estados[estado] = estados.get(estado, 0) + 1
+                estados = {(e or 'Sin Estado'): c for e, c in por_estado.items() if c > 0}
                 
                 if estados:
                     st.subheader("📊 Por Estado")
@@ -530,10 +1080,7 @@ def mostrar_asignacion_tareas():
             
             with col_graf2:
                 # Estadísticas por encargado
-                encargados = {}
-                for tarea in tareas:
-                    encargado = tarea.get('Encargado', 'Sin Encargado')
-                    encargados[encargado] = encargados.get(encargado, 0) + 1
+                encargados = {(e or 'Sin Encargado'): c for e, c in agregados['por_encargado'].items() if c > 0}
                 
                 if encargados:
                     st.subheader("👥 Por Encargado")
@@ -541,33 +1088,35 @@ def mostrar_asignacion_tareas():
                     st.bar_chart(df_encargados.set_index('Encargado'))
             
             # Resumen de equipos más asignados
-            if any(t.get('Nombre_Equipo') for t in tareas):
+            if agregados['por_equipo']:
                 st.subheader("🔧 Equipos Más Atendidos")
-                equipos_tareas = {}
-                for tarea in tareas:
-                    if tarea.get('Nombre_Equipo'):
-                        equipo = f"{tarea.get('Numero_Equipo', '')} - {tarea.get('Nombre_Equipo', '')}"
-                        equipos_tareas[equipo] = equipos_tareas.get(equipo, 0) + 1
-                
-                df_equipos = pd.DataFrame(list(equipos_tareas.items()), columns=['Equipo', 'Tareas Asignadas'])
+                df_equipos = pd.DataFrame(list(agregados['por_equipo'].items()), columns=['Equipo', 'Tareas Asignadas'])
                 df_equipos = df_equipos.sort_values('Tareas Asignadas', ascending=False).head(10)
                 st.dataframe(df_equipos, use_container_width=True)
             
             # Estadísticas por área
-            if any(t.get('Area_Equipo') for t in tareas):
+            areas_tareas = {a: c for a, c in agregados['por_area'].items() if c > 0}
+            if areas_tareas:
                 st.subheader("🏢 Tareas por Área")
-                areas_tareas = {}
-                for tarea in tareas:
-                    if tarea.get('Area_Equipo'):
-                        area = tarea.get('Area_Equipo', '')
-                        areas_tareas[area] = areas_tareas.get(area, 0) + 1
-                
                 df_areas = pd.DataFrame(list(areas_tareas.items()), columns=['Área', 'Tareas'])
                 st.bar_chart(df_areas.set_index('Área'))
         
         else:
             st.info("📊 No hay datos suficientes para mostrar estadísticas.")
             st.info("💡 Asigna algunas tareas para ver métricas y reportes.")
+        
+        # Archivado manual (además del automático diario)
+        if nivel_usuario >= 5:
+            with st.expander("🗄️ Archivar tareas cerradas"):
+                st.caption(f"Mueve las tareas {' y '.join(ESTADOS_ARCHIVABLES)} a hojas mensuales '{PREFIJO_ARCHIVO}AAAA_MM'.")
+                dias_archivo = st.number_input("Con fecha límite de hace más de (días):", min_value=0, value=DIAS_ARCHIVO, step=1)
+                if st.button("🗄️ Archivar ahora"):
+                    try:
+                        with st.spinner("Archivando tareas..."):
+                            archivadas = archivar_tareas(int(dias_archivo))
+                        st.success(f"✅ {archivadas} tareas archivadas")
+                    except Exception as e:
+                        st.error(f"Error al archivar tareas: {e}")
 
 # Función de compatibilidad para main.py
 def mostrar_modulo_asignacion():
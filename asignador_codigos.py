@@ -0,0 +1,114 @@
+# asignador_codigos.py
+# Asignador persistente de códigos EQU-XXXXXXX.
+# Cada secuencia vive en una tabla SQLite local con incremento atómico, así
+# que pedir un código (o un bloque de N) no requiere listar carpetas en Drive.
+# La secuencia se siembra desde Drive (listado paginado) y puede adelantarse
+# con sincronizar_secuencia si aparecen códigos creados fuera de la app.
+import re
+import sqlite3
+from contextlib import contextmanager
+from typing import Callable, Iterable, List
+
+from cache_local import ruta_cache
+
+ARCHIVO_SECUENCIAS = "codigos.sqlite"
+
+# Secuencias independientes (conservan el comportamiento de cada módulo)
+SECUENCIA_CARPETAS = "carpetas"   # carpetas EQU-XXXXXXX (creador_carpetas)
+SECUENCIA_QR = "qr"               # imágenes EQU-XXXXXXX.png (generar_qr)
+
+PATRON_CODIGO = re.compile(r"EQU-(\d{7})")
+
+
+def formatear_codigo(numero: int) -> str:
+    return f"EQU-{numero:07d}"
+
+
+def siguiente_numero(nombres: Iterable[str]) -> int:
+    """Número siguiente al mayor código EQU-XXXXXXX encontrado en los nombres (1 si no hay)"""
+    numeros = [int(m.group(1)) for m in (PATRON_CODIGO.match(n) for n in nombres) if m]
+    return max(numeros) + 1 if numeros else 1
+
+
+def _conectar() -> sqlite3.Connection:
+    # isolation_level=None: las transacciones se controlan a mano
+    conn = sqlite3.connect(ruta_cache(ARCHIVO_SECUENCIAS), timeout=30, isolation_level=None)
+    conn.execute("CREATE TABLE IF NOT EXISTS secuencias (nombre TEXT PRIMARY KEY, siguiente INTEGER NOT NULL)")
+    return conn
+
+
+@contextmanager
+def _transaccion():
+    """
+    Conexión dentro de una transacción BEGIN IMMEDIATE: bloquea la escritura
+    a otras sesiones/procesos hasta confirmar, así dos clics simultáneos no
+    reciben el mismo código. Dentro de la transacción no se consulta Drive.
+    """
+    conn = _conectar()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def _sembrar(secuencia: str, semilla: Callable[[], int]):
+    """
+    Siembra la secuencia con semilla() si aún no existe. La consulta a Drive se
+    hace antes de abrir la transacción: las demás reservas no esperan a la red.
+    """
+    conn = _conectar()
+    try:
+        existe = conn.execute("SELECT 1 FROM secuencias WHERE nombre = ?", (secuencia,)).fetchone()
+    finally:
+        conn.close()
+    if not existe:
+        sincronizar_secuencia(secuencia, semilla)
+
+
+def _siguiente_en_transaccion(conn, secuencia: str) -> int:
+    """Valor actual de la secuencia (ya sembrada con _sembrar)"""
+    return conn.execute("SELECT siguiente FROM secuencias WHERE nombre = ?", (secuencia,)).fetchone()[0]
+
+
+def reservar_codigos(secuencia: str, cantidad: int, semilla: Callable[[], int]) -> List[str]:
+    """
+    Reserva 'cantidad' códigos consecutivos de forma atómica. Un código
+    reservado no se vuelve a entregar aunque luego no se use.
+    semilla() devuelve el siguiente número según Drive; solo se llama la primera vez.
+    """
+    _sembrar(secuencia, semilla)
+    with _transaccion() as conn:
+        primero = _siguiente_en_transaccion(conn, secuencia)
+        conn.execute("UPDATE secuencias SET siguiente = ? WHERE nombre = ?", (primero + cantidad, secuencia))
+    return [formatear_codigo(numero) for numero in range(primero, primero + cantidad)]
+
+
+def ver_siguiente_codigo(secuencia: str, semilla: Callable[[], int]) -> str:
+    """Próximo código que se entregaría, sin reservarlo"""
+    _sembrar(secuencia, semilla)
+    with _transaccion() as conn:
+        siguiente = _siguiente_en_transaccion(conn, secuencia)
+    return formatear_codigo(siguiente)
+
+
+def sincronizar_secuencia(secuencia: str, semilla: Callable[[], int]) -> str:
+    """
+    Adelanta la secuencia si en Drive hay códigos más altos (p. ej. carpetas
+    creadas a mano). Nunca retrocede. Devuelve el próximo código.
+    semilla() se llama fuera de la transacción.
+    """
+    siguiente_remoto = semilla()
+    with _transaccion() as conn:
+        conn.execute(
+            "INSERT INTO secuencias (nombre, siguiente) VALUES (?, ?) "
+            "ON CONFLICT(nombre) DO UPDATE SET siguiente = MAX(siguiente, excluded.siguiente)",
+            (secuencia, siguiente_remoto)
+        )
+        siguiente = conn.execute("SELECT siguiente FROM secuencias WHERE nombre = ?", (secuencia,)).fetchone()[0]
+    return formatear_codigo(siguiente)
@@ -1,24 +1,22 @@
 import streamlit as st
-import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from inventario import obtener_inventario, invalidar_inventario, ultima_actualizacion
 
 def mostrar_base_datos():
     st.title("📊 Base de Datos - Clínica")
 
-    # Autenticación
-    info = st.secrets["google_service_account"]
-    scope = ['https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive']
-    credenciales = ServiceAccountCredentials.from_json_keyfile_dict(info, scope)
-    cliente = gspread.authorize(credenciales)
+    col1, col2 = st.columns([3, 1])
+    with col2:
+        if st.button("🔄 Actualizar datos", use_container_width=True):
+            invalidar_inventario()
 
     try:
-        hoja = cliente.open("Base de datos").sheet1
-        datos = hoja.get_all_records()
-        df = pd.DataFrame(datos)
+        df = obtener_inventario()
 
         st.success("✅ Datos cargados correctamente desde Google Sheets.")
+        actualizado = ultima_actualizacion()
+        if actualizado:
+            with col1:
+                st.caption(f"🕒 Última actualización: {actualizado.strftime('%d/%m/%Y %H:%M:%S')}")
         st.dataframe(df)
 
     except Exception as e:
@@ -0,0 +1,129 @@
+# cache_archivos.py
+# Caché LRU en disco para archivos descargados/exportados de Drive.
+# La clave es (fileId, md5Checksum o modifiedTime, MIME de exportación): si el
+# archivo cambia en Drive cambia la clave, así que nunca se sirve una copia vieja.
+# El total ocupado se mantiene bajo LIMITE_CACHE_BYTES desalojando lo menos usado.
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import BinaryIO, Callable
+
+from cache_local import ruta_cache
+
+# ==========================
+# CONFIG
+# ==========================
+ARCHIVO_INDICE = "archivos.sqlite"
+DIRECTORIO_ARCHIVOS = "archivos"
+
+# Presupuesto de disco para la caché (bytes)
+LIMITE_CACHE_BYTES = 512 * 1024 * 1024
+
+_lock = threading.Lock()
+
+
+# ==========================
+# ÍNDICE
+# ==========================
+def _conectar() -> sqlite3.Connection:
+    conn = sqlite3.connect(ruta_cache(ARCHIVO_INDICE), timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS archivos ("
+        "clave TEXT PRIMARY KEY, nombre TEXT NOT NULL, tamano INTEGER NOT NULL, usado_en REAL NOT NULL)"
+    )
+    return conn
+
+
+def clave_archivo(file_id: str, version: str, export_mime: str = '') -> str:
+    """Clave de caché: (fileId, md5Checksum/modifiedTime, MIME de exportación o '' si es binario)"""
+    return f"{file_id}|{version}|{export_mime}"
+
+
+def _ruta(nombre: str) -> str:
+    return ruta_cache(DIRECTORIO_ARCHIVOS, nombre)
+
+
+def _desalojar(conn, limite: int, conservar: str = None):
+    """Borra las entradas menos usadas (salvo 'conservar') hasta que el total quepa en el límite"""
+    total = conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM archivos").fetchone()[0]
+    if total <= limite:
+        return
+    for clave, nombre, tamano in conn.execute(
+        "SELECT clave, nombre, tamano FROM archivos ORDER BY usado_en"
+    ).fetchall():
+        if total <= limite:
+            break
+        if clave == conservar:
+            continue
+        try:
+            os.remove(_ruta(nombre))
+        except FileNotFoundError:
+            pass
+        conn.execute("DELETE FROM archivos WHERE clave = ?", (clave,))
+        total -= tamano
+
+
+# ==========================
+# LECTURA / ESCRITURA
+# ==========================
+def ruta_o_descargar(clave: str, descargar_en: Callable[[BinaryIO], object], limite: int = None) -> str:
+    """
+    Ruta en disco del contenido de la clave. Si no está en caché, descargar_en(f)
+    lo escribe por streaming en un archivo temporal que luego se incorpora a la
+    caché (rename atómico); el contenido nunca se carga entero en memoria.
+    Un archivo mayor que el límite se conserva hasta la siguiente incorporación.
+    """
+    limite = LIMITE_CACHE_BYTES if limite is None else limite
+    nombre = hashlib.sha1(clave.encode('utf-8')).hexdigest()
+    ruta = _ruta(nombre)
+
+    with _lock:
+        conn = _conectar()
+        try:
+            fila = conn.execute("SELECT nombre FROM archivos WHERE clave = ?", (clave,)).fetchone()
+            with conn:
+                if fila is not None and os.path.exists(_ruta(fila[0])):
+                    conn.execute("UPDATE archivos SET usado_en = ? WHERE clave = ?", (time.time(), clave))
+                    return _ruta(fila[0])
+                conn.execute("DELETE FROM archivos WHERE clave = ?", (clave,))
+        finally:
+            conn.close()
+
+    # La descarga se hace fuera del lock: otras consultas a la caché no esperan
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(ruta), suffix='.tmp', delete=False) as f:
+        temporal = f.name
+        try:
+            descargar_en(f)
+            tamano = f.tell()
+        except Exception:
+            f.close()
+            os.remove(temporal)
+            raise
+
+    with _lock:
+        os.replace(temporal, ruta)
+        conn = _conectar()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO archivos (clave, nombre, tamano, usado_en) VALUES (?, ?, ?, ?)",
+                    (clave, nombre, tamano, time.time())
+                )
+                _desalojar(conn, limite, conservar=clave)
+        finally:
+            conn.close()
+    return ruta
+
+
+def vaciar():
+    """Elimina todo el contenido de la caché de archivos"""
+    with _lock:
+        conn = _conectar()
+        try:
+            with conn:
+                _desalojar(conn, -1)
+        finally:
+            conn.close()
@@ -0,0 +1,13 @@
+# cache_local.py
+# Ubicación de los archivos de caché en disco (snapshots, índices, plantillas...)
+import os
+
+# Carpeta local de caché, junto al código de la app
+DIRECTORIO_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+
+def ruta_cache(*partes) -> str:
+    """Devuelve una ruta dentro de la caché local, creando las carpetas necesarias"""
+    ruta = os.path.join(DIRECTORIO_CACHE, *partes)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    return ruta
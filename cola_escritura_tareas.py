@@ -0,0 +1,187 @@
+# cola_escritura_tareas.py
+# Cola de escritura diferida (write-behind) para la hoja de asignación de tareas.
+# Altas y cambios de estado se anotan primero en un diario SQLite local (no se
+# pierden si la app se reinicia) y un hilo en segundo plano los envía agrupados:
+# un append_rows para todas las altas y un batch_update para todos los estados.
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from cache_local import ruta_cache
+
+# ==========================
+# CONFIG
+# ==========================
+ARCHIVO_COLA = "cola_tareas.sqlite"
+
+# Segundos entre vaciados de la cola
+INTERVALO_VACIADO = 10
+
+# Con esta cantidad de operaciones pendientes se vacía sin esperar el intervalo
+MAX_PENDIENTES = 50
+
+TIPO_CREACION = "crear"
+TIPO_ESTADO = "estado"
+
+_estado = {
+    "escribir": None,
+    "hilo": None,
+    "evento": threading.Event(),
+    "lock_vaciado": threading.RLock(),
+    "reintento": False,
+}
+_lock_inicio = threading.Lock()
+
+
+# ==========================
+# DIARIO
+# ==========================
+def _conectar() -> sqlite3.Connection:
+    conn = sqlite3.connect(ruta_cache(ARCHIVO_COLA), timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS pendientes ("
+        "seq INTEGER PRIMARY KEY AUTOINCREMENT, tipo TEXT NOT NULL, id_tarea TEXT NOT NULL, "
+        "datos TEXT NOT NULL, creado_en REAL NOT NULL)"
+    )
+    return conn
+
+
+def _anotar(operaciones: List[Tuple[str, str, object]]):
+    """Guarda las operaciones en el diario (confirmadas antes de volver)"""
+    conn = _conectar()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO pendientes (tipo, id_tarea, datos, creado_en) VALUES (?, ?, ?, ?)",
+                [(tipo, id_tarea, json.dumps(datos, ensure_ascii=False), time.time())
+                 for tipo, id_tarea, datos in operaciones]
+            )
+            total = conn.execute("SELECT COUNT(*) FROM pendientes").fetchone()[0]
+    finally:
+        conn.close()
+    if total >= MAX_PENDIENTES:
+        _estado["evento"].set()
+
+
+def _leer_diario() -> Tuple[int, Dict[str, Dict], Dict[str, str]]:
+    """
+    (último seq leído, altas {id: registro}, estados {id: estado}).
+    Los cambios de estado de una tarea aún no enviada se aplican a su alta.
+    """
+    conn = _conectar()
+    try:
+        filas = conn.execute("SELECT seq, tipo, id_tarea, datos FROM pendientes ORDER BY seq").fetchall()
+    finally:
+        conn.close()
+
+    ultimo, creaciones, estados = 0, {}, {}
+    for seq, tipo, id_tarea, datos in filas:
+        ultimo = seq
+        datos = json.loads(datos)
+        if tipo == TIPO_CREACION:
+            creaciones[id_tarea] = datos
+        elif id_tarea in creaciones:
+            creaciones[id_tarea]["Estado"] = datos
+        else:
+            estados[id_tarea] = datos
+    return ultimo, creaciones, estados
+
+
+# ==========================
+# API
+# ==========================
+def encolar_creacion(id_tarea: str, registro: Dict):
+    """Anota el alta de una tarea (registro: {columna: valor}, como get_all_records)"""
+    _anotar([(TIPO_CREACION, id_tarea, registro)])
+
+
+def encolar_estados(cambios: Dict[str, str]):
+    """Anota cambios de estado {ID_Tarea: estado}; el último de cada tarea es el que se escribe"""
+    _anotar([(TIPO_ESTADO, id_tarea, estado) for id_tarea, estado in cambios.items()])
+
+
+def pendientes() -> Tuple[List[Dict], Dict[str, str]]:
+    """(altas aún no enviadas, estados aún no enviados) para la vista optimista"""
+    _, creaciones, estados = _leer_diario()
+    return list(creaciones.values()), estados
+
+
+def cantidad_pendientes() -> int:
+    conn = _conectar()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM pendientes").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def vaciar() -> int:
+    """
+    Envía todo lo pendiente con la función registrada en iniciar().
+    Si falla, el diario queda intacto y se reintenta en el siguiente ciclo.
+    Devuelve la cantidad de tareas escritas (altas + estados).
+    """
+    escribir = _estado["escribir"]
+    if escribir is None:
+        return 0
+    with _estado["lock_vaciado"]:
+        ultimo, creaciones, estados = _leer_diario()
+        if not ultimo:
+            return 0
+        try:
+            escribir(list(creaciones.values()), estados, _estado["reintento"])
+        except Exception as e:
+            # Un envío fallido pudo haber llegado a la hoja: el siguiente intento lo verifica
+            _estado["reintento"] = True
+            print(f"Cola de tareas: no se pudo vaciar ({e}); se reintenta en {INTERVALO_VACIADO}s")
+            return 0
+        _estado["reintento"] = False
+
+        conn = _conectar()
+        try:
+            with conn:
+                conn.execute("DELETE FROM pendientes WHERE seq <= ?", (ultimo,))
+        finally:
+            conn.close()
+        return len(creaciones) + len(estados)
+
+
+@contextmanager
+def pausada():
+    """
+    Bloquea los vaciados mientras dura el bloque (p. ej. al mover filas de la
+    hoja, para que ningún cambio de estado se escriba en una fila desplazada).
+    Dentro del bloque se puede llamar a vaciar().
+    """
+    with _estado["lock_vaciado"]:
+        yield
+
+
+def _bucle():
+    while True:
+        _estado["evento"].wait(INTERVALO_VACIADO)
+        _estado["evento"].clear()
+        try:
+            vaciar()
+        except Exception as e:
+            print(f"Cola de tareas: error inesperado al vaciar: {e}")
+
+
+def iniciar(escribir: Callable[[List[Dict], Dict[str, str], bool], None]):
+    """
+    Registra la función que escribe en la hoja y arranca el hilo de vaciado
+    (una vez por proceso). escribir(altas, estados, reintento) debe lanzar una
+    excepción si no pudo escribir. Lo que quedó en el diario se envía enseguida,
+    como reintento: el proceso anterior pudo haber escrito en la hoja sin llegar
+    a borrar esas operaciones del diario, así que las altas se verifican por ID.
+    """
+    with _lock_inicio:
+        _estado["escribir"] = escribir
+        if _estado["hilo"] is None:
+            if cantidad_pendientes():
+                _estado["reintento"] = True
+            _estado["hilo"] = threading.Thread(target=_bucle, name="cola_tareas", daemon=True)
+            _estado["hilo"].start()
+            _estado["evento"].set()
@@ -1,8 +1,9 @@
 from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 from oauth2client.service_account import ServiceAccountCredentials
-import re
 import streamlit as st
+from drive_ejecutor import ejecutar_lote, listar_todos
+from indice_carpetas import carpetas_existentes, registrar_carpeta, siguiente_numero_indice
+from asignador_codigos import SECUENCIA_CARPETAS, reservar_codigos, siguiente_numero, sincronizar_secuencia, ver_siguiente_codigo
 
 # Autenticación con la API de Google Drive
 info = st.secrets["google_service_account"]
@@ -23,51 +24,95 @@ subcarpetas = [
     "Informes técnicos"
 ]
 
+def siguiente_numero_en_drive():
+    """Siguiente número según las carpetas EQU-XXXXXXX existentes (listado paginado completo)"""
+    query = f"'{QR_FOLDER_ID}' in parents and mimeType='application/vnd.google-apps.folder'"
+    carpetas = listar_todos(drive_service, query, fields='files(name)', operacion='listar_carpetas')
+    return siguiente_numero(f['name'] for f in carpetas)
+
 def obtener_ultimo_codigo():
-    """Obtener el último código de carpeta creado y generar el siguiente"""
+    """Obtener el siguiente código de carpeta (sin reservarlo)"""
     try:
-        query = f"'{QR_FOLDER_ID}' in parents and mimeType='application/vnd.google-apps.folder'"
-        results = drive_service.files().list(q=query, pageSize=1000).execute()
-        folders = results.get('files', [])
-
-        nombres_folders = [f['name'] for f in folders if re.match(r"EQU-\d{7}", f['name'])]
-        
-        if nombres_folders:
-            numeros = [int(re.sub(r"\D", "", name)) for name in nombres_folders]
-            siguiente_numero = max(numeros) + 1
-        else:
-            siguiente_numero = 1
-
-        return f"EQU-{siguiente_numero:07d}"
-    except HttpError as error:
+        return ver_siguiente_codigo(SECUENCIA_CARPETAS, siguiente_numero_en_drive)
+    except Exception as error:
         print(f"Hubo un error al obtener las carpetas: {error}")
         return None
 
-def crear_nueva_carpeta(nombre_carpeta):
-    """Crear una nueva carpeta en Google Drive"""
+def reservar_codigos_carpetas(cantidad=1):
+    """
+    Reservar códigos consecutivos para carpetas nuevas (no se entregan a nadie más).
+    Antes se adelanta la secuencia según el índice de carpetas (al día con la API
+    de cambios), así las carpetas creadas fuera de la app no repiten código.
+    """
+    try:
+        sincronizar_secuencia(SECUENCIA_CARPETAS, lambda: siguiente_numero_indice(drive_service))
+        return reservar_codigos(SECUENCIA_CARPETAS, cantidad, siguiente_numero_en_drive)
+    except Exception as error:
+        print(f"Hubo un error al reservar códigos de carpetas: {error}")
+        return []
+
+def _peticion_carpeta(nombre, padre_id):
+    """Fábrica de la petición que crea una carpeta (sin ejecutarla)"""
     file_metadata = {
-        'name': nombre_carpeta,
+        'name': nombre,
         'mimeType': 'application/vnd.google-apps.folder',
-        'parents': [QR_FOLDER_ID]
+        'parents': [padre_id]
     }
-    try:
-        carpeta = drive_service.files().create(body=file_metadata, fields='id').execute()
-        print(f"Carpeta principal creada: {nombre_carpeta}")
-        return carpeta.get('id')
-    except HttpError as error:
-        print(f"Hubo un error al crear la carpeta principal: {error}")
-        return None
+    return lambda: drive_service.files().create(body=file_metadata, fields='id')
+
+
+def _buscar_carpeta(nombre, padre_id):
+    """Carpeta 'nombre' dentro de padre_id ({'id': ...}) o None; verifica lotes sin respuesta"""
+    query = (f"name='{nombre}' and '{padre_id}' in parents "
+             f"and mimeType='application/vnd.google-apps.folder' and trashed=false")
+    carpetas = drive_service.files().list(q=query, fields='files(id)', pageSize=1).execute().get('files', [])
+    return carpetas[0] if carpetas else None
+
+
+def crear_carpetas_equipos(codigos):
+    """
+    Crea varias carpetas EQU-XXXXXXX con sus subcarpetas usando lotes HTTP:
+    un lote para las carpetas principales y otro(s) para todas las subcarpetas.
+    Devuelve {código: {'id': id, 'subcarpetas': {nombre: id}}} de las carpetas creadas.
+    Un código que ya tiene carpeta (creada fuera de la app) no se vuelve a crear.
+    """
+    repetidos = set(carpetas_existentes(codigos))
+    for codigo in repetidos:
+        print(f"La carpeta {codigo} ya existe en Drive; no se crea de nuevo")
+    codigos = [codigo for codigo in codigos if codigo not in repetidos]
+
+    principales = ejecutar_lote(
+        drive_service,
+        [(codigo, _peticion_carpeta(codigo, QR_FOLDER_ID)) for codigo in codigos],
+        'crear_carpetas',
+        verificar=lambda codigo: _buscar_carpeta(codigo, QR_FOLDER_ID)
+    )
+
+    creadas = {}
+    for codigo in codigos:
+        resultado = principales.get(codigo)
+        if isinstance(resultado, dict):
+            creadas[codigo] = {'id': resultado['id'], 'subcarpetas': {}}
+            print(f"Carpeta principal creada: {codigo}")
+        else:
+            print(f"Hubo un error al crear la carpeta principal {codigo}: {resultado}")
+
+    peticiones = [
+        ((codigo, subcarpeta), _peticion_carpeta(subcarpeta, datos['id']))
+        for codigo, datos in creadas.items()
+        for subcarpeta in subcarpetas
+    ]
+    resultados = ejecutar_lote(
+        drive_service, peticiones, 'crear_subcarpetas',
+        verificar=lambda clave: _buscar_carpeta(clave[1], creadas[clave[0]]['id'])
+    )
+    for (codigo, subcarpeta), resultado in resultados.items():
+        if isinstance(resultado, dict):
+            creadas[codigo]['subcarpetas'][subcarpeta] = resultado.get('id')
+        else:
+            print(f"Hubo un error al crear la subcarpeta {subcarpeta} de {codigo}: {resultado}")
 
-def crear_subcarpetas(carpeta_id):
-    """Crear las subcarpetas dentro de la carpeta principal creada"""
-    for subcarpeta in subcarpetas:
-        file_metadata = {
-            'name': subcarpeta,
-            'mimeType': 'application/vnd.google-apps.folder',
-            'parents': [carpeta_id]
-        }
-        try:
-            drive_service.files().create(body=file_metadata, fields='id').execute()
-            print(f"Subcarpeta creada: {subcarpeta}")
-        except HttpError as error:
-            print(f"Hubo un error al crear la subcarpeta: {error}")
+    # Las carpetas nuevas quedan resueltas en el índice sin esperar a la API de cambios
+    for codigo, datos in creadas.items():
+        registrar_carpeta(codigo, datos['id'], datos['subcarpetas'])
+    return creadas
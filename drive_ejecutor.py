@@ -0,0 +1,383 @@
+# drive_ejecutor.py
+# Ejecutor compartido para las llamadas de escritura a Google Drive:
+# reintentos con backoff exponencial + jitter ante límites de cuota y errores
+# del servidor, pool de hilos acotado, subidas reanudables para archivos
+# grandes y métricas de latencia por operación.
+import json
+import random
+import socket
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+import streamlit as st
+import pandas as pd
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+
+# ==========================
+# CONFIG
+# ==========================
+# Llamadas a Drive en paralelo como máximo, por pool (compartidos por todo el proceso).
+# Las lecturas interactivas (escáner, miniaturas) y los trabajos masivos (informes
+# por lote) usan pools separados: una campaña larga no deja en cola a un escaneo.
+MAX_HILOS_DRIVE = 4
+MAX_HILOS_LOTE = 4
+
+# Reintentos y espera exponencial (segundos): ESPERA_BASE * 2^intento + jitter
+MAX_REINTENTOS = 5
+ESPERA_BASE = 1.0
+ESPERA_MAXIMA = 32.0
+
+# Peticiones por lote HTTP (límite de Drive: 100)
+MAX_POR_LOTE = 100
+
+# A partir de este tamaño las subidas son reanudables y se envían por fragmentos
+UMBRAL_REANUDABLE = 5 * 1024 * 1024
+TAMANO_FRAGMENTO = 5 * 1024 * 1024  # múltiplo de 256 KB, como exige Drive
+
+# Tamaño de cada fragmento en las descargas (memoria usada por descarga en curso)
+TAMANO_FRAGMENTO_DESCARGA = 8 * 1024 * 1024
+
+# Errores que Drive recomienda reintentar
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+MOTIVOS_REINTENTABLES = {'rateLimitExceeded', 'userRateLimitExceeded', 'backendError', 'internalError'}
+
+# Latencias recientes que se guardan por operación para los percentiles
+MUESTRAS_LATENCIA = 500
+
+
+# ==========================
+# REINTENTOS
+# ==========================
+def _motivo_error(error: HttpError) -> str:
+    """Motivo ('reason') que Drive informa en el cuerpo del error"""
+    try:
+        contenido = json.loads(error.content.decode('utf-8'))
+        errores = contenido.get('error', {}).get('errors', [])
+        return errores[0].get('reason', '') if errores else ''
+    except Exception:
+        return ''
+
+
+def es_reintentable(error: Exception) -> bool:
+    """True para 429/5xx, 403 por límite de cuota y cortes de red transitorios"""
+    if isinstance(error, HttpError):
+        estado = error.resp.status
+        if estado in ESTADOS_REINTENTABLES:
+            return True
+        return estado == 403 and _motivo_error(error) in MOTIVOS_REINTENTABLES
+    return isinstance(error, (ConnectionError, socket.timeout, TimeoutError))
+
+
+def _sin_efecto(error: Exception) -> bool:
+    """
+    True si Drive rechazó la petición sin ejecutarla (429 o 403 por cuota).
+    Tras un 5xx o un corte de red la petición pudo haberse aplicado igual.
+    """
+    if not isinstance(error, HttpError):
+        return False
+    estado = error.resp.status
+    return estado == 429 or (estado == 403 and _motivo_error(error) in MOTIVOS_REINTENTABLES)
+
+
+def _espera(intento: int) -> float:
+    """Backoff exponencial con jitter completo"""
+    return random.uniform(0, min(ESPERA_MAXIMA, ESPERA_BASE * (2 ** intento)))
+
+
+def ejecutar(funcion: Callable, operacion: str = 'drive', verificar: Optional[Callable[[], Optional[Dict]]] = None):
+    """
+    Ejecuta funcion() reintentando los errores transitorios de Drive.
+    funcion debe construir y ejecutar la petición, p. ej.:
+        ejecutar(lambda: drive_service.files().create(...).execute(), 'crear_carpeta')
+    Para peticiones no idempotentes (crear), verificar() busca el resultado de
+    un intento que pudo haberse aplicado pese al error (5xx, timeout): si lo
+    encuentra se devuelve en lugar de repetir la petición.
+    Los errores no reintentables (o agotados los reintentos) se propagan.
+    """
+    intento = 0
+    while True:
+        inicio = time.perf_counter()
+        try:
+            resultado = funcion()
+        except Exception as e:
+            reintentar = es_reintentable(e) and intento < MAX_REINTENTOS
+            _registrar(operacion, time.perf_counter() - inicio, error=not reintentar, reintento=reintentar)
+            if not reintentar:
+                raise
+            espera = _espera(intento)
+            print(f"Drive [{operacion}] error transitorio ({e}); reintento {intento + 1} en {espera:.1f}s")
+            time.sleep(espera)
+            intento += 1
+            if verificar is not None and not _sin_efecto(e):
+                existente = ejecutar(verificar, f"{operacion}:verificar")
+                if existente is not None:
+                    return existente
+            continue
+        _registrar(operacion, time.perf_counter() - inicio)
+        return resultado
+
+
+def listar_todos(drive_service, q: str, fields: str = 'files(id,name)',
+                 operacion: str = 'listar', **kwargs) -> List[Dict]:
+    """Todos los archivos que cumplen la consulta, recorriendo nextPageToken"""
+    archivos, token = [], None
+    while True:
+        respuesta = ejecutar(lambda: drive_service.files().list(
+            q=q,
+            pageSize=1000,
+            pageToken=token,
+            fields=f"nextPageToken,{fields}",
+            **kwargs
+        ).execute(), operacion)
+        archivos.extend(respuesta.get('files', []))
+        token = respuesta.get('nextPageToken')
+        if not token:
+            return archivos
+
+
+# ==========================
+# PETICIONES POR LOTE (BATCH HTTP)
+# ==========================
+def ejecutar_lote(drive_service, peticiones: List, operacion: str = 'lote',
+                  verificar: Optional[Callable[[Hashable], Optional[Dict]]] = None) -> Dict:
+    """
+    Envía muchas peticiones pequeñas en lotes HTTP de hasta MAX_POR_LOTE.
+    peticiones: lista de (clave, fabrica) donde fabrica() construye la petición
+    sin ejecutarla, p. ej. lambda: drive_service.files().create(...).
+    Devuelve {clave: respuesta o excepción} con las mismas claves recibidas.
+    Nada se reenvía a ciegas (duplicaría lo ya creado):
+    - Las peticiones que Drive rechazó con un error transitorio propio no se
+      ejecutaron y se reintentan una a una con backoff.
+    - Si falló el envío del lote completo no se sabe cuáles llegaron a Drive:
+      verificar(clave) busca el elemento (p. ej. por nombre y carpeta padre) y
+      solo se vuelve a crear si no existe. Sin verificar, queda el error.
+    """
+    resultados: Dict = {}
+    sin_confirmar = []
+    fabricas = dict(peticiones)
+    # request_id debe ser texto: se usa la posición y se traduce a la clave original
+    claves = [clave for clave, _ in peticiones]
+
+    def callback(request_id, respuesta, error):
+        resultados[claves[int(request_id)]] = error if error is not None else respuesta
+
+    for i in range(0, len(peticiones), MAX_POR_LOTE):
+        lote = drive_service.new_batch_http_request(callback=callback)
+        for n, (_, fabrica) in enumerate(peticiones[i:i + MAX_POR_LOTE], start=i):
+            lote.add(fabrica(), request_id=str(n))
+        inicio = time.perf_counter()
+        try:
+            lote.execute()
+        except Exception as e:
+            print(f"Drive [{operacion}] error enviando el lote ({e}); se verifican las peticiones sin respuesta")
+            for clave in claves[i:i + MAX_POR_LOTE]:
+                if clave not in resultados:
+                    resultados[clave] = e
+                    sin_confirmar.append(clave)
+        _registrar(operacion, time.perf_counter() - inicio)
+
+    for clave, valor in list(resultados.items()):
+        if not isinstance(valor, Exception):
+            continue
+        if clave in sin_confirmar:
+            if verificar is None:
+                continue
+            try:
+                existente = ejecutar(lambda: verificar(clave), f"{operacion}:verificar")
+            except Exception as e:
+                resultados[clave] = e
+                continue
+            if existente is not None:
+                resultados[clave] = existente
+                continue
+        elif not (isinstance(valor, HttpError) and es_reintentable(valor)):
+            continue
+        try:
+            resultados[clave] = ejecutar(lambda: fabricas[clave]().execute(), f"{operacion}:reintento")
+        except Exception as e:
+            resultados[clave] = e
+    return resultados
+
+
+# ==========================
+# SUBIDAS
+# ==========================
+def _tamano(buffer) -> int:
+    """Tamaño en bytes de un buffer en memoria o archivo abierto"""
+    posicion = buffer.tell()
+    buffer.seek(0, 2)
+    tamano = buffer.tell()
+    buffer.seek(posicion)
+    return tamano
+
+
+def _buscar_creado(drive_service, metadata: Dict, fields: str) -> Callable[[], Optional[Dict]]:
+    """
+    Función que busca el archivo que una subida pudo haber creado pese al error:
+    mismo nombre y carpeta, creado después de este momento.
+    """
+    desde = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+    nombre = metadata.get('name', '').replace('\\', '\\\\').replace("'", "\\'")
+    q = f"name = '{nombre}' and createdTime > '{desde}' and trashed = false"
+    for padre in metadata.get('parents', [])[:1]:
+        q += f" and '{padre}' in parents"
+
+    def verificar():
+        archivos = drive_service.files().list(q=q, pageSize=1, fields=f"files({fields})").execute().get('files', [])
+        return archivos[0] if archivos else None
+    return verificar
+
+
+def subir_archivo(drive_service, metadata: Dict, buffer, mimetype: str,
+                  fields: str = 'id', operacion: str = 'subir_archivo') -> Dict:
+    """
+    Crea un archivo en Drive con su contenido.
+    - Hasta UMBRAL_REANUDABLE: una sola petición multipart. Antes de repetirla
+      tras un error que pudo haberla aplicado se busca el archivo ya creado.
+    - Más grande: subida reanudable por fragmentos; un fragmento fallido se
+      reintenta sin volver a enviar lo ya confirmado por Drive.
+    """
+    buffer.seek(0)
+    if _tamano(buffer) <= UMBRAL_REANUDABLE:
+        def crear():
+            media = MediaIoBaseUpload(buffer, mimetype=mimetype)
+            return drive_service.files().create(body=metadata, media_body=media, fields=fields).execute()
+        return ejecutar(crear, operacion, verificar=_buscar_creado(drive_service, metadata, fields))
+
+    media = MediaIoBaseUpload(buffer, mimetype=mimetype, chunksize=TAMANO_FRAGMENTO, resumable=True)
+    request = drive_service.files().create(body=metadata, media_body=media, fields=fields)
+    respuesta = None
+    while respuesta is None:
+        _, respuesta = ejecutar(request.next_chunk, f"{operacion}:fragmento")
+    return respuesta
+
+
+# ==========================
+# DESCARGAS
+# ==========================
+def descargar_en(request, destino, chunksize: int = None, operacion: str = 'descargar') -> int:
+    """
+    Descarga una petición get_media/export_media en el archivo 'destino'
+    fragmento a fragmento, sin acumular el contenido en memoria. Un fragmento
+    fallido se reintenta sin repetir lo ya descargado. Devuelve los bytes escritos.
+    """
+    downloader = MediaIoBaseDownload(destino, request, chunksize=chunksize or TAMANO_FRAGMENTO_DESCARGA)
+    done = False
+    while not done:
+        _, done = ejecutar(downloader.next_chunk, f"{operacion}:fragmento")
+    return destino.tell()
+
+
+# ==========================
+# POOL DE HILOS
+# ==========================
+POOL_INTERACTIVO = 'drive'
+POOL_LOTE = 'drive-lote'
+
+_pool_lock = threading.Lock()
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_servicios_hilo = threading.local()
+
+
+def _obtener_pool(nombre: str = POOL_INTERACTIVO) -> ThreadPoolExecutor:
+    with _pool_lock:
+        if nombre not in _pools:
+            hilos = MAX_HILOS_LOTE if nombre == POOL_LOTE else MAX_HILOS_DRIVE
+            _pools[nombre] = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix=nombre)
+        return _pools[nombre]
+
+
+def servicio_hilo(credenciales):
+    """
+    Servicio de Drive propio del hilo actual (los clientes HTTP de
+    googleapiclient no son seguros entre hilos).
+    """
+    servicios = getattr(_servicios_hilo, 'servicios', None)
+    if servicios is None:
+        servicios = _servicios_hilo.servicios = {}
+    clave = id(credenciales)
+    if clave not in servicios:
+        servicios[clave] = build('drive', 'v3', credentials=credenciales, cache_discovery=False)
+    return servicios[clave]
+
+
+def enviar(funcion: Callable, *args, **kwargs) -> Future:
+    """Encola funcion(*args, **kwargs) en el pool interactivo de Drive"""
+    return _obtener_pool(POOL_INTERACTIVO).submit(funcion, *args, **kwargs)
+
+
+def procesar_lote(funcion: Callable, trabajos: Iterable[Tuple], en_vuelo: int = MAX_HILOS_LOTE) -> Iterator[Tuple[Tuple, Future]]:
+    """
+    Ejecuta funcion(*trabajo) para cada trabajo en el pool de lotes, con como
+    máximo 'en_vuelo' tareas encoladas a la vez: varios lotes simultáneos se
+    reparten el pool en lugar de que el primero lo acapare.
+    Devuelve (trabajo, futuro terminado) a medida que terminan.
+    """
+    pool = _obtener_pool(POOL_LOTE)
+    pendientes: Dict[Future, Tuple] = {}
+    trabajos = iter(trabajos)
+    while True:
+        for trabajo in trabajos:
+            pendientes[pool.submit(funcion, *trabajo)] = trabajo
+            if len(pendientes) >= en_vuelo:
+                break
+        if not pendientes:
+            return
+        terminados, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+        for futuro in terminados:
+            yield pendientes.pop(futuro), futuro
+
+
+# ==========================
+# MÉTRICAS
+# ==========================
+_metricas_lock = threading.Lock()
+_metricas: Dict[str, Dict] = {}
+
+
+def _registrar(operacion: str, duracion: float, error: bool = False, reintento: bool = False):
+    """Acumula la latencia de un intento de llamada"""
+    with _metricas_lock:
+        m = _metricas.setdefault(operacion, {
+            'llamadas': 0, 'errores': 0, 'reintentos': 0,
+            'latencias': deque(maxlen=MUESTRAS_LATENCIA),
+        })
+        m['llamadas'] += 1
+        m['errores'] += int(error)
+        m['reintentos'] += int(reintento)
+        m['latencias'].append(duracion)
+
+
+def metricas_drive() -> pd.DataFrame:
+    """Resumen por operación: llamadas, errores, reintentos y latencias (ms)"""
+    with _metricas_lock:
+        copia = {op: dict(m, latencias=list(m['latencias'])) for op, m in _metricas.items()}
+
+    filas = []
+    for operacion, m in sorted(copia.items()):
+        latencias = pd.Series(m['latencias']) * 1000
+        filas.append({
+            'Operación': operacion,
+            'Llamadas': m['llamadas'],
+            'Errores': m['errores'],
+            'Reintentos': m['reintentos'],
+            'p50 (ms)': round(latencias.median(), 1),
+            'p95 (ms)': round(latencias.quantile(0.95), 1),
+            'Máx (ms)': round(latencias.max(), 1),
+        })
+    return pd.DataFrame(filas)
+
+
+def mostrar_metricas_drive():
+    """Tabla de métricas de Drive del proceso actual"""
+    df = metricas_drive()
+    if df.empty:
+        st.info("📝 Aún no hay llamadas a Drive registradas en este proceso")
+    else:
+        st.dataframe(df, use_container_width=True, hide_index=True)
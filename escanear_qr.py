@@ -1,22 +1,33 @@
 # escanear_qr.py
 from __future__ import annotations
-import io
+import hashlib
+import re
 from typing import List, Dict, Optional, Tuple
 
+import requests
 import streamlit as st
+from PIL import Image
+
+# Decodificador de QR de OpenCV (opencv-python-headless se instala solo con pip,
+# sin librerías del sistema)
+try:
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
 
 # Google Drive (Service Account)
 from oauth2client.service_account import ServiceAccountCredentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
 from googleapiclient.errors import HttpError
 
+from cache_archivos import clave_archivo, ruta_o_descargar
+from drive_ejecutor import descargar_en, enviar, listar_todos, servicio_hilo
+from indice_carpetas import PARENT_FOLDER_ID, obtener_carpeta, registrar_carpeta
+
 # ==========================
 # CONFIG
 # ==========================
-# ID de la carpeta "Equipos médicos"
-PARENT_FOLDER_ID = "1ziehslbMBQZ626dHDn5tJlOkCOVW9xYM"
-
 # Alcances de Drive
 SCOPES = ["https://www.googleapis.com/auth/drive"]
 
@@ -28,16 +39,43 @@ GOOGLE_EXPORT_MAP = {
     "application/vnd.google-apps.drawing": "application/pdf",      # Google Drawing
 }
 
+MIME_FOLDER = "application/vnd.google-apps.folder"
+
+# Metadatos que se piden al listar (incluye thumbnailLink para las fotos)
+FILE_FIELDS = (
+    "files(id,name,mimeType,size,md5Checksum,modifiedTime,"
+    "webViewLink,webContentLink,iconLink,thumbnailLink,shared)"
+)
+
+# Grupo de la vista con los archivos sueltos en la carpeta del equipo
+ROOT_GROUP = "Carpeta principal"
+
+# Lectura de QR con la cámara: primero un recorte central reducido (rápido),
+# luego el cuadro completo reducido y, como último recurso, a resolución completa
+CODE_PATTERN = re.compile(r"EQU-\d+")
+DECODE_CROP = 0.6
+DECODE_FAST_SIDE = 480
+DECODE_FULL_SIDE = 1024
+
+# Archivos más grandes que esto no pasan por la app: se abren en Drive si están
+# compartidos (los de la cuenta de servicio sin compartir no son accesibles)
+LIMITE_DESCARGA_APP = 64 * 1024 * 1024
+
 
 # ==========================
 # AUTH / SERVICE
 # ==========================
+@st.cache_resource(show_spinner=False)
+def build_credentials():
+    """Credenciales de Service Account almacenadas en st.secrets."""
+    info = st.secrets["google_service_account"]  # dict con la key JSON
+    return ServiceAccountCredentials.from_json_keyfile_dict(info, SCOPES)
+
+
 @st.cache_resource(show_spinner=False)
 def build_drive_service():
     """Construye el servicio de Drive usando credenciales de Service Account almacenadas en st.secrets."""
-    info = st.secrets["google_service_account"]  # dict con la key JSON
-    credentials = ServiceAccountCredentials.from_json_keyfile_dict(info, SCOPES)
-    service = build("drive", "v3", credentials=credentials, cache_discovery=False)
+    service = build("drive", "v3", credentials=build_credentials(), cache_discovery=False)
     return service
 
 
@@ -63,131 +101,301 @@ def find_folder_by_name(service, parent_id: str, name: str) -> Optional[str]:
 
 
 def list_files_in_folder(service, folder_id: str) -> List[Dict]:
-    """Lista archivos dentro del folder."""
-    res = service.files().list(
-        q=f"'{folder_id}' in parents and trashed = false",
-        fields="files(id,name,mimeType,size,webViewLink,webContentLink,iconLink)",
-        pageSize=1000,
+    """Lista archivos dentro del folder (todas las páginas)."""
+    return listar_todos(
+        service,
+        f"'{folder_id}' in parents and trashed = false",
+        fields=FILE_FIELDS,
+        operacion="listar_escaneo",
         supportsAllDrives=True,
         includeItemsFromAllDrives=True,
-    ).execute()
-    return res.get("files", [])
+    )
+
+
+def list_folders_parallel(credentials, folder_ids: Dict[str, str]) -> Dict[str, List[Dict]]:
+    """
+    Lista varias carpetas a la vez en el pool compartido de Drive
+    ({nombre: folder_id} -> {nombre: archivos}); cada hilo usa su propio servicio.
+    """
+    futures = {
+        name: enviar(lambda folder_id: list_files_in_folder(servicio_hilo(credentials), folder_id), folder_id)
+        for name, folder_id in folder_ids.items()
+    }
+    return {name: future.result() for name, future in futures.items()}
+
+
+def _download_thumbnail(credentials, f: Dict) -> str:
+    """Descarga la miniatura de Drive a la caché de archivos y devuelve su ruta local."""
+    def download(destino):
+        token = credentials.get_access_token().access_token
+        res = requests.get(f["thumbnailLink"], headers={"Authorization": f"Bearer {token}"}, timeout=15)
+        res.raise_for_status()
+        destino.write(res.content)
+
+    version = f.get("md5Checksum") or f.get("modifiedTime", "")
+    return ruta_o_descargar(clave_archivo(f["id"], version, "thumbnail"), download)
+
+
+def prefetch_thumbnails(credentials, files: List[Dict]) -> Dict[str, str]:
+    """Descarga en paralelo las miniaturas de las fotos ({file_id: ruta_local})."""
+    photos = [f for f in files if f.get("thumbnailLink") and f["mimeType"].startswith("image/")]
+    futures = {f["id"]: enviar(_download_thumbnail, credentials, f) for f in photos}
+    thumbnails = {}
+    for file_id, future in futures.items():
+        try:
+            thumbnails[file_id] = future.result()
+        except Exception as e:
+            print(f"No se pudo obtener la miniatura de {file_id}: {e}")
+    return thumbnails
 
 
-def download_file_bytes(service, file_id: str, mime_type: str, name_fallback: str) -> Tuple[bytes, str, str]:
+def download_file(service, file_id: str, mime_type: str, name_fallback: str,
+                  version: str) -> Tuple[str, str, str]:
     """
-    Devuelve (data_bytes, download_name, download_mime).
+    Devuelve (ruta_local, download_name, download_mime).
     - Si es Google Doc/Sheet/Slide/Drawing -> exporta a PDF.
     - Si es archivo normal -> descarga binario.
+    La descarga se escribe por fragmentos en la caché LRU en disco (clave con
+    version = md5Checksum o modifiedTime), sin acumular el archivo en memoria.
+    Nombre y MIME vienen del listado de la carpeta (no se vuelven a pedir a Drive).
     """
     # Nativos de Google: export
     if mime_type in GOOGLE_EXPORT_MAP:
         export_mime = GOOGLE_EXPORT_MAP[mime_type]
-        request = service.files().export(fileId=file_id, mimeType=export_mime)
-        buf = io.BytesIO()
-        downloader = MediaIoBaseDownload(buf, request)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        data = buf.getvalue()
+        request = lambda: service.files().export(fileId=file_id, mimeType=export_mime)
         download_name = name_fallback
         if export_mime == "application/pdf" and not download_name.lower().endswith(".pdf"):
             download_name = f"{download_name}.pdf"
-        return data, download_name, export_mime
+        download_mime = export_mime
+    else:
+        # Binarios normales: get_media
+        export_mime = ""
+        request = lambda: service.files().get_media(fileId=file_id)
+        download_name = name_fallback
+        download_mime = mime_type or "application/octet-stream"
 
-    # Binarios normales: get_media
-    request = service.files().get_media(fileId=file_id)
-    buf = io.BytesIO()
-    downloader = MediaIoBaseDownload(buf, request)
-    done = False
-    while not done:
-        _, done = downloader.next_chunk()
-    data = buf.getvalue()
+    ruta = ruta_o_descargar(
+        clave_archivo(file_id, version, export_mime),
+        lambda destino: descargar_en(request(), destino, operacion="descargar_escaneo"),
+    )
+    return ruta, download_name, download_mime
 
-    # Nombre/MIME reales
-    meta = service.files().get(fileId=file_id, fields="name,mimeType").execute()
-    return data, meta.get("name", name_fallback), meta.get("mimeType", "application/octet-stream")
 
+def resolve_folder(service, code: str) -> Tuple[str, Dict[str, str]]:
+    """(id de la carpeta, {subcarpeta: id}) del código: índice local; Drive solo si no está."""
+    carpeta = obtener_carpeta(service, code)
+    if carpeta:
+        return carpeta["id"], carpeta["subcarpetas"]
+    folder_id = find_folder_by_name(service, PARENT_FOLDER_ID, code)
+    if not folder_id:
+        raise ValueError(f"No se encontró la carpeta '{code}' dentro de Equipos médicos.")
+    registrar_carpeta(code, folder_id, {})
+    return folder_id, {}
 
-def get_files_for_code(service, code: str) -> List[Dict]:
-    """Busca la subcarpeta con ese código y devuelve sus archivos."""
+
+def get_device_record(service, credentials, code: str) -> List[Tuple[str, List[Dict]]]:
+    """
+    Ficha completa del equipo agrupada por subcarpeta: [(grupo, archivos), ...].
+    La carpeta principal y sus subcarpetas conocidas se listan a la vez; solo
+    las subcarpetas que el índice aún no tiene requieren una segunda tanda.
+    """
     if not code or not code.strip():
         raise ValueError("Código vacío.")
     code = code.strip()
 
-    folder_id = find_folder_by_name(service, PARENT_FOLDER_ID, code)
-    if not folder_id:
-        raise ValueError(f"No se encontró la carpeta '{code}' dentro de Equipos médicos.")
-    return list_files_in_folder(service, folder_id)
+    folder_id, subfolders = resolve_folder(service, code)
+    listings = list_folders_parallel(credentials, {ROOT_GROUP: folder_id, **subfolders})
+
+    root = listings.pop(ROOT_GROUP)
+    missing = {f["name"]: f["id"] for f in root if f["mimeType"] == MIME_FOLDER and f["name"] not in listings}
+    if missing:
+        listings.update(list_folders_parallel(credentials, missing))
+
+    root_files = [f for f in root if f["mimeType"] != MIME_FOLDER]
+    groups = [(ROOT_GROUP, root_files)] if root_files else []
+    return groups + sorted(listings.items())
+
+
+# ==========================
+# LECTURA DE QR (CÁMARA)
+# ==========================
+def _downscale(image: Image.Image, max_side: int) -> Image.Image:
+    if max(image.size) <= max_side:
+        return image
+    small = image.copy()
+    small.thumbnail((max_side, max_side))
+    return small
+
+
+def _center_crop(image: Image.Image, fraction: float) -> Image.Image:
+    width, height = image.size
+    dx, dy = int(width * (1 - fraction) / 2), int(height * (1 - fraction) / 2)
+    return image.crop((dx, dy, width - dx, height - dy))
+
+
+def _decode_code(image: Image.Image) -> Optional[str]:
+    """Primer código EQU- encontrado en los QR de la imagen."""
+    found, texts, _, _ = cv2.QRCodeDetector().detectAndDecodeMulti(np.asarray(image))
+    for text in (texts if found else ()):
+        match = CODE_PATTERN.search(text or "")
+        if match:
+            return match.group(0)
+    return None
+
+
+def decode_qr_code(image_file) -> Optional[str]:
+    """
+    Código EQU- leído de una foto de la cámara, o None.
+    El QR suele estar centrado: se prueba primero un recorte central pequeño
+    y solo si falla se decodifica el cuadro completo.
+    """
+    if cv2 is None:
+        return None
+    image = Image.open(image_file).convert("L")
+    attempts = (
+        lambda: _downscale(_center_crop(image, DECODE_CROP), DECODE_FAST_SIDE),
+        lambda: _downscale(image, DECODE_FULL_SIDE),
+        lambda: image,
+    )
+    for attempt in attempts:
+        code = _decode_code(attempt())
+        if code:
+            return code
+    return None
 
 
 # ==========================
 # UI STREAMLIT
 # ==========================
+def _render_file(service, f: Dict, thumbnails: Dict):
+    with st.container(border=True):
+        st.write(f"**{f['name']}**")
+        meta = f"{f['mimeType']}"
+        if f.get("size"):
+            meta += f" · {int(f['size']):,} bytes".replace(",", ".")
+        st.caption(meta)
+        if f["id"] in thumbnails:
+            st.image(thumbnails[f["id"]], width=200)
+
+        c1, c2 = st.columns(2)
+        with c1:
+            if f.get("webViewLink"):
+                st.link_button("Ver en Drive", f["webViewLink"], use_container_width=True)
+            else:
+                st.write(" ")
+
+        with c2:
+            # Solo mostrar botón de descarga si NO es una carpeta; los bytes
+            # se piden a Drive solo cuando el usuario elige el archivo
+            if f["mimeType"] == MIME_FOLDER:
+                st.caption("📂 Es una carpeta, no descargable")
+            elif int(f.get("size") or 0) > LIMITE_DESCARGA_APP:
+                if f.get("shared") and f.get("webViewLink"):
+                    st.link_button("Descargar desde Drive", f["webViewLink"], use_container_width=True)
+                else:
+                    st.caption("Archivo demasiado grande para la app y no compartido en Drive; solicita acceso a la carpeta.")
+            else:
+                # Solo el archivo elegido tiene botón de descarga: Streamlit lee su
+                # contenido en cada rerun, así que nunca se sirven varios a la vez
+                descarga = st.session_state.get("qr_descarga")
+                if descarga is None or descarga[0] != f["id"]:
+                    if st.button("Preparar descarga", key=f"preparar_{f['id']}", use_container_width=True):
+                        try:
+                            with st.spinner("Descargando..."):
+                                descarga = (f["id"],) + download_file(
+                                    service, f["id"], f["mimeType"], f["name"],
+                                    f.get("md5Checksum") or f.get("modifiedTime", "")
+                                )
+                            st.session_state.qr_descarga = descarga
+                        except HttpError as he:
+                            st.error(f"No se pudo descargar: {he}")
+                if descarga is not None and descarga[0] == f["id"]:
+                    _, ruta, dl_name, dl_mime = descarga
+                    try:
+                        with open(ruta, "rb") as data:
+                            st.download_button(
+                                "Descargar",
+                                data=data,
+                                file_name=dl_name,
+                                mime=dl_mime,
+                                key=f"descargar_{f['id']}",
+                                use_container_width=True,
+                            )
+                    except FileNotFoundError:
+                        # La caché desalojó el archivo: se vuelve a ofrecer la descarga
+                        del st.session_state.qr_descarga
+                        st.caption("La copia local expiró; vuelve a preparar la descarga.")
+
+
 def render_ui():
     st.set_page_config(page_title="Escanear QR – Equipos médicos", page_icon="./static/ICON.ico", layout="centered")
     st.title("Escaneo de QR – Equipos médicos")
     st.caption("Lee el código (p. ej. `EQU-000012`) y muestra/descarga los archivos de la carpeta correspondiente.")
 
     service = build_drive_service()
+    credentials = build_credentials()
+
+    # La foto se decodifica antes de crear el campo de texto para poder rellenarlo;
+    # cada foto nueva lanza la búsqueda directamente
+    leido_con_camara = False
+    if st.toggle("📷 Escanear con la cámara", key="qr_usar_camara"):
+        if cv2 is None:
+            st.info("La lectura con cámara no está disponible en este servidor (falta opencv-python-headless). Escribe el código.")
+        else:
+            frame = st.camera_input("Apunta la cámara al código QR del equipo")
+            if frame is not None:
+                frame_hash = hashlib.md5(frame.getvalue()).hexdigest()
+                if st.session_state.get("qr_ultimo_cuadro") != frame_hash:
+                    st.session_state.qr_ultimo_cuadro = frame_hash
+                    camera_code = decode_qr_code(frame)
+                    if camera_code:
+                        st.session_state.qr_codigo = camera_code
+                        leido_con_camara = True
+                    else:
+                        st.warning("No se encontró un código EQU- en la foto. Acerca la cámara y vuelve a intentar.")
 
-    code = st.text_input("Código leído", placeholder="EQU-000012")
+    code = st.text_input("Código leído", placeholder="EQU-000012", key="qr_codigo")
 
     colA, colB = st.columns([1, 2])
     with colA:
-        buscar = st.button("Buscar archivos", use_container_width=True)
+        buscar = st.button("Buscar archivos", use_container_width=True) or leido_con_camara
     with colB:
         st.write("")
 
+    # El listado (solo metadatos y miniaturas) se guarda en la sesión: los clics
+    # en "Preparar descarga" provocan un rerun y no deben volver a listar la carpeta
     if buscar and code:
         try:
             with st.spinner("Buscando carpeta y listando archivos..."):
-                files = get_files_for_code(service, code)
+                groups = get_device_record(service, credentials, code)
+                thumbnails = prefetch_thumbnails(credentials, [f for _, files in groups for f in files])
+            st.session_state.qr_listado = (code.strip(), groups, thumbnails)
+            st.session_state.pop("qr_descarga", None)
+        except ValueError as ve:
+            st.session_state.pop("qr_listado", None)
+            st.warning(str(ve))
+        except HttpError as he:
+            st.session_state.pop("qr_listado", None)
+            st.error(f"Error de Google Drive: {he}")
+        except Exception as e:
+            st.session_state.pop("qr_listado", None)
+            st.error(f"Ocurrió un error: {e}")
 
+    if "qr_listado" in st.session_state:
+        code, groups, thumbnails = st.session_state.qr_listado
+        try:
             st.subheader(f"Equipo: {code}")
-            if not files:
+            if not any(files for _, files in groups):
                 st.info("La carpeta existe pero no contiene archivos.")
                 return
 
-            for f in files:
-                with st.container(border=True):
-                    st.write(f"**{f['name']}**")
-                    meta = f"{f['mimeType']}"
-                    if f.get("size"):
-                        meta += f" · {int(f['size']):,} bytes".replace(",", ".")
-                    st.caption(meta)
-
-                    c1, c2 = st.columns(2)
-                    with c1:
-                        if f.get("webViewLink"):
-                            st.link_button("Ver en Drive", f["webViewLink"], use_container_width=True)
-                        else:
-                            st.write(" ")
-
-                    with c2:
-                        # Solo mostrar botón de descarga si NO es una carpeta
-                        if f["mimeType"] != "application/vnd.google-apps.folder":
-                            try:
-                                data, dl_name, dl_mime = download_file_bytes(
-                                    service, f["id"], f["mimeType"], f["name"]
-                                )
-                                st.download_button(
-                                    "Descargar",
-                                    data=data,
-                                    file_name=dl_name,
-                                    mime=dl_mime,
-                                    use_container_width=True,
-                                )
-                            except HttpError as he:
-                                st.error(f"No se pudo descargar: {he}")
-                        else:
-                            st.caption("📂 Es una carpeta, no descargable")
-                st.divider()
+            for name, files in groups:
+                with st.expander(f"📂 {name} ({len(files)})", expanded=(name == ROOT_GROUP)):
+                    if not files:
+                        st.caption("Sin archivos.")
+                    for f in files:
+                        _render_file(service, f, thumbnails)
 
-        except ValueError as ve:
-            st.warning(str(ve))
-        except HttpError as he:
-            st.error(f"Error de Google Drive: {he}")
         except Exception as e:
             st.error(f"Ocurrió un error: {e}")
 
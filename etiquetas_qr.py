@@ -0,0 +1,97 @@
+# etiquetas_qr.py
+# Hojas A4 de etiquetas QR listas para imprimir (PDF con reportlab).
+# Cada QR se dibuja como vector: un solo trazado por código con un rectángulo
+# por tramo horizontal de módulos oscuros, sin generar ni incrustar PNGs.
+from io import BytesIO
+from typing import Iterable, List, Tuple
+
+import qrcode
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+# ==========================
+# CONFIG
+# ==========================
+# Etiquetas por hoja: COLUMNAS x FILAS
+COLUMNAS = 4
+FILAS = 6
+
+MARGEN = 10 * mm
+ALTO_TEXTO = 7 * mm
+RELLENO = 3 * mm
+FUENTE_TEXTO = "Helvetica-Bold"
+TAMANO_TEXTO = 9
+
+
+# ==========================
+# QR
+# ==========================
+def matriz_qr(contenido: str) -> List[List[bool]]:
+    """Módulos del QR (True = oscuro), con la zona de silencio incluida"""
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=4)
+    qr.add_data(contenido)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def _dibujar_matriz(c: canvas.Canvas, matriz: List[List[bool]], x: float, y: float, lado: float):
+    """Dibuja la matriz en un cuadrado de 'lado' con esquina inferior izquierda en (x, y)"""
+    modulo = lado / len(matriz)
+    trazado = c.beginPath()
+    for i, fila in enumerate(matriz):
+        y_fila = y + lado - (i + 1) * modulo
+        j = 0
+        while j < len(fila):
+            if not fila[j]:
+                j += 1
+                continue
+            inicio = j
+            while j < len(fila) and fila[j]:
+                j += 1
+            trazado.rect(x + inicio * modulo, y_fila, (j - inicio) * modulo, modulo)
+    c.drawPath(trazado, stroke=0, fill=1)
+
+
+# ==========================
+# HOJAS
+# ==========================
+def hoja_etiquetas_pdf(etiquetas: Iterable[Tuple[str, str]]) -> BytesIO:
+    """
+    PDF A4 con una etiqueta por cada (texto, contenido del QR): el QR centrado
+    y el texto debajo, con guías de corte. Devuelve el buffer en la posición 0.
+    """
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    ancho_pagina, alto_pagina = A4
+    ancho = (ancho_pagina - 2 * MARGEN) / COLUMNAS
+    alto = (alto_pagina - 2 * MARGEN) / FILAS
+    lado = min(ancho, alto - ALTO_TEXTO) - 2 * RELLENO
+    por_hoja = COLUMNAS * FILAS
+
+    for n, (texto, contenido) in enumerate(etiquetas):
+        if n and n % por_hoja == 0:
+            c.showPage()
+        columna, fila = n % COLUMNAS, (n % por_hoja) // COLUMNAS
+        x = MARGEN + columna * ancho
+        y = alto_pagina - MARGEN - (fila + 1) * alto
+
+        # Guía de corte
+        c.setStrokeColorRGB(0.8, 0.8, 0.8)
+        c.setLineWidth(0.3)
+        c.setDash(2, 2)
+        c.rect(x, y, ancho, alto, stroke=1, fill=0)
+
+        c.setFillColorRGB(0, 0, 0)
+        _dibujar_matriz(
+            c, matriz_qr(contenido),
+            x + (ancho - lado) / 2,
+            y + ALTO_TEXTO + (alto - ALTO_TEXTO - lado) / 2,
+            lado
+        )
+        c.setFont(FUENTE_TEXTO, TAMANO_TEXTO)
+        c.drawCentredString(x + ancho / 2, y + RELLENO, texto)
+
+    c.save()
+    buffer.seek(0)
+    return buffer
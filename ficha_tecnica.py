@@ -3,11 +3,11 @@ import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime, time
-import openpyxl
-from openpyxl.styles import Font
-import io
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+from indice_equipos import obtener_indice_equipos, selector_equipo
+from motor_informes import generar_informe, inspeccionar_plantilla
+from indice_carpetas import PADRES_POR_CONSULTA, carpeta_destino, subcarpetas_con_nombre
+from drive_ejecutor import listar_todos
 
 # Configurar Google Drive API
 @st.cache_resource
@@ -23,189 +23,70 @@ def configurar_drive_api():
     return drive_service
 
 
-# Función para escribir en celdas de forma segura
-def escribir_celda_segura(ws, celda, valor, fuente=None):
-    """Escribe en una celda manejando celdas fusionadas"""
-    try:
-        # Verificar si la celda está fusionada
-        cell = ws[celda]
-        if hasattr(cell, 'coordinate'):
-            # Buscar si esta celda es parte de un rango fusionado
-            for merged_range in ws.merged_cells.ranges:
-                if cell.coordinate in merged_range:
-                    # Es una celda fusionada, usar la celda superior izquierda
-                    top_left = merged_range.start_cell
-                    top_left.value = valor
-                    if fuente:
-                        top_left.font = fuente
-                    return
-        
-        # No está fusionada, escribir normalmente
-        cell.value = valor
-        if fuente:
-            cell.font = fuente
-            
-    except Exception as e:
-        st.warning(f"No se pudo escribir en la celda {celda}: {e}")
+# Celdas de la plantilla de ficha técnica (campo del formulario -> celda)
+MAPA_CELDAS_FICHA = {
+    # Características generales del bien
+    'unidad_medida': "M2",
+    'denominacion_bien': "F6",
+    'denominacion_tecnica': "F7",
+    'descripcion_general': "F8",
+
+    # Características específicas - Sección 1: Generales
+    'tipo': "F27",
+    'indicador_presion_negativa': "F28",
+    'tipo_sistema_bomba': "F29",
+    'control_equipo': "F30",
+    'regulador_presion': "F31",
+    'peso_equipo': "F32",
+
+    # Sección 2: Componentes - Bomba de vacío
+    'nivel_ruido': "F35",
+    'capacidad_aspiracion': "F36",
+    'presion_negativa_maxima': "F37",
+
+    # Frasco recolector
+    'cantidad_frascos': "F39",
+    'capacidad_frasco': "F40",
+    'material_frasco': "F41",
+    'proceso_eliminacion': "F42",
+    'dispositivo_seguridad': "F43",
+    'escala_medida': "F44",
+
+    # Conductores auxiliares
+    'conexion_bomba_frasco': "F46",
+    'tipo_uso': "F47",
+
+    # Requerimiento de energía
+    'voltaje': "F49",
+    'frecuencia': "F50",
+
+    # Cumplimiento normativo
+    'certificacion': "F52",
+    'normativa': "F53",
+}
+
+CELDAS_CALCULADAS_FICHA = [
+    # Firma del responsable (opcional)
+    ("J61", lambda datos: f"Ing. {datos['responsable']}" if 'responsable' in datos else None),
+]
+
 
 # Función para crear ficha técnica para dispositivos médicos
 def crear_ficha_tecnica(drive_service, plantilla_id, carpeta_destino_id, datos_formulario):
     """Crea copia de plantilla de ficha técnica, llena datos y sube archivo final a Drive"""
     try:
-        # 1. Crear copia de la plantilla
         nombre_copia = f"Ficha_Tecnica_{datos_formulario['denominacion_bien']}_{datos_formulario['codigo_equipo']}"
-        copy_metadata = {
-            'name': nombre_copia,
-            'parents': [carpeta_destino_id]
-        }
-        
-        copia = drive_service.files().copy(
-            fileId=plantilla_id,
-            body=copy_metadata,
-            fields='id,name,webViewLink'
-        ).execute()
-        
-        copia_id = copia['id']
-        
-        # 2. Descargar la copia para editar
-        file_metadata = drive_service.files().get(fileId=copia_id, fields='mimeType').execute()
-        mime_type = file_metadata.get('mimeType')
-        
-        if mime_type == 'application/vnd.google-apps.spreadsheet':
-            request = drive_service.files().export_media(
-                fileId=copia_id,
-                mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        else:
-            request = drive_service.files().get_media(fileId=copia_id)
-        
-        file_io = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_io, request)
-        
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-        
-        file_io.seek(0)
-        
-        # 3. Editar el archivo Excel con los datos
-        wb = openpyxl.load_workbook(file_io)
-        ws = wb.active
-        fuente = Font(name="Albert Sans", size=8)
-
-        # Características generales del bien
-        escribir_celda_segura(ws, "M2", datos_formulario['unidad_medida'], fuente)
-        escribir_celda_segura(ws, "F6", datos_formulario['denominacion_bien'], fuente)
-        escribir_celda_segura(ws, "F7", datos_formulario['denominacion_tecnica'], fuente)
-        escribir_celda_segura(ws, "F8", datos_formulario['descripcion_general'], fuente)
-        
-        
-        # Características específicas - Sección 1: Generales
-        escribir_celda_segura(ws, "F27", datos_formulario.get('tipo', ''), fuente)
-        escribir_celda_segura(ws, "F28", datos_formulario.get('indicador_presion_negativa', ''), fuente)
-        escribir_celda_segura(ws, "F29", datos_formulario.get('tipo_sistema_bomba', ''), fuente)
-        escribir_celda_segura(ws, "F30", datos_formulario.get('control_equipo', ''), fuente)
-        escribir_celda_segura(ws, "F31", datos_formulario.get('regulador_presion', ''), fuente)
-        escribir_celda_segura(ws, "F32", datos_formulario.get('peso_equipo', ''), fuente)
-        
-        # Sección 2: Componentes - Bomba de vacío
-        escribir_celda_segura(ws, "F35", datos_formulario.get('nivel_ruido', ''), fuente)
-        escribir_celda_segura(ws, "F36", datos_formulario.get('capacidad_aspiracion', ''), fuente)
-        escribir_celda_segura(ws, "F37", datos_formulario.get('presion_negativa_maxima', ''), fuente)
-        
-        # Frasco recolector
-        escribir_celda_segura(ws, "F39", datos_formulario.get('cantidad_frascos', ''), fuente)
-        escribir_celda_segura(ws, "F40", datos_formulario.get('capacidad_frasco', ''), fuente)
-        escribir_celda_segura(ws, "F41", datos_formulario.get('material_frasco', ''), fuente)
-        escribir_celda_segura(ws, "F42", datos_formulario.get('proceso_eliminacion', ''), fuente)
-        escribir_celda_segura(ws, "F43", datos_formulario.get('dispositivo_seguridad', ''), fuente)
-        escribir_celda_segura(ws, "F44", datos_formulario.get('escala_medida', ''), fuente)
-        
-        # Conductores auxiliares
-        escribir_celda_segura(ws, "F46", datos_formulario.get('conexion_bomba_frasco', ''), fuente)
-        escribir_celda_segura(ws, "F47", datos_formulario.get('tipo_uso', ''), fuente)
-        
-        # Requerimiento de energía
-        escribir_celda_segura(ws, "F49", datos_formulario.get('voltaje', ''), fuente)
-        escribir_celda_segura(ws, "F50", datos_formulario.get('frecuencia', ''), fuente)
-        
-        # Cumplimiento normativo
-        escribir_celda_segura(ws, "F52", datos_formulario.get('certificacion', ''), fuente)
-        escribir_celda_segura(ws, "F53", datos_formulario.get('normativa', ''), fuente)
-        
-        # Firma del responsable (opcional)
-        if 'responsable' in datos_formulario:
-            escribir_celda_segura(ws, "J61", f"Ing. {datos_formulario['responsable']}", fuente)
-        
-        # 4. Guardar archivo editado
-        archivo_editado = io.BytesIO()
-        wb.save(archivo_editado)
-        archivo_editado.seek(0)
-        
-        # 5. Actualizar archivo en Drive
-        media = MediaIoBaseUpload(
-            archivo_editado,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return generar_informe(
+            drive_service, plantilla_id, carpeta_destino_id, nombre_copia, datos_formulario,
+            mapa_celdas=MAPA_CELDAS_FICHA,
+            celdas_calculadas=CELDAS_CALCULADAS_FICHA,
         )
-        
-        resultado_final = drive_service.files().update(
-            fileId=copia_id,
-            media_body=media,
-            fields='id,name,webViewLink'
-        ).execute()
-        
-        return resultado_final, archivo_editado
-        
+
     except Exception as e:
         st.error(f"Error creando ficha técnica: {e}")
         import traceback
         st.error(f"Detalles del error: {traceback.format_exc()}")
         return None, None
-    
-
-# Función alternativa para debugging - inspeccionar celdas fusionadas
-def inspeccionar_plantilla(drive_service, plantilla_id):
-    """Función para inspeccionar qué celdas están fusionadas en la plantilla"""
-    try:
-        # Crear copia temporal
-        copy_metadata = {'name': 'temp_inspection'}
-        copia = drive_service.files().copy(fileId=plantilla_id, body=copy_metadata).execute()
-        copia_id = copia['id']
-        
-        # Descargar
-        request = drive_service.files().get_media(fileId=copia_id)
-        file_io = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_io, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        file_io.seek(0)
-        
-        # Inspeccionar
-        wb = openpyxl.load_workbook(file_io)
-        ws = wb.active
-        
-        st.write("### 🔍 Celdas fusionadas encontradas:")
-        for merged_range in ws.merged_cells.ranges:
-            st.write(f"- Rango fusionado: {merged_range}")
-            
-        # Eliminar copia temporal
-        drive_service.files().delete(fileId=copia_id).execute()
-        
-    except Exception as e:
-        st.error(f"Error inspeccionando plantilla: {e}")
-
-# Cargar datos desde Google Sheets
-@st.cache_data
-def cargar_datos():
-    info = st.secrets["google_service_account"]
-    scope = ['https://www.googleapis.com/auth/spreadsheets',
-             'https://www.googleapis.com/auth/drive']
-    credenciales = ServiceAccountCredentials.from_json_keyfile_dict(info, scope)
-    cliente = gspread.authorize(credenciales)
-    hoja = cliente.open("Base de datos").sheet1
-    datos = hoja.get_all_records()
-    return pd.DataFrame(datos)
 
 
 # Función principal para el módulo de fichas técnicas
@@ -232,8 +113,8 @@ def mostrar_fichas_tecnicas():
         if st.button("Inspeccionar celdas fusionadas"):
             inspeccionar_plantilla(drive_service, PLANTILLA_ID)
 
-    # Cargar base de datos
-    df = cargar_datos()
+    # Índice del inventario compartido
+    indice = obtener_indice_equipos()
 
     # Opciones de modo: Crear nueva ficha o consultar existentes
     modo = st.radio(
@@ -246,86 +127,14 @@ def mostrar_fichas_tecnicas():
         # ============== SELECTOR DE EQUIPOS ==============
         st.markdown("### 🔍 Selección de Equipo")
         
-        equipos = []
-        for _, row in df.iterrows():
-            equipo = {
-                'codigo_nuevo': row.get('Codigo nuevo', ''),
-                'equipo': row.get('EQUIPO', ''),
-                'marca': row.get('MARCA', ''),
-                'modelo': row.get('MODELO', ''),
-                'serie': row.get('SERIE', ''),
-                'area': row.get('AREA', ''),
-                'ubicacion': row.get('UBICACION', ''),
-            }
-            equipos.append(equipo)
-
-        metodo_seleccion = st.radio(
-            "¿Cómo deseas seleccionar el equipo?",
-            ["🔍 Selector inteligente", "⌨️ Código manual"],
-            horizontal=True
-        )
-
-        marca = modelo = equipo_nombre = serie = codigo_equipo = ""
-        area_equipo = ubicacion_equipo = ""
-
-        if metodo_seleccion == "🔍 Selector inteligente":
-            areas_disponibles = sorted(list(set([eq['area'] for eq in equipos if eq['area']])))
-            area_filtro = st.selectbox("🏢 Filtrar por Área", ["Todas"] + areas_disponibles)
-            
-            equipos_filtrados = equipos
-            if area_filtro != "Todas":
-                equipos_filtrados = [eq for eq in equipos if eq['area'] == area_filtro]
-            
-            if equipos_filtrados:
-                opciones_equipos = []
-                for eq in equipos_filtrados:
-                    opcion = f"{eq['codigo_nuevo']} - {eq['equipo']}"
-                    if eq['area']:
-                        opcion += f" ({eq['area']})"
-                    if eq['ubicacion']:
-                        opcion += f" - {eq['ubicacion']}"
-                    opciones_equipos.append(opcion)
-                
-                equipo_seleccionado = st.selectbox("🔧 Seleccionar Equipo", opciones_equipos)
-                indice_equipo = opciones_equipos.index(equipo_seleccionado)
-                equipo_data = equipos_filtrados[indice_equipo]
-                
-                codigo_equipo = equipo_data['codigo_nuevo']
-                equipo_nombre = equipo_data['equipo']
-                marca = equipo_data['marca']
-                modelo = equipo_data['modelo']
-                serie = equipo_data['serie']
-                area_equipo = equipo_data['area']
-                ubicacion_equipo = equipo_data['ubicacion']
-                
-                with st.expander("🔍 Detalles del Equipo Seleccionado", expanded=True):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.write(f"**🏷️ Código:** {codigo_equipo}")
-                        st.write(f"**⚙️ Equipo:** {equipo_nombre}")
-                        st.write(f"**🏭 Marca:** {marca}")
-                    with col2:
-                        st.write(f"**📱 Modelo:** {modelo}")
-                        st.write(f"**🔢 Serie:** {serie}")
-                        st.write(f"**📍 Área:** {area_equipo}")
-            else:
-                st.warning("⚠️ No se encontraron equipos para el área seleccionada")
-        
-        else:  # Código manual
-            codigo_input = st.text_input("🔍 Ingrese el código del equipo (Ej: EQU-0000001)")
-            equipo_info = df[df["Codigo nuevo"] == codigo_input]
-            
-            if not equipo_info.empty:
-                equipo_row = equipo_info.iloc[0]
-                codigo_equipo = codigo_input
-                marca = equipo_row["MARCA"]
-                modelo = equipo_row["MODELO"]
-                equipo_nombre = equipo_row["EQUIPO"]
-                serie = equipo_row["SERIE"]
-                area_equipo = equipo_row.get("AREA", "")
-                ubicacion_equipo = equipo_row.get("UBICACION", "")
-                
-                st.success(f"✅ **Equipo encontrado:** {equipo_nombre}")
+        equipo_data = selector_equipo(indice) or {}
+        codigo_equipo = equipo_data.get('codigo_nuevo', '')
+        equipo_nombre = equipo_data.get('equipo', '')
+        marca = equipo_data.get('marca', '')
+        modelo = equipo_data.get('modelo', '')
+        serie = equipo_data.get('serie', '')
+        area_equipo = equipo_data.get('area', '')
+        ubicacion_equipo = equipo_data.get('ubicacion', '')
 
         # ============== FORMULARIO DE FICHA TÉCNICA ==============
         with st.form("formulario_ficha_tecnica"):
@@ -468,7 +277,7 @@ def mostrar_fichas_tecnicas():
                 resultado_final, archivo_editado = crear_ficha_tecnica(
                     drive_service, 
                     PLANTILLA_ID, 
-                    CARPETA_INFORMES_ID, 
+                    carpeta_destino(drive_service, codigo_equipo, "Ficha técnica", CARPETA_INFORMES_ID), 
                     datos_formulario
                 )
                 
@@ -510,14 +319,17 @@ def mostrar_fichas_tecnicas():
         
         # Buscar fichas técnicas en la carpeta
         try:
-            query = f"parents='{CARPETA_INFORMES_ID}' and name contains 'Ficha_Tecnica' and trashed=false"
-            response = drive_service.files().list(
-                q=query,
-                spaces='drive',
-                fields='files(id, name, webViewLink, createdTime)'
-            ).execute()
-            
-            fichas = response.get('files', [])
+            # Las fichas están en la carpeta común o en la subcarpeta "Ficha técnica" de cada equipo
+            carpetas = [CARPETA_INFORMES_ID] + subcarpetas_con_nombre(drive_service, "Ficha técnica")
+            fichas = []
+            for i in range(0, len(carpetas), PADRES_POR_CONSULTA):
+                padres = " or ".join(f"'{carpeta_id}' in parents" for carpeta_id in carpetas[i:i + PADRES_POR_CONSULTA])
+                fichas += listar_todos(
+                    drive_service,
+                    f"({padres}) and name contains 'Ficha_Tecnica' and trashed=false",
+                    fields='files(id, name, webViewLink, createdTime)',
+                    operacion='listar_fichas'
+                )
             
             if fichas:
                 st.success(f"✅ Se encontraron {len(fichas)} fichas técnicas")
@@ -1,13 +1,17 @@
 import streamlit as st
 import os
+import re
 import qrcode
+from functools import lru_cache
 from io import BytesIO
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
 from oauth2client.service_account import ServiceAccountCredentials
 import gspread
 from datetime import datetime
 import pandas as pd
+from drive_ejecutor import listar_todos, mostrar_metricas_drive, subir_archivo
+from asignador_codigos import SECUENCIA_QR, formatear_codigo, reservar_codigos, siguiente_numero, sincronizar_secuencia, ver_siguiente_codigo
+from etiquetas_qr import COLUMNAS, FILAS, hoja_etiquetas_pdf
 
 # Configuración de servicios
 info = st.secrets["google_service_account"]
@@ -21,35 +25,72 @@ drive_service = build('drive', 'v3', credentials=credenciales)
 
 QR_FOLDER_ID = st.secrets["google_drive"]["qr_folder_id"]
 
+# URL del escáner que se puede incluir en el QR
+URL_ESCANER = "https://cmch-ic2.streamlit.app/scanner?equipo={codigo}"
+
+# Segundos que se reutiliza el listado de QRs existentes
+TTL_LISTADO_QRS = 300
+
+# Etiquetas por PDF en el modo por lote
+MAX_ETIQUETAS = 1000
+PATRON_CODIGO_QR = re.compile(r"EQU-\d+")
+
+def siguiente_numero_qr_en_drive():
+    """Siguiente número según los PNG EQU-XXXXXXX de la carpeta (listado paginado completo)"""
+    query = f"'{QR_FOLDER_ID}' in parents and mimeType='image/png'"
+    archivos = listar_todos(drive_service, query, fields='files(name)', operacion='listar_qrs')
+    return siguiente_numero(f['name'] for f in archivos)
+
 def obtener_siguiente_codigo():
-    """Obtener el siguiente código secuencial"""
+    """Obtener el siguiente código secuencial (sin reservarlo)"""
     try:
-        query = f"'{QR_FOLDER_ID}' in parents and mimeType='image/png'"
-        results = drive_service.files().list(q=query, pageSize=1000).execute()
-        archivos = results.get('files', [])
-        
-        codigos = [f['name'].replace(".png", "") for f in archivos if f['name'].startswith("EQU-")]
-        if codigos:
-            ultimo = max(codigos)
-            siguiente_numero = int(ultimo.split("-")[1]) + 1
-        else:
-            siguiente_numero = 1
-            
-        return f"EQU-{siguiente_numero:07d}"
+        return ver_siguiente_codigo(SECUENCIA_QR, siguiente_numero_qr_en_drive)
     except Exception as e:
         st.error(f"Error obteniendo siguiente código: {e}")
         return f"EQU-{datetime.now().strftime('%Y%m%d%H%M%S')}"
 
-def crear_qr_simple(codigo):
-    """Crear QR simple con solo el código"""
-    img = qrcode.make(codigo)
+def reservar_codigos_qr(cantidad=1):
+    """Reservar 'cantidad' códigos consecutivos; dos usuarios nunca reciben el mismo"""
+    try:
+        return reservar_codigos(SECUENCIA_QR, cantidad, siguiente_numero_qr_en_drive)
+    except Exception as e:
+        st.error(f"Error reservando códigos: {e}")
+        return []
+
+def reservar_codigo_qr():
+    """Reservar el siguiente código"""
+    codigos = reservar_codigos_qr(1)
+    return codigos[0] if codigos else None
+
+@lru_cache(maxsize=512)
+def renderizar_qr_png(contenido, box_size=10, border=4,
+                      error_correction=qrcode.constants.ERROR_CORRECT_M,
+                      fill_color="black", back_color="white"):
+    """
+    PNG de un QR. El resultado depende solo del contenido y el estilo, así que
+    se memoriza en el proceso: reimprimir un código no vuelve a renderizarlo
+    ni lo descarga de Drive.
+    """
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=error_correction,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(contenido)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color=fill_color, back_color=back_color)
     buffer = BytesIO()
     img.save(buffer, format='PNG')
-    buffer.seek(0)
-    return buffer
+    return buffer.getvalue()
 
-def crear_qr_avanzado(codigo, datos_adicionales=None):
-    """Crear QR con información adicional"""
+def crear_qr_simple(codigo):
+    """Crear QR simple con solo el código"""
+    return BytesIO(renderizar_qr_png(codigo))
+
+def contenido_qr_avanzado(codigo, datos_adicionales=None):
+    """Texto que se codifica en un QR avanzado"""
     # Datos básicos
     qr_data = f"CÓDIGO: {codigo}"
     
@@ -61,22 +102,11 @@ def crear_qr_avanzado(codigo, datos_adicionales=None):
             qr_data += f"\nUBICACIÓN: {datos_adicionales['ubicacion']}"
         if datos_adicionales.get('url'):
             qr_data += f"\nURL: {datos_adicionales['url']}"
-    
-    # Crear QR con configuración personalizada
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_M,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    return buffer
+    return qr_data
+
+def crear_qr_avanzado(codigo, datos_adicionales=None):
+    """Crear QR con información adicional"""
+    return BytesIO(renderizar_qr_png(contenido_qr_avanzado(codigo, datos_adicionales)))
 
 def subir_qr_a_drive(buffer, codigo):
     """Subir QR generado a Google Drive"""
@@ -86,28 +116,115 @@ def subir_qr_a_drive(buffer, codigo):
             'parents': [QR_FOLDER_ID],
             'mimeType': 'image/png'
         }
-        media = MediaIoBaseUpload(buffer, mimetype='image/png')
-        archivo = drive_service.files().create(
-            body=file_metadata, 
-            media_body=media, 
-            fields='id,webViewLink'
-        ).execute()
+        archivo = subir_archivo(
+            drive_service, file_metadata, buffer, 'image/png',
+            fields='id,webViewLink', operacion='subir_qr'
+        )
+        _listar_qrs_existentes.clear()
         
         return archivo.get('id'), archivo.get('webViewLink')
     except Exception as e:
         st.error(f"Error subiendo QR: {e}")
         return None, None
 
+def subir_etiquetas_a_drive(buffer, nombre):
+    """Subir el PDF de etiquetas a la carpeta de QRs"""
+    try:
+        file_metadata = {
+            'name': nombre,
+            'parents': [QR_FOLDER_ID],
+            'mimeType': 'application/pdf'
+        }
+        archivo = subir_archivo(
+            drive_service, file_metadata, buffer, 'application/pdf',
+            fields='id,webViewLink', operacion='subir_etiquetas_qr'
+        )
+        return archivo.get('id'), archivo.get('webViewLink')
+    except Exception as e:
+        st.error(f"Error subiendo etiquetas: {e}")
+        return None, None
+
+def generar_etiquetas(codigos, incluir_url=False):
+    """PDF de etiquetas para los códigos (mismo contenido que el QR simple o, con URL, el avanzado)"""
+    if incluir_url:
+        etiquetas = [
+            (codigo, contenido_qr_avanzado(codigo, {'url': URL_ESCANER.format(codigo=codigo)}))
+            for codigo in codigos
+        ]
+    else:
+        etiquetas = [(codigo, codigo) for codigo in codigos]
+    return hoja_etiquetas_pdf(etiquetas)
+
+def mostrar_etiquetas_lote():
+    """Pestaña de etiquetas QR en lote: rango, lista o códigos nuevos -> un PDF A4"""
+    st.subheader("🏷️ Etiquetas QR en lote")
+    st.caption(f"Hojas A4 de {COLUMNAS}×{FILAS} etiquetas listas para imprimir, en un solo PDF")
+
+    origen = st.radio("Códigos:", ["Rango", "Lista", "Nuevos (reservar)"], horizontal=True)
+    codigos = []
+    if origen == "Rango":
+        col1, col2 = st.columns(2)
+        with col1:
+            desde = st.number_input("Desde (número):", min_value=1, value=1, step=1)
+        with col2:
+            hasta = st.number_input("Hasta (número):", min_value=1, value=COLUMNAS * FILAS, step=1)
+        # Se corta en MAX_ETIQUETAS + 1 para no armar listas enormes; el exceso se avisa al generar
+        codigos = [formatear_codigo(n) for n in range(int(desde), min(int(hasta), int(desde) + MAX_ETIQUETAS) + 1)]
+    elif origen == "Lista":
+        texto = st.text_area("Códigos:", placeholder="EQU-0000001\nEQU-0000002, EQU-0000010")
+        codigos = list(dict.fromkeys(PATRON_CODIGO_QR.findall(texto)))
+    else:
+        cantidad = st.number_input("Cantidad de códigos nuevos:", min_value=1, max_value=MAX_ETIQUETAS, value=COLUMNAS * FILAS, step=1)
+
+    incluir_url = st.checkbox("Incluir URL del escáner en el QR")
+
+    if origen != "Nuevos (reservar)":
+        st.write(f"**Etiquetas:** {len(codigos)}")
+
+    if st.button("🖨️ GENERAR HOJAS", type="primary", use_container_width=True):
+        if origen == "Nuevos (reservar)":
+            codigos = reservar_codigos_qr(int(cantidad))
+        if not codigos:
+            st.warning("⚠️ No hay códigos para generar")
+        elif len(codigos) > MAX_ETIQUETAS:
+            st.error(f"❌ Máximo {MAX_ETIQUETAS} etiquetas por PDF")
+        else:
+            with st.spinner(f"Generando {len(codigos)} etiquetas..."):
+                pdf_buffer = generar_etiquetas(codigos, incluir_url)
+                nombre = f"Etiquetas_{codigos[0]}_{codigos[-1]}_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
+                file_id, web_link = subir_etiquetas_a_drive(pdf_buffer, nombre)
+
+            if file_id:
+                st.success(f"✅ {len(codigos)} etiquetas generadas y subidas: **{nombre}**")
+            st.session_state.ultimo_pdf_etiquetas = pdf_buffer.getvalue()
+            st.session_state.ultimo_nombre_etiquetas = nombre
+            st.session_state.ultimo_link_etiquetas = web_link
+
+    if 'ultimo_pdf_etiquetas' in st.session_state:
+        st.download_button(
+            label="📥 Descargar PDF de etiquetas",
+            data=st.session_state.ultimo_pdf_etiquetas,
+            file_name=st.session_state.ultimo_nombre_etiquetas,
+            mime="application/pdf",
+            use_container_width=True
+        )
+        if st.session_state.ultimo_link_etiquetas:
+            st.markdown(f"🔗 [Ver en Google Drive]({st.session_state.ultimo_link_etiquetas})")
+
+@st.cache_data(ttl=TTL_LISTADO_QRS, show_spinner=False)
+def _listar_qrs_existentes():
+    """Todos los PNG de la carpeta de QRs (listado paginado completo)"""
+    query = f"'{QR_FOLDER_ID}' in parents and mimeType='image/png'"
+    return listar_todos(
+        drive_service, query,
+        fields='files(id,name,createdTime,webViewLink)',
+        operacion='listar_qrs_existentes'
+    )
+
 def obtener_qrs_existentes():
     """Obtener lista de QRs ya generados"""
     try:
-        query = f"'{QR_FOLDER_ID}' in parents and mimeType='image/png'"
-        results = drive_service.files().list(
-            q=query, 
-            pageSize=100,
-            fields="files(id,name,createdTime,webViewLink)"
-        ).execute()
-        return results.get('files', [])
+        return _listar_qrs_existentes()
     except Exception as e:
         st.error(f"Error obteniendo QRs existentes: {e}")
         return []
@@ -117,7 +234,7 @@ def generar_qrs():
     st.write("Genera códigos QR para equipos médicos")
     
     # Tabs para diferentes funciones
-    tab1, tab2, tab3 = st.tabs(["🆕 Generar Nuevo", "📋 QRs Existentes", "⚙️ Configuración"])
+    tab1, tab_lote, tab2, tab3 = st.tabs(["🆕 Generar Nuevo", "🏷️ Etiquetas en Lote", "📋 QRs Existentes", "⚙️ Configuración"])
     
     with tab1:
         col1, col2 = st.columns([1, 1])
@@ -148,12 +265,21 @@ def generar_qrs():
                 )
                 datos_adicionales['url'] = st.text_input(
                     "URL del sistema:", 
-                    value=f"https://cmch-ic2.streamlit.app/scanner?equipo={siguiente_codigo}",
+                    value=URL_ESCANER.format(codigo=siguiente_codigo),
                     help="URL que se abrirá al escanear el QR"
                 )
             
             if st.button("🔧 GENERAR QR", type="primary", use_container_width=True):
                 with st.spinner("Generando QR..."):
+                    # El código se reserva al generar: si otro usuario tomó el mostrado, se usa el siguiente
+                    codigo_reservado = reservar_codigo_qr()
+                    if not codigo_reservado:
+                        st.stop()
+                    if codigo_reservado != siguiente_codigo:
+                        if datos_adicionales.get('url'):
+                            datos_adicionales['url'] = datos_adicionales['url'].replace(siguiente_codigo, codigo_reservado)
+                        siguiente_codigo = codigo_reservado
+
                     # Crear QR según el tipo seleccionado
                     if tipo_qr == "Simple (solo código)":
                         qr_buffer = crear_qr_simple(siguiente_codigo)
@@ -199,6 +325,9 @@ def generar_qrs():
             else:
                 st.info("👆 Genera un QR para verlo aquí")
     
+    with tab_lote:
+        mostrar_etiquetas_lote()
+    
     with tab2:
         st.subheader("📋 QRs Existentes")
         
@@ -239,6 +368,36 @@ def generar_qrs():
                         if qr['name'].startswith('EQU-')
                     ])
                     st.metric("🔢 Último Número", ultimo_numero)
+
+            # Reimpresión: el QR se vuelve a renderizar localmente (no se descarga de Drive)
+            st.write("**🖨️ Reimprimir QR:**")
+            col1, col2 = st.columns([1, 1])
+            with col1:
+                codigo_reimpresion = st.selectbox(
+                    "Código:",
+                    sorted(df_qrs['codigo'], reverse=True),
+                    key="codigo_reimpresion"
+                )
+                incluir_url_reimpresion = st.checkbox(
+                    "Incluir URL del escáner", key="incluir_url_reimpresion",
+                    help="Los QR avanzados con nombre y ubicación se reimprimen desde 'Generar Nuevo'"
+                )
+            with col2:
+                if incluir_url_reimpresion:
+                    qr_reimpresion = crear_qr_avanzado(
+                        codigo_reimpresion, {'url': URL_ESCANER.format(codigo=codigo_reimpresion)}
+                    )
+                else:
+                    qr_reimpresion = crear_qr_simple(codigo_reimpresion)
+                st.image(qr_reimpresion.getvalue(), caption=f"Código: {codigo_reimpresion}", width=200)
+                st.download_button(
+                    label="📥 Descargar QR",
+                    data=qr_reimpresion,
+                    file_name=f"{codigo_reimpresion}.png",
+                    mime="image/png",
+                    key="descargar_reimpresion",
+                    use_container_width=True
+                )
         else:
             st.info("📝 No hay QRs generados aún")
     
@@ -261,13 +420,24 @@ Calidad: Alta
             st.info("""
             • Códigos personalizados
             • QR con logos
-            • Exportación masiva
             • Integración con inventario
             """)
         
+        with st.expander("📈 Métricas de Google Drive"):
+            mostrar_metricas_drive()
+
+        # Los códigos se entregan desde un contador local; si se subieron QRs
+        # por fuera de la app, este botón lo adelanta según lo que hay en Drive
+        if st.button("🔢 Resincronizar contador de códigos"):
+            try:
+                proximo = sincronizar_secuencia(SECUENCIA_QR, siguiente_numero_qr_en_drive)
+                st.success(f"✅ Contador sincronizado. Próximo código: {proximo}")
+            except Exception as e:
+                st.error(f"Error sincronizando contador: {e}")
+
         # Botón para limpiar cache
         if st.button("🔄 Actualizar Lista de QRs"):
-            st.cache_data.clear()
+            _listar_qrs_existentes.clear()
             st.rerun()
 
 if __name__ == "__main__":
@@ -0,0 +1,329 @@
+# indice_carpetas.py
+# Índice local de las carpetas de equipos en Drive:
+#   código EQU-XXXXXXX -> id de carpeta -> ids de sus subcarpetas
+# Se construye con un recorrido paginado de la carpeta "Equipos médicos" y se
+# mantiene al día con la API de cambios de Drive (changes().list con el
+# page token guardado), así que resolver un código no consulta Drive.
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import streamlit as st
+
+from cache_local import ruta_cache
+from drive_ejecutor import ejecutar, listar_todos
+
+# ==========================
+# CONFIG
+# ==========================
+# ID de la carpeta "Equipos médicos"
+PARENT_FOLDER_ID = "1ziehslbMBQZ626dHDn5tJlOkCOVW9xYM"
+
+ARCHIVO_INDICE = "carpetas.sqlite"
+
+# Segundos entre consultas a la API de cambios (dentro de este plazo el índice se usa tal cual)
+TTL_CAMBIOS = 60
+
+# Carpetas padre por consulta al listar subcarpetas (limita el largo de 'q')
+PADRES_POR_CONSULTA = 40
+
+MIME_CARPETA = "application/vnd.google-apps.folder"
+PATRON_CODIGO = re.compile(r"^EQU-\d{7}$")
+
+
+# ==========================
+# ALMACENAMIENTO
+# ==========================
+def _conectar() -> sqlite3.Connection:
+    conn = sqlite3.connect(ruta_cache(ARCHIVO_INDICE), timeout=30)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS carpetas (codigo TEXT PRIMARY KEY, folder_id TEXT NOT NULL UNIQUE);
+        CREATE TABLE IF NOT EXISTS subcarpetas (
+            folder_id TEXT NOT NULL, nombre TEXT NOT NULL, subcarpeta_id TEXT NOT NULL UNIQUE,
+            PRIMARY KEY (folder_id, nombre)
+        );
+        CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT);
+    """)
+    return conn
+
+
+def _leer_meta(conn, clave: str) -> Optional[str]:
+    fila = conn.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+    return fila[0] if fila else None
+
+
+def _guardar_meta(conn, clave: str, valor: str):
+    conn.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)", (clave, valor))
+
+
+def _guardar_carpeta(conn, codigo: str, folder_id: str):
+    conn.execute("DELETE FROM carpetas WHERE codigo = ? OR folder_id = ?", (codigo, folder_id))
+    conn.execute("INSERT INTO carpetas (codigo, folder_id) VALUES (?, ?)", (codigo, folder_id))
+
+
+def _guardar_subcarpeta(conn, folder_id: str, nombre: str, subcarpeta_id: str):
+    conn.execute("DELETE FROM subcarpetas WHERE subcarpeta_id = ?", (subcarpeta_id,))
+    conn.execute(
+        "INSERT OR REPLACE INTO subcarpetas (folder_id, nombre, subcarpeta_id) VALUES (?, ?, ?)",
+        (folder_id, nombre, subcarpeta_id)
+    )
+
+
+def _eliminar_id(conn, file_id: str):
+    """Quita del índice una carpeta o subcarpeta borrada/movida a la papelera"""
+    conn.execute("DELETE FROM subcarpetas WHERE folder_id = ? OR subcarpeta_id = ?", (file_id, file_id))
+    conn.execute("DELETE FROM carpetas WHERE folder_id = ?", (file_id,))
+
+
+# ==========================
+# CONSTRUCCIÓN Y CAMBIOS
+# ==========================
+@st.cache_resource(show_spinner=False)
+def _estado_indice():
+    """Estado compartido del proceso: última consulta de cambios y lock"""
+    return {"revisado_en": float("-inf"), "lock": threading.Lock()}
+
+
+def construir_indice(service):
+    """
+    Recorrido completo: carpetas EQU-XXXXXXX de PARENT_FOLDER_ID y sus subcarpetas.
+    El page token de cambios se pide ANTES de recorrer para no perder cambios intermedios.
+    """
+    token = ejecutar(
+        lambda: service.changes().getStartPageToken(supportsAllDrives=True).execute(),
+        'indice_token'
+    )['startPageToken']
+
+    carpetas = listar_todos(
+        service,
+        f"'{PARENT_FOLDER_ID}' in parents and mimeType = '{MIME_CARPETA}' and trashed = false",
+        fields="files(id,name)",
+        operacion='indice_carpetas',
+        supportsAllDrives=True,
+        includeItemsFromAllDrives=True,
+    )
+    carpetas = [c for c in carpetas if PATRON_CODIGO.match(c['name'])]
+
+    ids = [c['id'] for c in carpetas]
+    ids_conocidos = set(ids)
+    subcarpetas: List[Dict] = []
+    for i in range(0, len(ids), PADRES_POR_CONSULTA):
+        padres = " or ".join(f"'{folder_id}' in parents" for folder_id in ids[i:i + PADRES_POR_CONSULTA])
+        subcarpetas += listar_todos(
+            service,
+            f"({padres}) and mimeType = '{MIME_CARPETA}' and trashed = false",
+            fields="files(id,name,parents)",
+            operacion='indice_subcarpetas',
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True,
+        )
+
+    conn = _conectar()
+    try:
+        with conn:
+            conn.execute("DELETE FROM carpetas")
+            conn.execute("DELETE FROM subcarpetas")
+            for c in carpetas:
+                _guardar_carpeta(conn, c['name'], c['id'])
+            for s in subcarpetas:
+                for padre in s.get('parents', []):
+                    if padre in ids_conocidos:
+                        _guardar_subcarpeta(conn, padre, s['name'], s['id'])
+            _guardar_meta(conn, 'page_token', token)
+    finally:
+        conn.close()
+    print(f"Índice de carpetas construido: {len(carpetas)} equipos, {len(subcarpetas)} subcarpetas")
+
+
+def _aplicar_cambio(conn, cambio: Dict):
+    """Actualiza el índice con un cambio de la API de Drive"""
+    archivo = cambio.get('file') or {}
+    file_id = cambio.get('fileId')
+    if cambio.get('removed') or archivo.get('trashed'):
+        _eliminar_id(conn, file_id)
+        return
+    if archivo.get('mimeType') != MIME_CARPETA:
+        return
+
+    padres = archivo.get('parents', [])
+    nombre = archivo.get('name', '')
+    if PARENT_FOLDER_ID in padres and PATRON_CODIGO.match(nombre):
+        _guardar_carpeta(conn, nombre, file_id)
+        return
+
+    for padre in padres:
+        if conn.execute("SELECT 1 FROM carpetas WHERE folder_id = ?", (padre,)).fetchone():
+            _guardar_subcarpeta(conn, padre, nombre, file_id)
+            return
+
+    # Ya no cuelga de una carpeta conocida (movida o renombrada): se quita
+    _eliminar_id(conn, file_id)
+
+
+def sincronizar_cambios(service):
+    """Aplica los cambios de Drive desde el último page token guardado"""
+    conn = _conectar()
+    try:
+        token = _leer_meta(conn, 'page_token')
+    finally:
+        conn.close()
+    if token is None:
+        construir_indice(service)
+        return
+
+    conn = _conectar()
+    try:
+        while token:
+            respuesta = ejecutar(lambda: service.changes().list(
+                pageToken=token,
+                pageSize=1000,
+                fields="nextPageToken,newStartPageToken,changes(fileId,removed,file(id,name,mimeType,parents,trashed))",
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True,
+            ).execute(), 'indice_cambios')
+            with conn:
+                for cambio in respuesta.get('changes', []):
+                    _aplicar_cambio(conn, cambio)
+                if respuesta.get('newStartPageToken'):
+                    _guardar_meta(conn, 'page_token', respuesta['newStartPageToken'])
+            token = respuesta.get('nextPageToken')
+    finally:
+        conn.close()
+
+
+def _mantener_al_dia(service, forzar: bool = False):
+    """Consulta la API de cambios como máximo una vez cada TTL_CAMBIOS segundos"""
+    estado = _estado_indice()
+    with estado["lock"]:
+        if not forzar and time.monotonic() - estado["revisado_en"] < TTL_CAMBIOS:
+            return
+        try:
+            sincronizar_cambios(service)
+        except Exception as e:
+            print(f"No se pudo actualizar el índice de carpetas: {e}")
+        estado["revisado_en"] = time.monotonic()
+
+
+# ==========================
+# CONSULTAS
+# ==========================
+def _leer_carpeta(codigo: str) -> Optional[Dict]:
+    conn = _conectar()
+    try:
+        fila = conn.execute("SELECT folder_id FROM carpetas WHERE codigo = ?", (codigo,)).fetchone()
+        if fila is None:
+            return None
+        subcarpetas = dict(conn.execute(
+            "SELECT nombre, subcarpeta_id FROM subcarpetas WHERE folder_id = ?", (fila[0],)
+        ).fetchall())
+    finally:
+        conn.close()
+    return {'id': fila[0], 'subcarpetas': subcarpetas}
+
+
+def obtener_carpeta(service, codigo: str) -> Optional[Dict]:
+    """
+    {'id': id de la carpeta, 'subcarpetas': {nombre: id}} del código, o None.
+    En el caso común se resuelve desde el índice local sin consultar Drive;
+    si el código no está, se aplican los cambios pendientes y se vuelve a buscar.
+    """
+    codigo = (codigo or '').strip()
+    _mantener_al_dia(service)
+    carpeta = _leer_carpeta(codigo)
+    if carpeta is None:
+        _mantener_al_dia(service, forzar=True)
+        carpeta = _leer_carpeta(codigo)
+    return carpeta
+
+
+def obtener_subcarpeta(service, codigo: str, nombre: str) -> Optional[str]:
+    """Id de una subcarpeta estándar ('Fotos', 'Ficha técnica', ...) del equipo, o None"""
+    carpeta = obtener_carpeta(service, codigo)
+    return carpeta['subcarpetas'].get(nombre) if carpeta else None
+
+
+def carpeta_destino(service, codigo: str, subcarpeta: str, por_defecto: str) -> str:
+    """
+    Carpeta donde guardar un informe del equipo: su subcarpeta estándar
+    ('Ficha técnica', 'Informes técnicos', ...) resuelta desde el índice, o
+    la carpeta común por_defecto si el equipo aún no tiene carpeta.
+    """
+    try:
+        return obtener_subcarpeta(service, codigo, subcarpeta) or por_defecto
+    except Exception as e:
+        print(f"No se pudo resolver la carpeta de {codigo}, se usa la carpeta común: {e}")
+        return por_defecto
+
+
+def carpetas_destino(service, codigos: List[str], subcarpeta: str, por_defecto: str) -> Dict[str, str]:
+    """
+    carpeta_destino para muchos códigos: {código: carpeta}. Cada código distinto
+    se resuelve una vez y, si falta alguno, se aplican los cambios de Drive una
+    sola vez para todos (no una sincronización por fila).
+    """
+    codigos = list(dict.fromkeys(codigos))
+    try:
+        _mantener_al_dia(service)
+        carpetas = {codigo: _leer_carpeta((codigo or '').strip()) for codigo in codigos}
+        if any(carpeta is None for carpeta in carpetas.values()):
+            _mantener_al_dia(service, forzar=True)
+            carpetas.update({codigo: _leer_carpeta((codigo or '').strip())
+                             for codigo, carpeta in carpetas.items() if carpeta is None})
+    except Exception as e:
+        print(f"No se pudieron resolver las carpetas del lote, se usa la carpeta común: {e}")
+        return {codigo: por_defecto for codigo in codigos}
+    return {
+        codigo: (carpeta['subcarpetas'].get(subcarpeta) if carpeta else None) or por_defecto
+        for codigo, carpeta in carpetas.items()
+    }
+
+
+def subcarpetas_con_nombre(service, nombre: str) -> List[str]:
+    """Ids de la subcarpeta estándar 'nombre' de todos los equipos del índice"""
+    _mantener_al_dia(service)
+    conn = _conectar()
+    try:
+        return [fila[0] for fila in conn.execute(
+            "SELECT subcarpeta_id FROM subcarpetas WHERE nombre = ?", (nombre,)
+        ).fetchall()]
+    finally:
+        conn.close()
+
+
+def siguiente_numero_indice(service) -> int:
+    """
+    Número siguiente al mayor código EQU-XXXXXXX del índice, al día con la API
+    de cambios (como máximo una consulta cada TTL_CAMBIOS): incluye las carpetas
+    creadas fuera de la app sin listar toda la carpeta en Drive.
+    """
+    _mantener_al_dia(service)
+    conn = _conectar()
+    try:
+        fila = conn.execute("SELECT MAX(codigo) FROM carpetas").fetchone()
+    finally:
+        conn.close()
+    return int(fila[0][4:]) + 1 if fila and fila[0] else 1
+
+
+def carpetas_existentes(codigos: List[str]) -> List[str]:
+    """Códigos que ya tienen carpeta en el índice local (sin consultar Drive)"""
+    conn = _conectar()
+    try:
+        return [codigo for codigo in codigos
+                if conn.execute("SELECT 1 FROM carpetas WHERE codigo = ?", (codigo,)).fetchone()]
+    finally:
+        conn.close()
+
+
+def registrar_carpeta(codigo: str, folder_id: str, subcarpetas: Dict[str, str]):
+    """Agrega al índice una carpeta recién creada por la app (sin esperar a la API de cambios)"""
+    conn = _conectar()
+    try:
+        with conn:
+            _guardar_carpeta(conn, codigo, folder_id)
+            for nombre, subcarpeta_id in subcarpetas.items():
+                _guardar_subcarpeta(conn, folder_id, nombre, subcarpeta_id)
+    finally:
+        conn.close()
@@ -0,0 +1,272 @@
+# indice_equipos.py
+# Índice en memoria del inventario para los selectores de equipos.
+# Se construye una sola vez por versión del inventario y lo comparten todas las sesiones.
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+import streamlit as st
+import pandas as pd
+
+from inventario import obtener_inventario_versionado
+
+# Columnas de la hoja para cada campo (se usa la primera que exista)
+COLUMNAS_EQUIPO = {
+    'codigo_nuevo': ['Codigo nuevo'],
+    'equipo': ['EQUIPO'],
+    'marca': ['MARCA'],
+    'modelo': ['MODELO'],
+    'serie': ['SERIE'],
+    'area': ['AREA', 'UPSS/UPS'],
+    'ubicacion': ['UBICACION', 'AMBIENTE'],
+}
+
+# Campos sobre los que trabaja la búsqueda por texto
+CAMPOS_BUSQUEDA = ['codigo_nuevo', 'equipo', 'marca', 'modelo', 'serie']
+
+# Tamaño de los n-gramas del índice de búsqueda
+N_GRAMA = 3
+
+# Candidatos (por coincidencia de n-gramas) que se puntúan en detalle
+MAX_CANDIDATOS = 300
+
+
+# ==========================
+# CONSTRUCCIÓN
+# ==========================
+def _valores_columna(df: pd.DataFrame, candidatas: List[str]) -> List[str]:
+    """Valores de la primera columna existente como lista de str ('' si no hay)"""
+    for columna in candidatas:
+        if columna in df.columns:
+            return [str(v) for v in df[columna].tolist()]
+    return [''] * len(df)
+
+
+def _etiqueta(eq: Dict) -> str:
+    """Texto que muestra el selector para un equipo"""
+    etiqueta = f"{eq['codigo_nuevo']} - {eq['equipo']}"
+    if eq['area']:
+        etiqueta += f" ({eq['area']})"
+    if eq['ubicacion']:
+        etiqueta += f" - {eq['ubicacion']}"
+    return etiqueta
+
+
+def _agrupar(valores: List[str]) -> Dict[str, List[int]]:
+    """Agrupa posiciones por valor, ignorando los vacíos"""
+    grupos: Dict[str, List[int]] = {}
+    for pos, valor in enumerate(valores):
+        if valor:
+            grupos.setdefault(valor, []).append(pos)
+    return grupos
+
+
+def normalizar_texto(texto: str) -> str:
+    """Mayúsculas, sin tildes y solo letras/dígitos (para comparar códigos y series parciales)"""
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^A-Z0-9]', '', texto.upper())
+
+
+def _ngramas(texto: str) -> set:
+    """n-gramas de un texto ya normalizado (el texto completo si es más corto)"""
+    if len(texto) <= N_GRAMA:
+        return {texto} if texto else set()
+    return {texto[i:i + N_GRAMA] for i in range(len(texto) - N_GRAMA + 1)}
+
+
+def _indice_busqueda(equipos: List[Dict]):
+    """Textos normalizados por equipo e índice invertido n-grama -> posiciones"""
+    textos = []
+    ngramas: Dict[str, List[int]] = {}
+    for pos, eq in enumerate(equipos):
+        campos = tuple(normalizar_texto(eq[campo]) for campo in CAMPOS_BUSQUEDA)
+        textos.append(campos)
+        gramas = set()
+        for campo in campos:
+            gramas |= _ngramas(campo)
+        for grama in gramas:
+            ngramas.setdefault(grama, []).append(pos)
+    return textos, ngramas
+
+
+def construir_indice(df: pd.DataFrame) -> Dict:
+    """
+    Construye el índice del inventario:
+    - equipos: lista de dicts (mismo formato que usan los módulos de informes)
+    - por_codigo / por_serie: búsqueda O(1) de la posición del equipo
+    - por_area / por_ubicacion: posiciones agrupadas
+    - etiquetas: texto del selector de cada posición
+    - textos / ngramas: índice para la búsqueda por texto (buscar_equipos)
+    """
+    columnas = {campo: _valores_columna(df, candidatas) for campo, candidatas in COLUMNAS_EQUIPO.items()}
+    equipos = [dict(zip(columnas.keys(), fila)) for fila in zip(*columnas.values())]
+
+    por_codigo: Dict[str, int] = {}
+    for pos, codigo in enumerate(columnas['codigo_nuevo']):
+        if codigo:
+            por_codigo.setdefault(codigo, pos)
+
+    por_serie: Dict[str, int] = {}
+    for pos, serie in enumerate(columnas['serie']):
+        if serie:
+            por_serie.setdefault(serie.upper(), pos)
+
+    por_area = _agrupar(columnas['area'])
+    textos, ngramas = _indice_busqueda(equipos)
+
+    return {
+        'equipos': equipos,
+        'etiquetas': [_etiqueta(eq) for eq in equipos],
+        'por_codigo': por_codigo,
+        'por_serie': por_serie,
+        'por_area': por_area,
+        'por_ubicacion': _agrupar(columnas['ubicacion']),
+        'areas': sorted(por_area.keys()),
+        'todas': list(range(len(equipos))),
+        'textos': textos,
+        'ngramas': ngramas,
+    }
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _indice_para_version(version: int, _df: pd.DataFrame) -> Dict:
+    return construir_indice(_df)
+
+
+def obtener_indice_equipos() -> Dict:
+    """Índice del inventario actual; solo se reconstruye cuando cambia la versión"""
+    # DataFrame y versión leídos juntos: una recarga intermedia no puede
+    # guardar el índice de los datos viejos bajo la versión nueva
+    df, version = obtener_inventario_versionado()
+    return _indice_para_version(version, df)
+
+
+# ==========================
+# CONSULTAS
+# ==========================
+def buscar_por_codigo(indice: Dict, codigo: str) -> Optional[Dict]:
+    """Equipo con ese 'Codigo nuevo' o None"""
+    pos = indice['por_codigo'].get((codigo or '').strip())
+    return indice['equipos'][pos] if pos is not None else None
+
+
+def buscar_por_serie(indice: Dict, serie: str) -> Optional[Dict]:
+    """Equipo con esa SERIE (sin distinguir mayúsculas) o None"""
+    pos = indice['por_serie'].get((serie or '').strip().upper())
+    return indice['equipos'][pos] if pos is not None else None
+
+
+def posiciones_por_area(indice: Dict, area: str) -> List[int]:
+    """Posiciones de los equipos del área ('Todas' devuelve todo el inventario)"""
+    if area == "Todas":
+        return indice['todas']
+    return indice['por_area'].get(area, [])
+
+
+def _puntuar(consulta: str, campos: tuple, coincidencias: int, total_gramas: int) -> float:
+    """Puntaje de un equipo: n-gramas compartidos + bonos por coincidencia exacta/prefijo/subcadena"""
+    puntaje = coincidencias / total_gramas if total_gramas else 0.0
+    codigo, serie = campos[0], campos[4]
+    if consulta in (codigo, serie):
+        puntaje += 3.0
+    if any(campo.startswith(consulta) for campo in campos):
+        puntaje += 1.0
+    elif any(consulta in campo for campo in campos):
+        puntaje += 0.5
+    return puntaje
+
+
+def buscar_equipos(indice: Dict, consulta: str, limite: int = 50, en: Optional[Set[int]] = None) -> List[int]:
+    """
+    Búsqueda tolerante sobre código, equipo, marca, modelo y serie.
+    Devuelve posiciones ordenadas de mejor a peor coincidencia.
+    - en: si se indica, solo se consideran esas posiciones (p. ej. un área);
+      el filtro se aplica antes de recortar a 'limite'.
+    - Consultas cortas: búsqueda por prefijo/subcadena.
+    - Consultas largas: candidatos por n-gramas compartidos (admite errores de
+      tipeo y series incompletas) y luego puntaje con bonos por prefijo/exacto.
+    """
+    consulta = normalizar_texto(consulta)
+    if not consulta:
+        return []
+
+    textos = indice['textos']
+    if len(consulta) < N_GRAMA:
+        posiciones = range(len(textos)) if en is None else sorted(en)
+        candidatos = [pos for pos in posiciones if any(consulta in campo for campo in textos[pos])]
+        candidatos.sort(key=lambda pos: -_puntuar(consulta, textos[pos], 0, 0))
+        return candidatos[:limite]
+
+    gramas = _ngramas(consulta)
+    conteo = Counter()
+    for grama in gramas:
+        conteo.update(indice['ngramas'].get(grama, ()))
+    if en is not None:
+        conteo = Counter({pos: n for pos, n in conteo.items() if pos in en})
+
+    # Exigir al menos un tercio de los n-gramas para descartar coincidencias casuales
+    minimo = max(1, len(gramas) // 3)
+    candidatos = [(pos, n) for pos, n in conteo.most_common(MAX_CANDIDATOS) if n >= minimo]
+    puntuados = sorted(
+        candidatos,
+        key=lambda item: -_puntuar(consulta, textos[item[0]], item[1], len(gramas))
+    )
+    return [pos for pos, _ in puntuados[:limite]]
+
+
+# ==========================
+# UI STREAMLIT
+# ==========================
+def selector_equipo(indice: Dict) -> Optional[Dict]:
+    """
+    Selector de equipo compartido por los módulos de informes.
+    Devuelve el dict del equipo elegido o None si no hay selección.
+    """
+    metodo_seleccion = st.radio(
+        "¿Cómo deseas seleccionar el equipo?",
+        ["🔍 Selector inteligente", "⌨️ Código manual"],
+        horizontal=True
+    )
+
+    if metodo_seleccion == "🔍 Selector inteligente":
+        consulta = st.text_input(
+            "🔎 Buscar equipo",
+            placeholder="Código, equipo, marca, modelo o parte de la serie..."
+        )
+        area_filtro = st.selectbox("🏢 Filtrar por Área", ["Todas"] + indice['areas'])
+        posiciones = posiciones_por_area(indice, area_filtro)
+
+        if consulta.strip():
+            en_area = set(posiciones) if area_filtro != "Todas" else None
+            posiciones = buscar_equipos(indice, consulta, en=en_area)
+
+        if not posiciones:
+            st.warning("⚠️ No se encontraron equipos para el área seleccionada")
+            return None
+
+        etiquetas = indice['etiquetas']
+        pos = st.selectbox("🔧 Seleccionar Equipo", posiciones, format_func=lambda p: etiquetas[p])
+        equipo_data = indice['equipos'][pos]
+
+        with st.expander("🔍 Detalles del Equipo Seleccionado", expanded=True):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write(f"**🏷️ Código:** {equipo_data['codigo_nuevo']}")
+                st.write(f"**⚙️ Equipo:** {equipo_data['equipo']}")
+                st.write(f"**🏭 Marca:** {equipo_data['marca']}")
+            with col2:
+                st.write(f"**📱 Modelo:** {equipo_data['modelo']}")
+                st.write(f"**🔢 Serie:** {equipo_data['serie']}")
+                st.write(f"**📍 Área:** {equipo_data['area']}")
+        return equipo_data
+
+    # Código manual (también acepta el número de serie)
+    codigo_input = st.text_input("🔍 Ingrese el código del equipo (Ej: EQU-0000001)")
+    if not codigo_input:
+        return None
+
+    equipo_data = buscar_por_codigo(indice, codigo_input) or buscar_por_serie(indice, codigo_input)
+    if equipo_data:
+        st.success(f"✅ **Equipo encontrado:** {equipo_data['equipo']}")
+    return equipo_data
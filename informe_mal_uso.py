@@ -3,13 +3,13 @@ import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime, time
-import openpyxl
-from openpyxl.styles import Font
 from openpyxl.drawing.image import Image as ExcelImage
 from openpyxl.utils import get_column_letter
 import io
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+from indice_equipos import obtener_indice_equipos, selector_equipo
+from motor_informes import escribir_celda_segura, generar_informe, inspeccionar_plantilla
+from indice_carpetas import carpeta_destino
 from PIL import Image, ImageOps
 import base64
 
@@ -26,30 +26,24 @@ def configurar_drive_api():
     drive_service = build('drive', 'v3', credentials=credenciales)
     return drive_service
 
-# Función para escribir en celdas de forma segura
-def escribir_celda_segura(ws, celda, valor, fuente=None):
-    """Escribe en una celda manejando celdas fusionadas"""
-    try:
-        # Verificar si la celda está fusionada
-        cell = ws[celda]
-        if hasattr(cell, 'coordinate'):
-            # Buscar si esta celda es parte de un rango fusionado
-            for merged_range in ws.merged_cells.ranges:
-                if cell.coordinate in merged_range:
-                    # Es una celda fusionada, usar la celda superior izquierda
-                    top_left = merged_range.start_cell
-                    top_left.value = valor
-                    if fuente:
-                        top_left.font = fuente
-                    return
-        
-        # No está fusionada, escribir normalmente
-        cell.value = valor
-        if fuente:
-            cell.font = fuente
-            
-    except Exception as e:
-        st.warning(f"No se pudo escribir en la celda {celda}: {e}")
+
+# Celdas de la plantilla de mal uso (campo del formulario -> celda) - AJUSTAR CELDAS SEGÚN TU TEMPLATE
+MAPA_CELDAS_MAL_USO = {
+    'codigo_informe': "J6",       # Código de informe
+    'sede': "C5",                 # Sede
+    'upss': "C6",                 # UPSS
+    'servicio': "C7",             # Servicio
+
+    # Información del equipo y personal
+    'personal_asignado': "B10",   # Personal asignado
+    'equipo_nombre': "F10",       # Nombre del equipo
+    'marca': "I10",               # Marca
+    'modelo': "K10",              # Modelo
+    'serie': "M10",               # Serie
+
+    # Inconveniente reportado
+    'inconveniente': "B13",
+}
 
 # NUEVA FUNCIÓN: Procesar y redimensionar imagen para Excel
 def procesar_imagen_para_excel(imagen_bytes, max_width=200, max_height=150):
@@ -165,74 +159,18 @@ def insertar_imagenes_en_excel(ws, imagenes_data, celda_inicial="B19"):
 # FUNCIÓN MODIFICADA: Crear informe de mal uso con imágenes
 def crear_informe_mal_uso_completo(drive_service, plantilla_id, carpeta_destino_id, datos_formulario, imagenes_data=None):
     """Crea copia de plantilla de mal uso, llena datos y sube archivo final a Drive CON IMÁGENES"""
-    try:
-        # 1. Crear copia de la plantilla
-        nombre_copia = f"Informe_MalUso_{datos_formulario['codigo_informe']}"
-        copy_metadata = {
-            'name': nombre_copia,
-            'parents': [carpeta_destino_id]
-        }
-        
-        copia = drive_service.files().copy(
-            fileId=plantilla_id,
-            body=copy_metadata,
-            fields='id,name,webViewLink'
-        ).execute()
-        
-        copia_id = copia['id']
-        
-        # 2. Descargar la copia para editar
-        file_metadata = drive_service.files().get(fileId=copia_id, fields='mimeType').execute()
-        mime_type = file_metadata.get('mimeType')
-        
-        if mime_type == 'application/vnd.google-apps.spreadsheet':
-            request = drive_service.files().export_media(
-                fileId=copia_id,
-                mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        else:
-            request = drive_service.files().get_media(fileId=copia_id)
-        
-        file_io = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_io, request)
-        
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-        
-        file_io.seek(0)
-        
-        # 3. Editar el archivo Excel con los datos
-        wb = openpyxl.load_workbook(file_io)
-        ws = wb.active
-        fuente = Font(name="Albert Sans", size=8)
 
-        # Llenar datos usando la función segura - AJUSTAR CELDAS SEGÚN TU TEMPLATE
-        escribir_celda_segura(ws, "J6", datos_formulario['codigo_informe'], fuente)  # Código de informe
-        escribir_celda_segura(ws, "C5", datos_formulario['sede'], fuente)            # Sede
-        escribir_celda_segura(ws, "C6", datos_formulario['upss'], fuente)            # UPSS
-        escribir_celda_segura(ws, "C7", datos_formulario['servicio'], fuente)        # Servicio
-        
-        # Información del equipo y personal
-        escribir_celda_segura(ws, "B10", datos_formulario['personal_asignado'], fuente)  # Personal asignado
-        escribir_celda_segura(ws, "F10", datos_formulario['equipo_nombre'], fuente)     # Nombre del equipo
-        escribir_celda_segura(ws, "I10", datos_formulario['marca'], fuente)            # Marca
-        escribir_celda_segura(ws, "K10", datos_formulario['modelo'], fuente)           # Modelo
-        escribir_celda_segura(ws, "M10", datos_formulario['serie'], fuente)            # Serie
-        
-        # Inconveniente reportado
-        escribir_celda_segura(ws, "B13", datos_formulario['inconveniente'], fuente)
-        
-        # ============== INSERTAR IMÁGENES EN LA CELDA B19 ==============
+    # ============== INSERTAR IMÁGENES EN LA CELDA B19 ==============
+    def insertar_imagenes(ws, datos, fuente):
         if imagenes_data and len(imagenes_data) > 0:
             st.info(f"🖼️ Insertando {len(imagenes_data)} imágenes en el Excel...")
-            
+
             # Limpiar el contenido de texto de la celda B19 primero
             escribir_celda_segura(ws, "B19", "", fuente)
-            
+
             # Insertar las imágenes reales
             exito_imagenes = insertar_imagenes_en_excel(ws, imagenes_data, "B19")
-            
+
             if exito_imagenes:
                 st.success(f"✅ {len(imagenes_data)} imágenes insertadas correctamente en B19")
             else:
@@ -242,75 +180,21 @@ def crear_informe_mal_uso_completo(drive_service, plantilla_id, carpeta_destino_
         else:
             # Si no hay imágenes, dejar celda vacía o con texto informativo
             escribir_celda_segura(ws, "B19", "Sin imágenes adjuntas", fuente)
-        
-        # 4. Guardar archivo editado
-        archivo_editado = io.BytesIO()
-        wb.save(archivo_editado)
-        archivo_editado.seek(0)
-        
-        # 5. Actualizar archivo en Drive
-        media = MediaIoBaseUpload(
-            archivo_editado,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    try:
+        nombre_copia = f"Informe_MalUso_{datos_formulario['codigo_informe']}"
+        return generar_informe(
+            drive_service, plantilla_id, carpeta_destino_id, nombre_copia, datos_formulario,
+            mapa_celdas=MAPA_CELDAS_MAL_USO,
+            personalizar=insertar_imagenes,
         )
-        
-        resultado_final = drive_service.files().update(
-            fileId=copia_id,
-            media_body=media,
-            fields='id,name,webViewLink'
-        ).execute()
-        
-        return resultado_final, archivo_editado
-        
+
     except Exception as e:
         st.error(f"Error creando informe de mal uso: {e}")
         import traceback
         st.error(f"Detalles del error: {traceback.format_exc()}")
         return None, None
 
-# Función alternativa para debugging - inspeccionar celdas fusionadas
-def inspeccionar_plantilla(drive_service, plantilla_id):
-    """Función para inspeccionar qué celdas están fusionadas en la plantilla"""
-    try:
-        # Crear copia temporal
-        copy_metadata = {'name': 'temp_inspection'}
-        copia = drive_service.files().copy(fileId=plantilla_id, body=copy_metadata).execute()
-        copia_id = copia['id']
-        
-        # Descargar
-        request = drive_service.files().get_media(fileId=copia_id)
-        file_io = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_io, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        file_io.seek(0)
-        
-        # Inspeccionar
-        wb = openpyxl.load_workbook(file_io)
-        ws = wb.active
-        
-        st.write("### 🔍 Celdas fusionadas encontradas:")
-        for merged_range in ws.merged_cells.ranges:
-            st.write(f"- Rango fusionado: {merged_range}")
-            
-        # Eliminar copia temporal
-        drive_service.files().delete(fileId=copia_id).execute()
-        
-    except Exception as e:
-        st.error(f"Error inspeccionando plantilla: {e}")
-
-# Cargar datos desde Google Sheets
-@st.cache_data
-def cargar_datos():
-    info = st.secrets["google_service_account"]
-    scope = ['https://www.googleapis.com/auth/spreadsheets',
-             'https://www.googleapis.com/auth/drive']
-    credenciales = ServiceAccountCredentials.from_json_keyfile_dict(info, scope)
-    cliente = gspread.authorize(credenciales)
-    hoja = cliente.open("Base de datos").sheet1
-    datos = hoja.get_all_records()
-    return pd.DataFrame(datos)
 
 # Función para gestionar imágenes (nueva funcionalidad)
 def gestionar_imagenes():
@@ -479,92 +363,20 @@ def mostrar_informes_mal_uso():
         if st.button("Inspeccionar celdas fusionadas"):
             inspeccionar_plantilla(drive_service, PLANTILLA_MAL_USO_ID)
 
-    # Cargar base de datos
-    df = cargar_datos()
+    # Índice del inventario compartido
+    indice = obtener_indice_equipos()
 
     # ============== SELECTOR DE EQUIPOS ==============
     st.markdown("### 🔍 Selección de Equipo/Accesorio/Repuesto")
     
-    equipos = []
-    for _, row in df.iterrows():
-        equipo = {
-            'codigo_nuevo': row.get('Codigo nuevo', ''),
-            'equipo': row.get('EQUIPO', ''),
-            'marca': row.get('MARCA', ''),
-            'modelo': row.get('MODELO', ''),
-            'serie': row.get('SERIE', ''),
-            'area': row.get('AREA', ''),
-            'ubicacion': row.get('UBICACION', ''),
-        }
-        equipos.append(equipo)
-
-    metodo_seleccion = st.radio(
-        "¿Cómo deseas seleccionar el equipo?",
-        ["🔍 Selector inteligente", "⌨️ Código manual"],
-        horizontal=True
-    )
-
-    marca = modelo = equipo_nombre = serie = codigo_equipo = ""
-    area_equipo = ubicacion_equipo = ""
-
-    if metodo_seleccion == "🔍 Selector inteligente":
-        areas_disponibles = sorted(list(set([eq['area'] for eq in equipos if eq['area']])))
-        area_filtro = st.selectbox("🏢 Filtrar por Área", ["Todas"] + areas_disponibles)
-        
-        equipos_filtrados = equipos
-        if area_filtro != "Todas":
-            equipos_filtrados = [eq for eq in equipos if eq['area'] == area_filtro]
-        
-        if equipos_filtrados:
-            opciones_equipos = []
-            for eq in equipos_filtrados:
-                opcion = f"{eq['codigo_nuevo']} - {eq['equipo']}"
-                if eq['area']:
-                    opcion += f" ({eq['area']})"
-                if eq['ubicacion']:
-                    opcion += f" - {eq['ubicacion']}"
-                opciones_equipos.append(opcion)
-            
-            equipo_seleccionado = st.selectbox("🔧 Seleccionar Equipo", opciones_equipos)
-            indice_equipo = opciones_equipos.index(equipo_seleccionado)
-            equipo_data = equipos_filtrados[indice_equipo]
-            
-            codigo_equipo = equipo_data['codigo_nuevo']
-            equipo_nombre = equipo_data['equipo']
-            marca = equipo_data['marca']
-            modelo = equipo_data['modelo']
-            serie = equipo_data['serie']
-            area_equipo = equipo_data['area']
-            ubicacion_equipo = equipo_data['ubicacion']
-            
-            with st.expander("🔍 Detalles del Equipo Seleccionado", expanded=True):
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.write(f"**🏷️ Código:** {codigo_equipo}")
-                    st.write(f"**⚙️ Equipo:** {equipo_nombre}")
-                    st.write(f"**🏭 Marca:** {marca}")
-                with col2:
-                    st.write(f"**📱 Modelo:** {modelo}")
-                    st.write(f"**🔢 Serie:** {serie}")
-                    st.write(f"**📍 Área:** {area_equipo}")
-        else:
-            st.warning("⚠️ No se encontraron equipos para el área seleccionada")
-    
-    else:  # Código manual
-        codigo_input = st.text_input("🔍 Ingrese el código del equipo (Ej: EQU-0000001)")
-        equipo_info = df[df["Codigo nuevo"] == codigo_input]
-        
-        if not equipo_info.empty:
-            equipo_row = equipo_info.iloc[0]
-            codigo_equipo = codigo_input
-            marca = equipo_row["MARCA"]
-            modelo = equipo_row["MODELO"]
-            equipo_nombre = equipo_row["EQUIPO"]
-            serie = equipo_row["SERIE"]
-            area_equipo = equipo_row.get("AREA", "")
-            ubicacion_equipo = equipo_row.get("UBICACION", "")
-            
-            st.success(f"✅ **Equipo encontrado:** {equipo_nombre}")
+    equipo_data = selector_equipo(indice) or {}
+    codigo_equipo = equipo_data.get('codigo_nuevo', '')
+    equipo_nombre = equipo_data.get('equipo', '')
+    marca = equipo_data.get('marca', '')
+    modelo = equipo_data.get('modelo', '')
+    serie = equipo_data.get('serie', '')
+    area_equipo = equipo_data.get('area', '')
+    ubicacion_equipo = equipo_data.get('ubicacion', '')
 
     # ============== INFORMACIÓN DEL INFORME ==============
     st.markdown("### 🏥 Información del Informe")
@@ -673,7 +485,7 @@ def mostrar_informes_mal_uso():
             resultado_final, archivo_editado = crear_informe_mal_uso_completo(
                 drive_service, 
                 PLANTILLA_MAL_USO_ID, 
-                CARPETA_MAL_USO_ID, 
+                carpeta_destino(drive_service, codigo_equipo, "Informe de mal uso", CARPETA_MAL_USO_ID), 
                 datos_formulario,
                 imagenes_guardadas  # <- PASAR LAS IMÁGENES
             )
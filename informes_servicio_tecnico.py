@@ -3,11 +3,10 @@ import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime, time
-import openpyxl
-from openpyxl.styles import Font
-import io
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+from indice_equipos import obtener_indice_equipos, selector_equipo
+from motor_informes import generar_informe, inspeccionar_plantilla, si_tiene_valor
+from indice_carpetas import carpeta_destino
 
 # Configurar Google Drive API
 @st.cache_resource
@@ -22,145 +21,55 @@ def configurar_drive_api():
     drive_service = build('drive', 'v3', credentials=credenciales)
     return drive_service
 
-# Función para escribir en celdas de forma segura
-def escribir_celda_segura(ws, celda, valor, fuente=None):
-    """Escribe en una celda manejando celdas fusionadas"""
-    try:
-        # Verificar si la celda está fusionada
-        cell = ws[celda]
-        if hasattr(cell, 'coordinate'):
-            # Buscar si esta celda es parte de un rango fusionado
-            for merged_range in ws.merged_cells.ranges:
-                if cell.coordinate in merged_range:
-                    # Es una celda fusionada, usar la celda superior izquierda
-                    top_left = merged_range.start_cell
-                    top_left.value = valor
-                    if fuente:
-                        top_left.font = fuente
-                    return
-        
-        # No está fusionada, escribir normalmente
-        cell.value = valor
-        if fuente:
-            cell.font = fuente
-            
-    except Exception as e:
-        st.warning(f"No se pudo escribir en la celda {celda}: {e}")
 
+# Celdas de la plantilla de servicio técnico (campo del formulario -> celda)
+MAPA_CELDAS_SERVICIO = {
+    'codigo_informe': "J6",
+    'sede': "C5",
+    'upss': "C6",
+    'tipo_servicio': "C7",
+    'equipo_nombre': "F10",
+    'marca': "I10",
+    'modelo': "K10",
+    'serie': "M10",
+    'inicio_servicio': "B12",
+    'fin_servicio': "D12",
+    'estado': "F12",
+    'inconveniente': "B15",
+    'actividades': "B20",
+    'resultado': "B29",
+}
 
-# Función para marcar tipo de servicio con X
-def marcar_tipo_servicio(ws, tipo_servicio, fuente):
-    """Marca con X el tipo de servicio seleccionado"""
-    
-    tipos_servicio_celdas = {
+# Casillas del tipo de servicio (se marca con X la seleccionada)
+MARCAS_SERVICIO = {
+    'tipo_servicio': {
         "Mantenimiento Correctivo": "G12",  # Celda para "Correctivo"
-        "Mantenimiento Preventivo": "I12",  # Celda para "Preventivo" 
+        "Mantenimiento Preventivo": "I12",  # Celda para "Preventivo"
         "Inspección": "K12",                # Celda para "Inspección"
         "Otro": "M12"                       # Celda para "Otro"
     }
-    
-    # Limpiar todas las celdas primero
-    for celda in tipos_servicio_celdas.values():
-        escribir_celda_segura(ws, celda, "", fuente)
-    
-    # Marcar con X el tipo seleccionado
-    if tipo_servicio in tipos_servicio_celdas:
-        celda_seleccionada = tipos_servicio_celdas[tipo_servicio]
-        escribir_celda_segura(ws, celda_seleccionada, "X", fuente)
+}
 
+# Campos adicionales si existen
+CELDAS_CALCULADAS_SERVICIO = [
+    ("B10", si_tiene_valor('tecnico_responsable', "Técnico: {}")),
+    ("B37", si_tiene_valor('repuestos_utilizados', "Repuestos: {}")),
+    ("B39", lambda datos: f"Costo: S/ {datos['costo_servicio']:.2f}" if datos.get('costo_servicio', 0) > 0 else None),
+]
 
 
 # Función para crear copia, llenar datos y subir
 def crear_informe_completo(drive_service, plantilla_id, carpeta_destino_id, datos_formulario):
     """Crea copia de plantilla, llena datos y sube archivo final a Drive"""
     try:
-        # 1. Crear copia de la plantilla
         nombre_copia = f"Informe_ST_{datos_formulario['codigo_informe']}"
-        copy_metadata = {
-            'name': nombre_copia,
-            'parents': [carpeta_destino_id]
-        }
-        
-        copia = drive_service.files().copy(
-            fileId=plantilla_id,
-            body=copy_metadata,
-            fields='id,name,webViewLink'
-        ).execute()
-        
-        copia_id = copia['id']
-        
-        # 2. Descargar la copia para editar
-        file_metadata = drive_service.files().get(fileId=copia_id, fields='mimeType').execute()
-        mime_type = file_metadata.get('mimeType')
-        
-        if mime_type == 'application/vnd.google-apps.spreadsheet':
-            request = drive_service.files().export_media(
-                fileId=copia_id,
-                mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        else:
-            request = drive_service.files().get_media(fileId=copia_id)
-        
-        file_io = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_io, request)
-        
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-        
-        file_io.seek(0)
-        
-        # 3. Editar el archivo Excel con los datos
-        wb = openpyxl.load_workbook(file_io)
-        ws = wb.active
-        fuente = Font(name="Albert Sans", size=8)
-
-        # Llenar datos usando la función segura
-        escribir_celda_segura(ws, "J6", datos_formulario['codigo_informe'], fuente)
-        escribir_celda_segura(ws, "C5", datos_formulario['sede'], fuente)
-        escribir_celda_segura(ws, "C6", datos_formulario['upss'], fuente)
-        escribir_celda_segura(ws, "C7", datos_formulario['tipo_servicio'], fuente)
-        marcar_tipo_servicio(ws, datos_formulario['tipo_servicio'], fuente)
-        escribir_celda_segura(ws, "F10", datos_formulario['equipo_nombre'], fuente)
-        escribir_celda_segura(ws, "I10", datos_formulario['marca'], fuente)
-        escribir_celda_segura(ws, "K10", datos_formulario['modelo'], fuente)
-        escribir_celda_segura(ws, "M10", datos_formulario['serie'], fuente)
-        escribir_celda_segura(ws, "B12", datos_formulario['inicio_servicio'], fuente)
-        escribir_celda_segura(ws, "D12", datos_formulario['fin_servicio'], fuente)
-        escribir_celda_segura(ws, "F12", datos_formulario['estado'], fuente)
-        escribir_celda_segura(ws, "B15", datos_formulario['inconveniente'], fuente)
-        escribir_celda_segura(ws, "B20", datos_formulario['actividades'], fuente)
-        escribir_celda_segura(ws, "B29", datos_formulario['resultado'], fuente)
-        
-        # Campos adicionales si existen
-        if datos_formulario.get('tecnico_responsable'):
-            escribir_celda_segura(ws, "B10", f"Técnico: {datos_formulario['tecnico_responsable']}", fuente)
-        
-        if datos_formulario.get('repuestos_utilizados'):
-            escribir_celda_segura(ws, "B37", f"Repuestos: {datos_formulario['repuestos_utilizados']}", fuente)
-            
-        if datos_formulario.get('costo_servicio', 0) > 0:
-            escribir_celda_segura(ws, "B39", f"Costo: S/ {datos_formulario['costo_servicio']:.2f}", fuente)
-        
-        # 4. Guardar archivo editado
-        archivo_editado = io.BytesIO()
-        wb.save(archivo_editado)
-        archivo_editado.seek(0)
-        
-        # 5. Actualizar archivo en Drive
-        media = MediaIoBaseUpload(
-            archivo_editado,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return generar_informe(
+            drive_service, plantilla_id, carpeta_destino_id, nombre_copia, datos_formulario,
+            mapa_celdas=MAPA_CELDAS_SERVICIO,
+            marcas=MARCAS_SERVICIO,
+            celdas_calculadas=CELDAS_CALCULADAS_SERVICIO,
         )
-        
-        resultado_final = drive_service.files().update(
-            fileId=copia_id,
-            media_body=media,
-            fields='id,name,webViewLink'
-        ).execute()
-        
-        return resultado_final, archivo_editado
-        
+
     except Exception as e:
         st.error(f"Error creando informe: {e}")
         # Mostrar más detalles para debugging
@@ -168,49 +77,6 @@ def crear_informe_completo(drive_service, plantilla_id, carpeta_destino_id, dato
         st.error(f"Detalles del error: {traceback.format_exc()}")
         return None, None
 
-# Función alternativa para debugging - inspeccionar celdas fusionadas
-def inspeccionar_plantilla(drive_service, plantilla_id):
-    """Función para inspeccionar qué celdas están fusionadas en la plantilla"""
-    try:
-        # Crear copia temporal
-        copy_metadata = {'name': 'temp_inspection'}
-        copia = drive_service.files().copy(fileId=plantilla_id, body=copy_metadata).execute()
-        copia_id = copia['id']
-        
-        # Descargar
-        request = drive_service.files().get_media(fileId=copia_id)
-        file_io = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_io, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        file_io.seek(0)
-        
-        # Inspeccionar
-        wb = openpyxl.load_workbook(file_io)
-        ws = wb.active
-        
-        st.write("### 🔍 Celdas fusionadas encontradas:")
-        for merged_range in ws.merged_cells.ranges:
-            st.write(f"- Rango fusionado: {merged_range}")
-            
-        # Eliminar copia temporal
-        drive_service.files().delete(fileId=copia_id).execute()
-        
-    except Exception as e:
-        st.error(f"Error inspeccionando plantilla: {e}")
-
-# Cargar datos desde Google Sheets
-@st.cache_data
-def cargar_datos():
-    info = st.secrets["google_service_account"]
-    scope = ['https://www.googleapis.com/auth/spreadsheets',
-             'https://www.googleapis.com/auth/drive']
-    credenciales = ServiceAccountCredentials.from_json_keyfile_dict(info, scope)
-    cliente = gspread.authorize(credenciales)
-    hoja = cliente.open("Base de datos").sheet1
-    datos = hoja.get_all_records()
-    return pd.DataFrame(datos)
 
 # FUNCIÓN PRINCIPAL
 def mostrar_informes_servicio_tecnico():
@@ -232,92 +98,20 @@ def mostrar_informes_servicio_tecnico():
         if st.button("Inspeccionar celdas fusionadas"):
             inspeccionar_plantilla(drive_service, PLANTILLA_ID)
 
-    # Cargar base de datos
-    df = cargar_datos()
+    # Índice del inventario compartido
+    indice = obtener_indice_equipos()
 
     # ============== SELECTOR DE EQUIPOS ==============
     st.markdown("### 🔍 Selección de Equipo")
     
-    equipos = []
-    for _, row in df.iterrows():
-        equipo = {
-            'codigo_nuevo': row.get('Codigo nuevo', ''),
-            'equipo': row.get('EQUIPO', ''),
-            'marca': row.get('MARCA', ''),
-            'modelo': row.get('MODELO', ''),
-            'serie': row.get('SERIE', ''),
-            'area': row.get('AREA', ''),
-            'ubicacion': row.get('UBICACION', ''),
-        }
-        equipos.append(equipo)
-
-    metodo_seleccion = st.radio(
-        "¿Cómo deseas seleccionar el equipo?",
-        ["🔍 Selector inteligente", "⌨️ Código manual"],
-        horizontal=True
-    )
-
-    marca = modelo = equipo_nombre = serie = codigo_equipo = ""
-    area_equipo = ubicacion_equipo = ""
-
-    if metodo_seleccion == "🔍 Selector inteligente":
-        areas_disponibles = sorted(list(set([eq['area'] for eq in equipos if eq['area']])))
-        area_filtro = st.selectbox("🏢 Filtrar por Área", ["Todas"] + areas_disponibles)
-        
-        equipos_filtrados = equipos
-        if area_filtro != "Todas":
-            equipos_filtrados = [eq for eq in equipos if eq['area'] == area_filtro]
-        
-        if equipos_filtrados:
-            opciones_equipos = []
-            for eq in equipos_filtrados:
-                opcion = f"{eq['codigo_nuevo']} - {eq['equipo']}"
-                if eq['area']:
-                    opcion += f" ({eq['area']})"
-                if eq['ubicacion']:
-                    opcion += f" - {eq['ubicacion']}"
-                opciones_equipos.append(opcion)
-            
-            equipo_seleccionado = st.selectbox("🔧 Seleccionar Equipo", opciones_equipos)
-            indice_equipo = opciones_equipos.index(equipo_seleccionado)
-            equipo_data = equipos_filtrados[indice_equipo]
-            
-            codigo_equipo = equipo_data['codigo_nuevo']
-            equipo_nombre = equipo_data['equipo']
-            marca = equipo_data['marca']
-            modelo = equipo_data['modelo']
-            serie = equipo_data['serie']
-            area_equipo = equipo_data['area']
-            ubicacion_equipo = equipo_data['ubicacion']
-            
-            with st.expander("🔍 Detalles del Equipo Seleccionado", expanded=True):
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.write(f"**🏷️ Código:** {codigo_equipo}")
-                    st.write(f"**⚙️ Equipo:** {equipo_nombre}")
-                    st.write(f"**🏭 Marca:** {marca}")
-                with col2:
-                    st.write(f"**📱 Modelo:** {modelo}")
-                    st.write(f"**🔢 Serie:** {serie}")
-                    st.write(f"**📍 Área:** {area_equipo}")
-        else:
-            st.warning("⚠️ No se encontraron equipos para el área seleccionada")
-    
-    else:  # Código manual
-        codigo_input = st.text_input("🔍 Ingrese el código del equipo (Ej: EQU-0000001)")
-        equipo_info = df[df["Codigo nuevo"] == codigo_input]
-        
-        if not equipo_info.empty:
-            equipo_row = equipo_info.iloc[0]
-            codigo_equipo = codigo_input
-            marca = equipo_row["MARCA"]
-            modelo = equipo_row["MODELO"]
-            equipo_nombre = equipo_row["EQUIPO"]
-            serie = equipo_row["SERIE"]
-            area_equipo = equipo_row.get("AREA", "")
-            ubicacion_equipo = equipo_row.get("UBICACION", "")
-            
-            st.success(f"✅ **Equipo encontrado:** {equipo_nombre}")
+    equipo_data = selector_equipo(indice) or {}
+    codigo_equipo = equipo_data.get('codigo_nuevo', '')
+    equipo_nombre = equipo_data.get('equipo', '')
+    marca = equipo_data.get('marca', '')
+    modelo = equipo_data.get('modelo', '')
+    serie = equipo_data.get('serie', '')
+    area_equipo = equipo_data.get('area', '')
+    ubicacion_equipo = equipo_data.get('ubicacion', '')
 
     # ============== RESTO DEL FORMULARIO ==============
     # [El resto del código del formulario se mantiene igual...]
@@ -459,7 +253,7 @@ def mostrar_informes_servicio_tecnico():
             resultado_final, archivo_editado = crear_informe_completo(
                 drive_service, 
                 PLANTILLA_ID, 
-                CARPETA_INFORMES_ID, 
+                carpeta_destino(drive_service, codigo_equipo, "Informes técnicos", CARPETA_INFORMES_ID), 
                 datos_formulario
             )
             
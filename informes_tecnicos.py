@@ -1,6 +1,6 @@
 import streamlit as st
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
+from drive_ejecutor import subir_archivo
 from oauth2client.service_account import ServiceAccountCredentials
 import gspread
 from reportlab.pdfgen import canvas
@@ -30,14 +30,10 @@ def subir_archivo_drive(pdf_buffer, nombre_archivo):
             'mimeType': 'application/pdf'
         }
 
-        pdf_buffer.seek(0)
-        media = MediaIoBaseUpload(pdf_buffer, mimetype='application/pdf')
-
-        file = drive_service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id'
-        ).execute()
+        file = subir_archivo(
+            drive_service, file_metadata, pdf_buffer, 'application/pdf',
+            operacion='subir_informe_pdf'
+        )
 
         return file.get('id')
 
@@ -0,0 +1,300 @@
+# inventario.py
+# Repositorio único del inventario de equipos (hoja "Base de datos").
+# Todas las sesiones del proceso comparten el mismo DataFrame en memoria,
+# respaldado por un snapshot en disco para los arranques en frío.
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+
+import streamlit as st
+import pandas as pd
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+from googleapiclient.discovery import build
+
+from cache_local import ruta_cache
+
+# ==========================
+# CONFIG
+# ==========================
+# Segundos que el inventario en memoria se considera vigente
+TTL_INVENTARIO = 300
+
+# Snapshot en disco para arrancar sin esperar a Google Sheets
+ARCHIVO_SNAPSHOT = "inventario.sqlite"
+
+# Columnas con pocos valores distintos: se guardan como categóricas
+COLUMNAS_CATEGORICAS = ["UPSS/UPS", "AREA", "AMBIENTE", "UBICACION", "MARCA", "EQUIPO"]
+
+
+# ==========================
+# AUTH / ESTADO COMPARTIDO
+# ==========================
+@st.cache_resource(show_spinner=False)
+def _credenciales():
+    """Credenciales de la cuenta de servicio"""
+    info = st.secrets["google_service_account"]
+    scope = ['https://www.googleapis.com/auth/spreadsheets',
+             'https://www.googleapis.com/auth/drive']
+    return ServiceAccountCredentials.from_json_keyfile_dict(info, scope)
+
+
+@st.cache_resource(show_spinner=False)
+def _cliente_sheets():
+    """Cliente de gspread compartido por todo el proceso"""
+    return gspread.authorize(_credenciales())
+
+
+@st.cache_resource(show_spinner=False)
+def _servicio_drive():
+    """Servicio de Drive usado solo para consultar metadatos de la hoja"""
+    return build('drive', 'v3', credentials=_credenciales(), cache_discovery=False)
+
+
+@st.cache_resource(show_spinner=False)
+def _estado_inventario():
+    """Estado del inventario compartido por todas las sesiones del proceso"""
+    return {
+        "df": None,                   # DataFrame tipado del inventario
+        "cargado_en": float("-inf"),  # time.monotonic() de la última carga válida
+        "actualizado": None,          # datetime de la última actualización (para la UI)
+        "version": 0,                 # se incrementa cada vez que cambian los datos
+        "datos": (None, 0),           # (df, version) publicados juntos en una sola asignación
+        "revision": None,             # versión de Drive de la hoja ya descargada
+        "invalidado": False,          # invalidación manual: la próxima lectura espera
+        "lock": threading.Lock(),     # protege solo el intercambio de los datos publicados
+        "carga": threading.Lock(),    # una sola revalidación (descarga) a la vez
+    }
+
+
+# ==========================
+# CARGA
+# ==========================
+def _normalizar_inventario(registros) -> pd.DataFrame:
+    """Convierte los registros de la hoja en un DataFrame de texto limpio"""
+    df = pd.DataFrame(registros)
+    if df.empty:
+        return df
+
+    df.columns = [str(c).strip() for c in df.columns]
+    df = df.fillna("").astype(str)
+    for columna in df.columns:
+        df[columna] = df[columna].str.strip().replace("nan", "")
+
+    for columna in COLUMNAS_CATEGORICAS:
+        if columna in df.columns:
+            df[columna] = df[columna].astype("category")
+
+    return df
+
+
+def _publicar(estado, df: pd.DataFrame):
+    """Reemplaza los datos en memoria; df y versión se publican juntos (con el lock tomado)"""
+    estado["df"] = df
+    estado["version"] += 1
+    estado["datos"] = (df, estado["version"])
+
+
+def _id_hoja_inventario() -> str:
+    """ID de la hoja de base de datos (desde secrets)"""
+    return st.secrets["google_sheets"]["base_datos_id"]
+
+
+def _revision_remota(servicio_drive, hoja_id: str) -> str:
+    """
+    Consulta solo los metadatos de la hoja en Drive (petición de pocos bytes).
+    Devuelve el número de versión, que cambia con cualquier edición.
+    """
+    meta = servicio_drive.files().get(
+        fileId=hoja_id,
+        fields="version,modifiedTime",
+        supportsAllDrives=True,
+    ).execute()
+    return str(meta.get("version") or meta.get("modifiedTime"))
+
+
+def _descargar_inventario(cliente, hoja_id: str) -> pd.DataFrame:
+    """Descarga la hoja completa de base de datos"""
+    hoja = cliente.open_by_key(hoja_id).sheet1
+    # Sin conversión numérica: las series y códigos conservan sus ceros a la izquierda
+    datos = hoja.get_all_records(numericise_ignore=["all"])
+    return _normalizar_inventario(datos)
+
+
+# ==========================
+# SNAPSHOT EN DISCO
+# ==========================
+def _guardar_snapshot(df: pd.DataFrame, revision: str, actualizado: datetime):
+    """Guarda el inventario en SQLite de forma atómica (archivo temporal + rename)"""
+    ruta = ruta_cache(ARCHIVO_SNAPSHOT)
+    ruta_tmp = f"{ruta}.tmp"
+    if os.path.exists(ruta_tmp):
+        os.remove(ruta_tmp)
+
+    conn = sqlite3.connect(ruta_tmp)
+    try:
+        df.astype(str).to_sql("inventario", conn, index=False)
+        conn.execute("CREATE TABLE meta (clave TEXT PRIMARY KEY, valor TEXT)")
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [("revision", revision), ("actualizado", actualizado.isoformat())],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(ruta_tmp, ruta)
+
+
+def _leer_snapshot():
+    """Devuelve (df, revision, actualizado) del snapshot en disco, o None si no hay"""
+    ruta = ruta_cache(ARCHIVO_SNAPSHOT)
+    if not os.path.exists(ruta):
+        return None
+
+    conn = sqlite3.connect(ruta)
+    try:
+        df = pd.read_sql("SELECT * FROM inventario", conn)
+        meta = dict(conn.execute("SELECT clave, valor FROM meta").fetchall())
+    finally:
+        conn.close()
+    return _normalizar_inventario(df), meta.get("revision"), datetime.fromisoformat(meta["actualizado"])
+
+
+# ==========================
+# REVALIDACIÓN
+# ==========================
+def _refrescar(estado, cliente, servicio_drive, hoja_id: str, forzar: bool):
+    """
+    Actualiza el estado contra la hoja remota. Debe llamarse con estado["carga"]
+    tomado; la consulta y la descarga se hacen sin el lock de los datos, que se
+    toma solo para publicar el resultado (los lectores no esperan a la red).
+    - Primero se consulta la versión de la hoja en Drive; si no cambió, se
+      reutilizan los datos en memoria sin descargar nada.
+    - forzar=True descarga la hoja completa sin consultar la versión.
+    - Si la actualización falla y hay una copia previa, se sigue sirviendo la copia.
+    """
+    try:
+        revision = _revision_remota(servicio_drive, hoja_id)
+        if estado["df"] is not None and not forzar and revision == estado["revision"]:
+            # Sin cambios en la hoja: solo se renueva el TTL
+            with estado["lock"]:
+                estado["cargado_en"] = time.monotonic()
+                estado["actualizado"] = datetime.now()
+            return
+
+        # Drive no informa qué celdas cambiaron, así que una hoja modificada
+        # se vuelve a leer completa en una sola petición de valores
+        df = _descargar_inventario(cliente, hoja_id)
+    except Exception as e:
+        if estado["df"] is None:
+            raise
+        # Reintentar recién al vencer de nuevo el TTL para no agotar la cuota
+        print(f"No se pudo actualizar el inventario, se usa la copia en memoria: {e}")
+        with estado["lock"]:
+            estado["cargado_en"] = time.monotonic()
+        return
+
+    actualizado = datetime.now()
+    with estado["lock"]:
+        _publicar(estado, df)
+        estado["revision"] = revision
+        estado["cargado_en"] = time.monotonic()
+        estado["actualizado"] = actualizado
+
+    try:
+        _guardar_snapshot(df, revision, actualizado)
+    except Exception as e:
+        print(f"No se pudo guardar el snapshot del inventario: {e}")
+
+
+def _revalidar_en_segundo_plano(estado):
+    """Lanza (una sola vez a la vez) la revalidación del inventario en otro hilo"""
+    # Si ya hay una carga en curso no se espera: se siguen sirviendo los datos actuales
+    if not estado["carga"].acquire(blocking=False):
+        return
+
+    # Los recursos se resuelven en el hilo de Streamlit antes de lanzar el hilo;
+    # si fallan, la carga se libera para que la próxima lectura vuelva a intentarlo
+    try:
+        cliente, servicio_drive, hoja_id = _cliente_sheets(), _servicio_drive(), _id_hoja_inventario()
+    except Exception as e:
+        estado["carga"].release()
+        print(f"Error revalidando el inventario en segundo plano: {e}")
+        return
+
+    def tarea():
+        try:
+            _refrescar(estado, cliente, servicio_drive, hoja_id, forzar=False)
+        except Exception as e:
+            print(f"Error revalidando el inventario en segundo plano: {e}")
+        finally:
+            estado["carga"].release()
+
+    try:
+        threading.Thread(target=tarea, name="revalidar-inventario", daemon=True).start()
+    except Exception:
+        estado["carga"].release()
+        raise
+
+
+def obtener_inventario_versionado(forzar: bool = False) -> Tuple[pd.DataFrame, int]:
+    """
+    Devuelve (DataFrame compartido del inventario, versión de esos datos)
+    leídos juntos, con la estrategia stale-while-revalidate:
+    - Mientras el TTL esté vigente no se hace ninguna petición.
+    - Al arrancar el proceso se sirve el snapshot en disco si existe.
+    - Con datos vencidos se devuelven los datos actuales y se revalidan en
+      segundo plano; solo se bloquea si no hay datos, si se invalidó
+      explícitamente o con forzar=True (descarga completa).
+    El DataFrame es compartido: no debe modificarse en el lugar.
+    """
+    estado = _estado_inventario()
+
+    if estado["df"] is None:
+        with estado["lock"]:
+            if estado["df"] is None:
+                try:
+                    snapshot = _leer_snapshot()
+                except Exception as e:
+                    print(f"No se pudo leer el snapshot del inventario: {e}")
+                    snapshot = None
+                if snapshot is not None:
+                    df, estado["revision"], estado["actualizado"] = snapshot
+                    _publicar(estado, df)
+
+    vencido = time.monotonic() - estado["cargado_en"] > TTL_INVENTARIO
+    if estado["df"] is not None and not forzar and not estado["invalidado"]:
+        if vencido:
+            _revalidar_en_segundo_plano(estado)
+        return estado["datos"]
+
+    cliente, servicio_drive, hoja_id = _cliente_sheets(), _servicio_drive(), _id_hoja_inventario()
+    with estado["carga"]:
+        # Otra sesión pudo haber recargado mientras se esperaba la carga en curso
+        vigente = time.monotonic() - estado["cargado_en"] <= TTL_INVENTARIO
+        if estado["df"] is not None and not forzar and not estado["invalidado"] and vigente:
+            return estado["datos"]
+        _refrescar(estado, cliente, servicio_drive, hoja_id, forzar=forzar)
+        estado["invalidado"] = False
+        return estado["datos"]
+
+
+def obtener_inventario(forzar: bool = False) -> pd.DataFrame:
+    """DataFrame compartido del inventario (ver obtener_inventario_versionado)"""
+    return obtener_inventario_versionado(forzar)[0]
+
+
+def invalidar_inventario():
+    """Marca el inventario como vencido; la próxima lectura espera a revalidarlo"""
+    estado = _estado_inventario()
+    with estado["lock"]:
+        estado["cargado_en"] = float("-inf")
+        estado["invalidado"] = True
+
+
+def ultima_actualizacion() -> Optional[datetime]:
+    """Fecha y hora de la última carga del inventario (None si aún no se cargó)"""
+    return _estado_inventario()["actualizado"]
@@ -13,7 +13,7 @@ from reportes import mostrar_modulo_reportes
 from rendimiento_equipo import mostrar_rendimiento_equipo
 from informes_servicio_tecnico import mostrar_informes_servicio_tecnico 
 from prueba_seguridad_electrica import mostrar_pruebas_seguridad_electrica
-from creador_carpetas import crear_nueva_carpeta, obtener_ultimo_codigo, crear_subcarpetas
+from creador_carpetas import obtener_ultimo_codigo, reservar_codigos_carpetas, crear_carpetas_equipos
 from ficha_tecnica import mostrar_fichas_tecnicas
 from informe_mal_uso import mostrar_informes_mal_uso
 #st.set_page_config(page_title="Sistema de Inventario - IC", layout="wide")
@@ -720,17 +720,35 @@ elif menu == "Fichas Técnicas":
 elif menu == "Crear Carpeta":
     st.subheader("Crear nueva carpeta de equipo médico")
 
-    if st.button("➕ Crear Carpeta", use_container_width=True):
-        nuevo_codigo = obtener_ultimo_codigo()
-        if nuevo_codigo:
-            carpeta_id = crear_nueva_carpeta(nuevo_codigo)
-            if carpeta_id:
-                crear_subcarpetas(carpeta_id)
-                st.success(f"✅ Carpeta {nuevo_codigo} creada con subcarpetas.")
+    proximo_codigo = obtener_ultimo_codigo()
+    if proximo_codigo:
+        st.info(f"**Próximo código:** {proximo_codigo}")
+    cantidad = st.number_input("Cantidad de carpetas a crear", min_value=1, max_value=100, value=1, step=1)
+
+    if st.button("➕ Crear Carpeta" if cantidad == 1 else f"➕ Crear {cantidad} Carpetas", use_container_width=True):
+        codigos = reservar_codigos_carpetas(int(cantidad))
+        if not codigos:
+            st.error("⚠️ No se pudo obtener el último código.")
+        elif cantidad == 1:
+            nuevo_codigo = codigos[0]
+            creadas = crear_carpetas_equipos(codigos)
+            if nuevo_codigo in creadas:
+                st.success(f"✅ Carpeta {nuevo_codigo} creada con {len(creadas[nuevo_codigo]['subcarpetas'])} subcarpetas.")
             else:
                 st.error("❌ No se pudo crear la carpeta principal.")
         else:
-            st.error("⚠️ No se pudo obtener el último código.")
+            with st.spinner(f"Creando {len(codigos)} carpetas..."):
+                creadas = crear_carpetas_equipos(codigos)
+
+            if creadas:
+                st.success(f"✅ {len(creadas)} de {len(codigos)} carpetas creadas ({codigos[0]} a {codigos[-1]}).")
+                st.dataframe(
+                    [{'Código': codigo, 'Subcarpetas': len(datos['subcarpetas'])} for codigo, datos in creadas.items()],
+                    use_container_width=True, hide_index=True
+                )
+            faltantes = [codigo for codigo in codigos if codigo not in creadas]
+            if faltantes:
+                st.error(f"❌ No se pudieron crear: {', '.join(faltantes)}")
 
 elif menu == "Gestión Pasantes":
     st.title("👥 Gestión de Pasantes")
@@ -0,0 +1,319 @@
+# motor_informes.py
+# Motor común para los informes Excel basados en plantillas de Drive.
+# Cada módulo describe QUÉ escribir (mapa de celdas); aquí se resuelve CÓMO
+# (plantilla en caché local, edición con openpyxl y subida a Drive).
+import io
+import json
+import os
+import threading
+import time
+import weakref
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import streamlit as st
+import openpyxl
+from openpyxl.styles import Font
+
+from cache_local import ruta_cache
+from drive_ejecutor import descargar_en, ejecutar, subir_archivo
+
+MIME_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+MIME_GOOGLE_SHEETS = 'application/vnd.google-apps.spreadsheet'
+
+# Segundos durante los que una plantilla en caché se usa sin consultar Drive
+TTL_PLANTILLA = 60
+
+# Carpeta de la caché local donde se guardan las plantillas descargadas
+DIRECTORIO_PLANTILLAS = "plantillas"
+
+
+def fuente_informe() -> Font:
+    """Fuente estándar de los informes"""
+    return Font(name="Albert Sans", size=8)
+
+
+# ==========================
+# ESCRITURA EN CELDAS
+# ==========================
+# Mapa celda -> rango fusionado por hoja (se libera junto con la hoja)
+_FUSIONADAS_POR_HOJA = weakref.WeakKeyDictionary()
+
+
+def _mapa_fusionadas(ws) -> Dict[Tuple[int, int], object]:
+    """
+    (fila, columna) -> rango fusionado que contiene la celda.
+    Se construye una vez por hoja y se rehace si cambian los rangos (no solo
+    su cantidad: separar un rango y fusionar otro la deja igual).
+    Ante rangos superpuestos gana el primero, igual que al recorrerlos en orden.
+    """
+    rangos = ws.merged_cells.ranges
+    firma = tuple(str(merged_range) for merged_range in rangos)
+    guardado = _FUSIONADAS_POR_HOJA.get(ws)
+    if guardado is not None and guardado[0] == firma:
+        return guardado[1]
+
+    mapa = {}
+    for merged_range in rangos:
+        for fila in range(merged_range.min_row, merged_range.max_row + 1):
+            for columna in range(merged_range.min_col, merged_range.max_col + 1):
+                mapa.setdefault((fila, columna), merged_range)
+    _FUSIONADAS_POR_HOJA[ws] = (firma, mapa)
+    return mapa
+
+
+# Función para escribir en celdas de forma segura
+def escribir_celda_segura(ws, celda, valor, fuente=None, estricto=False):
+    """
+    Escribe en una celda manejando celdas fusionadas.
+    Un error se muestra como aviso; con estricto=True se propaga (p. ej. en los
+    hilos de un lote, donde st.warning no llega a la página).
+    """
+    try:
+        cell = ws[celda]
+        if hasattr(cell, 'coordinate'):
+            # Si la celda es parte de un rango fusionado, usar la celda superior izquierda
+            merged_range = _mapa_fusionadas(ws).get((cell.row, cell.column))
+            if merged_range is not None:
+                top_left = merged_range.start_cell
+                top_left.value = valor
+                if fuente:
+                    top_left.font = fuente
+                return
+
+        # No está fusionada, escribir normalmente
+        cell.value = valor
+        if fuente:
+            cell.font = fuente
+
+    except Exception as e:
+        if estricto:
+            raise ValueError(f"No se pudo escribir en la celda {celda}: {e}") from e
+        st.warning(f"No se pudo escribir en la celda {celda}: {e}")
+
+
+def marcar_opcion(ws, celdas_por_opcion: Dict[str, str], seleccion, fuente=None, marca="X", estricto=False):
+    """Limpia todas las casillas de opción y marca con X la seleccionada"""
+    for celda in celdas_por_opcion.values():
+        escribir_celda_segura(ws, celda, "", fuente, estricto)
+
+    if seleccion in celdas_por_opcion:
+        escribir_celda_segura(ws, celdas_por_opcion[seleccion], marca, fuente, estricto)
+
+
+def si_tiene_valor(campo: str, formato: Optional[str] = None) -> Callable[[Dict], object]:
+    """Para celdas calculadas: escribe el campo (con formato, si se indica) solo si tiene valor"""
+    def calcular(datos):
+        if not datos.get(campo):
+            return None
+        return datos[campo] if formato is None else formato.format(datos[campo])
+    return calcular
+
+
+def llenar_plantilla(ws, datos: Dict, mapa_celdas: Optional[Dict[str, str]] = None,
+                     marcas: Optional[Dict[str, Dict[str, str]]] = None,
+                     celdas_calculadas: Iterable[Tuple[str, Callable]] = (),
+                     fuente=None, estricto: bool = False):
+    """
+    Llena una hoja a partir de una descripción declarativa:
+    - mapa_celdas: campo -> celda (se escribe datos[campo])
+    - marcas: campo -> {opción: celda} (casillas marcadas con X)
+    - celdas_calculadas: [(celda, función(datos))]; si la función devuelve None no se escribe
+    Las marcas se escriben antes que los valores (como los informes originales):
+    si una casilla cae en un rango fusionado con un valor, el valor prevalece.
+    estricto=True propaga el primer error de escritura en lugar de avisarlo.
+    """
+    for campo, celdas_por_opcion in (marcas or {}).items():
+        marcar_opcion(ws, celdas_por_opcion, datos.get(campo), fuente, estricto=estricto)
+
+    for campo, celda in (mapa_celdas or {}).items():
+        escribir_celda_segura(ws, celda, datos.get(campo, ''), fuente, estricto)
+
+    for celda, calcular in celdas_calculadas:
+        valor = calcular(datos)
+        if valor is not None:
+            escribir_celda_segura(ws, celda, valor, fuente, estricto)
+
+
+# ==========================
+# CACHÉ DE PLANTILLAS
+# ==========================
+@st.cache_resource(show_spinner=False)
+def _estado_plantillas():
+    """
+    Plantillas en memoria compartidas por todas las sesiones: id -> datos.
+    'lock' solo protege los diccionarios; cada plantilla tiene su propio lock
+    para que la descarga de una no haga esperar a los informes de las demás.
+    """
+    return {"plantillas": {}, "locks": {}, "lock": threading.Lock()}
+
+
+def _lock_plantilla(estado, plantilla_id: str) -> threading.Lock:
+    with estado["lock"]:
+        return estado["locks"].setdefault(plantilla_id, threading.Lock())
+
+
+def _rutas_plantilla(plantilla_id: str) -> Tuple[str, str]:
+    """Rutas en disco del contenido y de los metadatos de una plantilla"""
+    return (ruta_cache(DIRECTORIO_PLANTILLAS, f"{plantilla_id}.xlsx"),
+            ruta_cache(DIRECTORIO_PLANTILLAS, f"{plantilla_id}.json"))
+
+
+def _firma_plantilla(meta: Dict) -> str:
+    """md5Checksum para archivos subidos; modifiedTime para hojas nativas de Google (sin md5)"""
+    return meta.get('md5Checksum') or meta.get('modifiedTime') or ''
+
+
+def _leer_plantilla_disco(plantilla_id: str) -> Optional[Dict]:
+    """Plantilla guardada en disco o None"""
+    ruta_xlsx, ruta_meta = _rutas_plantilla(plantilla_id)
+    if not (os.path.exists(ruta_xlsx) and os.path.exists(ruta_meta)):
+        return None
+    with open(ruta_meta, encoding='utf-8') as f:
+        meta = json.load(f)
+    with open(ruta_xlsx, 'rb') as f:
+        contenido = f.read()
+    return {'contenido': contenido, 'firma': meta['firma'], 'mime_type': meta['mime_type']}
+
+
+def _guardar_plantilla_disco(plantilla_id: str, entrada: Dict):
+    """Guarda la plantilla en disco de forma atómica (archivo temporal + rename)"""
+    ruta_xlsx, ruta_meta = _rutas_plantilla(plantilla_id)
+    with open(f"{ruta_xlsx}.tmp", 'wb') as f:
+        f.write(entrada['contenido'])
+    os.replace(f"{ruta_xlsx}.tmp", ruta_xlsx)
+    with open(f"{ruta_meta}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({'firma': entrada['firma'], 'mime_type': entrada['mime_type']}, f)
+    os.replace(f"{ruta_meta}.tmp", ruta_meta)
+
+
+def _descargar_xlsx(drive_service, file_id: str, mime_type: str) -> bytes:
+    """Descarga un archivo de Drive como .xlsx (exporta si es Google Sheets)"""
+    if mime_type == MIME_GOOGLE_SHEETS:
+        request = drive_service.files().export_media(fileId=file_id, mimeType=MIME_XLSX)
+    else:
+        request = drive_service.files().get_media(fileId=file_id)
+
+    file_io = io.BytesIO()
+    descargar_en(request, file_io, operacion='descargar_plantilla')
+    return file_io.getvalue()
+
+
+def obtener_plantilla(drive_service, plantilla_id: str) -> Tuple[bytes, str]:
+    """
+    Devuelve (contenido .xlsx, mimeType en Drive) de una plantilla.
+    - Dentro de TTL_PLANTILLA se usa la copia en memoria sin consultar Drive.
+    - Luego se consultan solo los metadatos; la plantilla se vuelve a descargar
+      únicamente si cambió su md5Checksum/modifiedTime.
+    - Si Drive no responde y hay copia local, se usa la copia.
+    """
+    estado = _estado_plantillas()
+    with _lock_plantilla(estado, plantilla_id):
+        entrada = estado["plantillas"].get(plantilla_id)
+        if entrada is None:
+            try:
+                entrada = _leer_plantilla_disco(plantilla_id)
+            except Exception as e:
+                print(f"No se pudo leer la plantilla {plantilla_id} de la caché local: {e}")
+            if entrada is not None:
+                entrada['verificada_en'] = float("-inf")
+                with estado["lock"]:
+                    estado["plantillas"][plantilla_id] = entrada
+
+        if entrada is not None and time.monotonic() - entrada['verificada_en'] < TTL_PLANTILLA:
+            return entrada['contenido'], entrada['mime_type']
+
+        try:
+            meta = ejecutar(lambda: drive_service.files().get(
+                fileId=plantilla_id,
+                fields='id,mimeType,md5Checksum,modifiedTime'
+            ).execute(), 'revalidar_plantilla')
+        except Exception as e:
+            if entrada is None:
+                raise
+            print(f"No se pudo revalidar la plantilla {plantilla_id}, se usa la copia local: {e}")
+            entrada['verificada_en'] = time.monotonic()
+            return entrada['contenido'], entrada['mime_type']
+
+        firma = _firma_plantilla(meta)
+        if entrada is None or entrada['firma'] != firma:
+            entrada = {
+                'contenido': _descargar_xlsx(drive_service, plantilla_id, meta['mimeType']),
+                'firma': firma,
+                'mime_type': meta['mimeType'],
+            }
+            try:
+                _guardar_plantilla_disco(plantilla_id, entrada)
+            except Exception as e:
+                print(f"No se pudo guardar la plantilla {plantilla_id} en la caché local: {e}")
+
+        entrada['verificada_en'] = time.monotonic()
+        with estado["lock"]:
+            estado["plantillas"][plantilla_id] = entrada
+        return entrada['contenido'], entrada['mime_type']
+
+
+# ==========================
+# GENERACIÓN
+# ==========================
+def generar_informe(drive_service, plantilla_id: str, carpeta_destino_id: str, nombre_archivo: str,
+                    datos: Dict, mapa_celdas: Optional[Dict[str, str]] = None,
+                    marcas: Optional[Dict[str, Dict[str, str]]] = None,
+                    celdas_calculadas: Iterable[Tuple[str, Callable]] = (),
+                    personalizar: Optional[Callable] = None,
+                    plantilla: Optional[Tuple[bytes, str]] = None,
+                    estricto: bool = False):
+    """
+    Genera un informe a partir de una plantilla de Drive y lo guarda en carpeta_destino_id.
+    La plantilla se llena desde la caché local y el informe se crea con una sola
+    subida (si la plantilla es una hoja de Google, Drive convierte el archivo al mismo tipo).
+    personalizar(ws, datos, fuente) permite pasos propios del módulo (p. ej. imágenes).
+    plantilla=(contenido, mimeType) evita consultar la caché (p. ej. desde hilos de un lote).
+    estricto=True hace fallar el informe si no se puede escribir una celda
+    (desde hilos de un lote, donde los avisos de Streamlit no se ven).
+    Devuelve (resultado_final, archivo_editado). Los errores se propagan al llamador.
+    """
+    # 1. Plantilla desde la caché local
+    contenido, mime_plantilla = plantilla or obtener_plantilla(drive_service, plantilla_id)
+
+    # 2. Editar el archivo Excel con los datos
+    wb = openpyxl.load_workbook(io.BytesIO(contenido))
+    ws = wb.active
+    fuente = fuente_informe()
+    llenar_plantilla(ws, datos, mapa_celdas, marcas, celdas_calculadas, fuente, estricto)
+    if personalizar:
+        personalizar(ws, datos, fuente)
+
+    # 3. Guardar archivo editado
+    archivo_editado = io.BytesIO()
+    wb.save(archivo_editado)
+    archivo_editado.seek(0)
+
+    # 4. Crear el informe en Drive (metadatos + contenido en una sola petición)
+    metadata = {'name': nombre_archivo, 'parents': [carpeta_destino_id]}
+    if mime_plantilla == MIME_GOOGLE_SHEETS:
+        metadata['mimeType'] = MIME_GOOGLE_SHEETS
+    resultado_final = subir_archivo(
+        drive_service, metadata, archivo_editado, MIME_XLSX,
+        fields='id,name,webViewLink', operacion='crear_informe'
+    )
+
+    archivo_editado.seek(0)
+    return resultado_final, archivo_editado
+
+
+# Función alternativa para debugging - inspeccionar celdas fusionadas
+def inspeccionar_plantilla(drive_service, plantilla_id):
+    """Función para inspeccionar qué celdas están fusionadas en la plantilla"""
+    try:
+        contenido, _ = obtener_plantilla(drive_service, plantilla_id)
+
+        # Inspeccionar
+        wb = openpyxl.load_workbook(io.BytesIO(contenido))
+        ws = wb.active
+
+        st.write("### 🔍 Celdas fusionadas encontradas:")
+        for merged_range in ws.merged_cells.ranges:
+            st.write(f"- Rango fusionado: {merged_range}")
+
+    except Exception as e:
+        st.error(f"Error inspeccionando plantilla: {e}")
@@ -3,249 +3,369 @@ import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime, time
-import openpyxl
-from openpyxl.styles import Font
-import io
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+from indice_equipos import obtener_indice_equipos, selector_equipo, buscar_por_codigo, buscar_por_serie
+from drive_ejecutor import procesar_lote, servicio_hilo
+from motor_informes import generar_informe, inspeccionar_plantilla, obtener_plantilla, si_tiene_valor
+from indice_carpetas import carpeta_destino, carpetas_destino
 
-# Configurar Google Drive API
 @st.cache_resource
-def configurar_drive_api():
-    """Configura la API de Google Drive"""
+def _credenciales_drive():
+    """Credenciales de la cuenta de servicio"""
     info = st.secrets["google_service_account"]
     scope = [
         'https://www.googleapis.com/auth/spreadsheets',
         'https://www.googleapis.com/auth/drive'
     ]
-    credenciales = ServiceAccountCredentials.from_json_keyfile_dict(info, scope)
-    drive_service = build('drive', 'v3', credentials=credenciales)
+    return ServiceAccountCredentials.from_json_keyfile_dict(info, scope)
+
+
+# Configurar Google Drive API
+@st.cache_resource
+def configurar_drive_api():
+    """Configura la API de Google Drive"""
+    drive_service = build('drive', 'v3', credentials=_credenciales_drive())
     return drive_service
 
 
-# Función para escribir en celdas de forma segura
-def escribir_celda_segura(ws, celda, valor, fuente=None):
-    """Escribe en una celda manejando celdas fusionadas"""
-    try:
-        # Verificar si la celda está fusionada
-        cell = ws[celda]
-        if hasattr(cell, 'coordinate'):
-            # Buscar si esta celda es parte de un rango fusionado
-            for merged_range in ws.merged_cells.ranges:
-                if cell.coordinate in merged_range:
-                    # Es una celda fusionada, usar la celda superior izquierda
-                    top_left = merged_range.start_cell
-                    top_left.value = valor
-                    if fuente:
-                        top_left.font = fuente
-                    return
-        
-        # No está fusionada, escribir normalmente
-        cell.value = valor
-        if fuente:
-            cell.font = fuente
-            
-    except Exception as e:
-        st.warning(f"No se pudo escribir en la celda {celda}: {e}")
+# Mapeo específico para la plantilla según la transcripción (campo del formulario -> celda)
+MAPA_CELDAS_SEGURIDAD = {
+    # Información del equipo y la institución
+    'institucion': "D6",         # Institución
+    'sede': "D7",                # Sede
+    'equipo_nombre': "D8",       # Equipo
+    'modelo': "D9",              # Modelo
+    'serie': "D10",              # Serie
+    'codigo_activo': "D11",      # Código Activo
+
+    # Fechas
+    'fecha_recepcion': "D13",    # Fecha de recepción
+    'fecha_mediciones': "D14",   # Fecha de las mediciones
+
+    # Condiciones ambientales
+    'temperatura_inicial': "E19",
+    'temperatura_final': "F19",
+    'humedad_inicial': "E20",
+    'humedad_final': "F20",
+
+    # Datos del patrón
+    'patron_marca': "E24",
+    'patron_modelo': "E25",
+    'patron_serie': "E26",
+    'patron_fecha_calibracion': "E27",
+    'patron_proxima_calibracion': "E28",
 
+    # Observaciones
+    'observaciones': "B70",
+}
+
+# Prueba de resistencia en protección a tierra (filas 36 a 40)
+PUNTOS_TIERRA = ['EQUIPOTENCIAL', 'LADO 1', 'LADO 2', 'LADO 3', 'LADO 4']
+
+# Prueba de corriente de fuga de chasis: condición de falla -> fila
+CONDICIONES_FUGA = [
+    ('pd_cc', 48),  # Polaridad Directa - Cerrado Cerrado
+    ('pd_ca', 49),  # Polaridad Directa - Cerrado Abierto
+    ('pd_ac', 50),  # Polaridad Directa - Abierto Cerrado
+    ('pd_aa', 51),  # Polaridad Directa - Abierto Abierto
+    ('pi_cc', 52),  # Polaridad Inversa - Cerrado Cerrado
+    ('pi_ca', 53),  # Polaridad Inversa - Cerrado Abierto
+    ('pi_ac', 54),  # Polaridad Inversa - Abierto Cerrado
+    ('pi_aa', 55),  # Polaridad Inversa - Abierto Abierto
+]
+
+# Prueba de corriente de fuga a tierra: estado de operación -> fila
+ESTADOS_OPERACION = [
+    ('detenido_directa', 62),
+    ('detenido_inversa', 63),
+    ('funcionamiento_directa', 64),
+    ('funcionamiento_inversa', 65)
+]
+
+
+# Subcarpeta estándar del equipo donde se guardan sus informes
+SUBCARPETA_INFORMES = "Prueba de seguridad"
+
+
+def _filas_mediciones():
+    """(prefijo del campo, fila de la plantilla) de cada prueba"""
+    filas = [(f"tierra_{punto.lower().replace(' ', '')}", 36 + i) for i, punto in enumerate(PUNTOS_TIERRA)]
+    filas += [(f"fuga_chasis_{cond}", fila) for cond, fila in CONDICIONES_FUGA]
+    filas += [(f"fuga_tierra_{estado}", fila) for estado, fila in ESTADOS_OPERACION]
+    return filas
+
+
+def _celdas_mediciones():
+    """Celdas de los 5 valores de medición de cada prueba (solo se escriben si tienen valor)"""
+    celdas = []
+    for prefijo, fila in _filas_mediciones():
+        for j in range(5):
+            col = chr(67 + j)  # C, D, E, F, G (comenzando desde columna C)
+            celdas.append((f"{col}{fila}", si_tiene_valor(f"{prefijo}_valor{j+1}")))
+    return celdas
+
+
+CELDAS_MEDICIONES = _celdas_mediciones()
+
+# Campos de medición (mismos nombres que las columnas del archivo de lote)
+CAMPOS_MEDICIONES = [f"{prefijo}_valor{j+1}" for prefijo, _ in _filas_mediciones() for j in range(5)]
+
+
+def _nombre_informe(datos_formulario):
+    """Nombre del archivo del informe en Drive"""
+    return f"Prueba_Seguridad_Electrica_{datos_formulario['codigo_activo']}_{datos_formulario['fecha_mediciones'].replace('/', '')}"
 
 
 # Función para crear informe de prueba de seguridad eléctrica
 def crear_informe_seguridad_electrica(drive_service, plantilla_id, carpeta_destino_id, datos_formulario):
     """Crea copia de plantilla de seguridad eléctrica, llena datos y sube archivo final a Drive"""
     try:
-        # 1. Crear copia de la plantilla
-        nombre_copia = f"Prueba_Seguridad_Electrica_{datos_formulario['codigo_activo']}_{datos_formulario['fecha_mediciones'].replace('/', '')}"
-        copy_metadata = {
-            'name': nombre_copia,
-            'parents': [carpeta_destino_id]
-        }
-        
-        copia = drive_service.files().copy(
-            fileId=plantilla_id,
-            body=copy_metadata,
-            fields='id,name,webViewLink'
-        ).execute()
-        
-        copia_id = copia['id']
-        
-        # 2. Descargar la copia para editar
-        file_metadata = drive_service.files().get(fileId=copia_id, fields='mimeType').execute()
-        mime_type = file_metadata.get('mimeType')
-        
-        if mime_type == 'application/vnd.google-apps.spreadsheet':
-            request = drive_service.files().export_media(
-                fileId=copia_id,
-                mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        else:
-            request = drive_service.files().get_media(fileId=copia_id)
-        
-        file_io = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_io, request)
-        
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-        
-        file_io.seek(0)
-        
-        # 3. Editar el archivo Excel con los datos
-        wb = openpyxl.load_workbook(file_io)
-        ws = wb.active
-        fuente = Font(name="Albert Sans", size=8)
-
-        # Mapeo específico para la plantilla según la transcripción
-        # Información del equipo y la institución
-        escribir_celda_segura(ws, "D6", datos_formulario['institucion'], fuente)  # Institución
-        escribir_celda_segura(ws, "D7", datos_formulario['sede'], fuente)  # Sede
-        escribir_celda_segura(ws, "D8", datos_formulario['equipo_nombre'], fuente)  # Equipo
-        escribir_celda_segura(ws, "D9", datos_formulario['modelo'], fuente)  # Modelo
-        escribir_celda_segura(ws, "D10", datos_formulario['serie'], fuente)  # Serie
-        escribir_celda_segura(ws, "D11", datos_formulario['codigo_activo'], fuente)  # Código Activo
-        
-        # Fechas
-        escribir_celda_segura(ws, "D13", datos_formulario['fecha_recepcion'], fuente)  # Fecha de recepción
-        escribir_celda_segura(ws, "D14", datos_formulario['fecha_mediciones'], fuente)  # Fecha de las mediciones
-
-        # Condiciones ambientales
-        escribir_celda_segura(ws, "E19", datos_formulario['temperatura_inicial'], fuente)  # Temperatura inicial
-        escribir_celda_segura(ws, "F19", datos_formulario['temperatura_final'], fuente)  # Temperatura final
-        escribir_celda_segura(ws, "E20", datos_formulario['humedad_inicial'], fuente)  # Humedad inicial
-        escribir_celda_segura(ws, "F20", datos_formulario['humedad_final'], fuente)  # Humedad final
-
-        # Datos del patrón
-        escribir_celda_segura(ws, "E24", datos_formulario['patron_marca'], fuente)  # Marca patrón
-        escribir_celda_segura(ws, "E25", datos_formulario['patron_modelo'], fuente)  # Modelo patrón
-        escribir_celda_segura(ws, "E26", datos_formulario['patron_serie'], fuente)  # Serie patrón
-        escribir_celda_segura(ws, "E27", datos_formulario['patron_fecha_calibracion'], fuente)  # Fecha calibración
-        escribir_celda_segura(ws, "E28", datos_formulario['patron_proxima_calibracion'], fuente)  # Próxima calibración
-
-        # Prueba de resistencia en protección a tierra
-        
-        puntos_tierra = ['EQUIPOTENCIAL', 'LADO 1', 'LADO 2', 'LADO 3', 'LADO 4']
-        
-        for i, punto in enumerate(puntos_tierra):
-            fila = 36 + i  # Comenzando por la fila 36 hasta la 40
-            
-            # Llenar los 5 valores de medición para cada punto
-            for j in range(5):
-                col = chr(67 + j)  # D, E, F, G, H (comenzando desde columna D)
-                key = f"tierra_{punto.lower().replace(' ', '')}_valor{j+1}"
-                
-                if key in datos_formulario and datos_formulario[key]:
-                    escribir_celda_segura(ws, f"{col}{fila}", datos_formulario[key], fuente)
-
-        # Prueba de corriente de fuga de chasis
-        # Mapeo de las condiciones de falla según la estructura del documento
-        condiciones_fuga = [
-            ('pd_cc', 48),  # Polaridad Directa - Cerrado Cerrado
-            ('pd_ca', 49),  # Polaridad Directa - Cerrado Abierto
-            ('pd_ac', 50),  # Polaridad Directa - Abierto Cerrado
-            ('pd_aa', 51),  # Polaridad Directa - Abierto Abierto
-            ('pi_cc', 52),  # Polaridad Inversa - Cerrado Cerrado
-            ('pi_ca', 53),  # Polaridad Inversa - Cerrado Abierto
-            ('pi_ac', 54),  # Polaridad Inversa - Abierto Cerrado
-            ('pi_aa', 55),  # Polaridad Inversa - Abierto Abierto
-        ]
-        
-        for cond, fila in condiciones_fuga:
-            # Llenar los 5 valores de medición para cada condición
-            for j in range(5):
-                col = chr(67 + j)  # F, G, H, I, J  (comenzando desde columna F)
-                key = f"fuga_chasis_{cond}_valor{j+1}"
-                
-                if key in datos_formulario and datos_formulario[key]:
-                    escribir_celda_segura(ws, f"{col}{fila}", datos_formulario[key], fuente)
-
-        # Prueba de corriente de fuga a tierra
-        estados_operacion = [
-            ('detenido_directa', 62),
-            ('detenido_inversa', 63),
-            ('funcionamiento_directa', 64),
-            ('funcionamiento_inversa', 65)
-        ]
-        
-        for estado, fila in estados_operacion:
-            # Llenar los 5 valores de medición para cada estado
-            for j in range(5):
-                col = chr(67 + j)  # D, E, F, G, H (comenzando desde columna D)
-                key = f"fuga_tierra_{estado}_valor{j+1}"
-                
-                if key in datos_formulario and datos_formulario[key]:
-                    escribir_celda_segura(ws, f"{col}{fila}", datos_formulario[key], fuente)
-
-        # Observaciones
-        escribir_celda_segura(ws, "B70", datos_formulario['observaciones'], fuente)
-        
-        # 4. Guardar archivo editado
-        archivo_editado = io.BytesIO()
-        wb.save(archivo_editado)
-        archivo_editado.seek(0)
-        
-        # 5. Actualizar archivo en Drive
-        media = MediaIoBaseUpload(
-            archivo_editado,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return generar_informe(
+            drive_service, plantilla_id, carpeta_destino_id, _nombre_informe(datos_formulario), datos_formulario,
+            mapa_celdas=MAPA_CELDAS_SEGURIDAD,
+            celdas_calculadas=CELDAS_MEDICIONES,
         )
-        
-        resultado_final = drive_service.files().update(
-            fileId=copia_id,
-            media_body=media,
-            fields='id,name,webViewLink'
-        ).execute()
-        
-        return resultado_final, archivo_editado
-        
+
     except Exception as e:
         st.error(f"Error creando informe: {e}")
         import traceback
         st.error(f"Detalles del error: {traceback.format_exc()}")
         return None, None
 
-# Función alternativa para debugging - inspeccionar celdas fusionadas
-def inspeccionar_plantilla(drive_service, plantilla_id):
-    """Función para inspeccionar qué celdas están fusionadas en la plantilla"""
+
+# ==========================
+# GENERACIÓN POR LOTE
+# ==========================
+# Columnas del archivo de lote además de las mediciones (las vacías toman el valor por defecto)
+COLUMNAS_LOTE = [
+    'codigo_activo', 'fecha_recepcion', 'fecha_mediciones',
+    'temperatura_inicial', 'temperatura_final', 'humedad_inicial', 'humedad_final',
+    'observaciones',
+]
+
+
+def plantilla_lote_csv():
+    """CSV vacío con las columnas que espera el modo por lote"""
+    return pd.DataFrame(columns=COLUMNAS_LOTE + CAMPOS_MEDICIONES).to_csv(index=False).encode('utf-8')
+
+
+def leer_archivo_lote(archivo):
+    """Lee el CSV/XLSX subido como texto (conserva ceros a la izquierda de los códigos)"""
+    if archivo.name.lower().endswith('.csv'):
+        df = pd.read_csv(archivo, dtype=str)
+    else:
+        df = pd.read_excel(archivo, dtype=str)
+    df.columns = [str(c).strip() for c in df.columns]
+    return df.fillna('')
+
+
+def _a_numero(valor):
+    """Convierte una medición a float ('' si está vacía); ValueError si no es numérica"""
+    texto = str(valor).strip()
+    if not texto:
+        return ''
+    return float(texto.replace(',', '.'))
+
+
+def preparar_filas_lote(df, indice, valores_defecto):
+    """
+    Construye los datos de cada informe a partir de las filas del archivo.
+    Devuelve (lista de (fila, datos_formulario), lista de errores por fila).
+    El equipo se busca por código o por serie en el índice del inventario.
+    """
+    trabajos, errores = [], []
+    for pos, fila in enumerate(df.to_dict('records'), start=2):  # fila 1 = encabezados
+        codigo = fila.get('codigo_activo', '').strip()
+        equipo = buscar_por_codigo(indice, codigo) or buscar_por_serie(indice, codigo)
+        if not equipo:
+            errores.append({'Fila': pos, 'Código': codigo, 'Estado': '❌', 'Detalle': 'Equipo no encontrado'})
+            continue
+
+        datos = dict(valores_defecto)
+        datos.update({
+            'equipo_nombre': equipo['equipo'],
+            'marca': equipo['marca'],
+            'modelo': equipo['modelo'],
+            'serie': equipo['serie'],
+            'codigo_activo': equipo['codigo_nuevo'],
+        })
+        for columna in COLUMNAS_LOTE[1:]:
+            if fila.get(columna, '').strip():
+                datos[columna] = fila[columna].strip()
+        invalidas = []
+        for campo in CAMPOS_MEDICIONES:
+            try:
+                datos[campo] = _a_numero(fila.get(campo, ''))
+            except ValueError:
+                invalidas.append(f"{campo}='{fila[campo]}'")
+        if invalidas:
+            # Una medición ilegible no se deja en blanco: la fila no genera informe
+            errores.append({'Fila': pos, 'Código': codigo, 'Equipo': equipo['equipo'], 'Estado': '❌',
+                            'Detalle': f"Mediciones no numéricas: {', '.join(invalidas)}"})
+            continue
+
+        try:
+            fecha_str = datetime.strptime(datos['fecha_mediciones'], "%d/%m/%Y").strftime("%Y%m%d")
+        except ValueError:
+            fecha_str = datos['fecha_mediciones'].replace('/', '')
+        datos['codigo_informe'] = f"PSE-{fecha_str}-{datos['codigo_activo']}"
+        trabajos.append((pos, datos))
+    return trabajos, errores
+
+
+def generar_lote(credenciales, plantilla, plantilla_id, destinos, trabajos, al_avanzar=None):
+    """
+    Genera los informes en el pool de lotes de Drive (separado de las lecturas
+    interactivas y con pocas tareas encoladas a la vez; las subidas se reintentan
+    ante límites de cuota). Una celda que no se pudo escribir marca la fila como fallida.
+    Cada hilo usa su propio servicio de Drive (los clientes HTTP no son thread-safe).
+    destinos: {fila: carpeta de Drive del informe} (resueltas antes, una vez por código).
+    al_avanzar(resultado) se llama desde el hilo que invoca a esta función.
+    Devuelve la lista de resultados por fila.
+    """
+    def generar(pos, datos):
+        resultado, _ = generar_informe(
+            servicio_hilo(credenciales), plantilla_id, destinos[pos], _nombre_informe(datos), datos,
+            mapa_celdas=MAPA_CELDAS_SEGURIDAD,
+            celdas_calculadas=CELDAS_MEDICIONES,
+            plantilla=plantilla,
+            estricto=True,
+        )
+        return resultado
+
+    resultados = []
+    for (pos, datos), futuro in procesar_lote(generar, trabajos):
+        fila = {'Fila': pos, 'Código': datos['codigo_activo'], 'Equipo': datos['equipo_nombre']}
+        try:
+            archivo = futuro.result()
+            fila.update({'Estado': '✅', 'Detalle': archivo.get('webViewLink', archivo['id'])})
+        except Exception as e:
+            fila.update({'Estado': '❌', 'Detalle': str(e)})
+        resultados.append(fila)
+        if al_avanzar:
+            al_avanzar(fila)
+    return resultados
+
+
+def mostrar_generacion_lote(drive_service, indice, plantilla_id, carpeta_destino_id):
+    """UI del modo por lote: un informe por fila del CSV/XLSX de mediciones"""
+    st.markdown("### 📦 Generación por lote")
+    st.info("Suba un CSV/Excel con una fila por equipo. La columna **codigo_activo** acepta el código o la serie; "
+            "las mediciones usan los mismos nombres que el formulario (p. ej. tierra_lado1_valor1).")
+    st.download_button(
+        label="⬇️ Descargar plantilla de lote (CSV)",
+        data=plantilla_lote_csv(),
+        file_name="plantilla_lote_seguridad_electrica.csv",
+        mime="text/csv"
+    )
+
+    with st.form("formulario_lote_seguridad"):
+        st.markdown("#### Valores por defecto (se usan cuando la columna está vacía)")
+        col1, col2 = st.columns(2)
+        with col1:
+            institucion = st.selectbox("🏥 Institución", ["Clínica Médica Cayetano Heredia"])
+            sede = st.selectbox("🏢 Sede", ["San Martín de Porres", "Lince", "San Borja", "Anexo de Logística"])
+            fecha_mediciones = st.date_input("📅 Fecha de las mediciones", datetime.now())
+            observaciones = st.text_input("📝 Observaciones", value="El equipo cumple adecuadamente")
+        with col2:
+            patron_marca = st.text_input("🏷️ Marca patrón", value="BC DEPOT")
+            patron_modelo = st.text_input("📱 Modelo patrón", value="SA2000INTL")
+            patron_serie = st.text_input("🔢 Serie patrón", value="7334INTL3039")
+            patron_fecha_calibracion = st.text_input("📅 Fecha Calibración", value="7/10/2024")
+            patron_proxima_calibracion = st.text_input("📅 Próxima Calibración", value="10/4/2026")
+
+        archivo = st.file_uploader("📄 Archivo de mediciones", type=["csv", "xlsx"])
+        enviar = st.form_submit_button("📤 **GENERAR INFORMES DEL LOTE**", use_container_width=True)
+
+    if not enviar:
+        return
+    if archivo is None:
+        st.error("❌ Suba un archivo CSV o Excel")
+        return
+
     try:
-        # Crear copia temporal
-        copy_metadata = {'name': 'temp_inspection'}
-        copia = drive_service.files().copy(fileId=plantilla_id, body=copy_metadata).execute()
-        copia_id = copia['id']
-        
-        # Descargar
-        request = drive_service.files().get_media(fileId=copia_id)
-        file_io = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_io, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        file_io.seek(0)
-        
-        # Inspeccionar
-        wb = openpyxl.load_workbook(file_io)
-        ws = wb.active
-        
-        st.write("### 🔍 Celdas fusionadas encontradas:")
-        for merged_range in ws.merged_cells.ranges:
-            st.write(f"- Rango fusionado: {merged_range}")
-            
-        # Eliminar copia temporal
-        drive_service.files().delete(fileId=copia_id).execute()
-        
+        df = leer_archivo_lote(archivo)
     except Exception as e:
-        st.error(f"Error inspeccionando plantilla: {e}")
+        st.error(f"❌ No se pudo leer el archivo: {e}")
+        return
+    if 'codigo_activo' not in df.columns:
+        st.error("❌ El archivo debe tener la columna 'codigo_activo'")
+        return
+
+    fecha_str = fecha_mediciones.strftime("%d/%m/%Y")
+    valores_defecto = {
+        'institucion': institucion,
+        'sede': sede,
+        'fecha_recepcion': fecha_str,
+        'fecha_mediciones': fecha_str,
+        'temperatura_inicial': '23.0',
+        'temperatura_final': '23.5',
+        'humedad_inicial': '50.0',
+        'humedad_final': '51.0',
+        'patron_marca': patron_marca,
+        'patron_modelo': patron_modelo,
+        'patron_serie': patron_serie,
+        'patron_fecha_calibracion': patron_fecha_calibracion,
+        'patron_proxima_calibracion': patron_proxima_calibracion,
+        'observaciones': observaciones,
+    }
+    trabajos, resultados = preparar_filas_lote(df, indice, valores_defecto)
+    if not trabajos:
+        st.error("❌ Ninguna fila del archivo se puede generar (equipo no encontrado o mediciones inválidas)")
+        st.dataframe(pd.DataFrame(resultados), use_container_width=True, hide_index=True)
+        return
+
+    try:
+        # La plantilla se resuelve una vez aquí y se comparte con todos los hilos
+        plantilla = obtener_plantilla(drive_service, plantilla_id)
+    except Exception as e:
+        st.error(f"❌ No se pudo obtener la plantilla: {e}")
+        return
+
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    total = len(trabajos)
+    completados = []
+
+    def al_avanzar(fila):
+        completados.append(fila)
+        progress_bar.progress(len(completados) / total)
+        status_text.text(f"☁️ {len(completados)}/{total} informes procesados...")
+
+    # Cada informe va a la subcarpeta de su equipo (índice local, una vez por código)
+    por_codigo = carpetas_destino(drive_service, [datos['codigo_activo'] for _, datos in trabajos],
+                                  SUBCARPETA_INFORMES, carpeta_destino_id)
+    destinos = {pos: por_codigo[datos['codigo_activo']] for pos, datos in trabajos}
+    resultados += generar_lote(_credenciales_drive(), plantilla, plantilla_id, destinos,
+                               trabajos, al_avanzar)
+
+    exitos = sum(1 for r in resultados if r['Estado'] == '✅')
+    status_text.text(f"✅ {exitos} de {len(resultados)} informes generados")
+    if exitos == len(resultados):
+        st.success(f"🎉 **¡Se generaron los {exitos} informes del lote!**")
+    else:
+        st.warning(f"⚠️ {len(resultados) - exitos} filas no se pudieron generar; revise el detalle")
+
+    df_resultados = pd.DataFrame(resultados).sort_values('Fila')
+    st.dataframe(df_resultados, use_container_width=True, hide_index=True)
+    st.download_button(
+        label="⬇️ Descargar resultados (CSV)",
+        data=df_resultados.to_csv(index=False).encode('utf-8'),
+        file_name="resultados_lote_seguridad_electrica.csv",
+        mime="text/csv"
+    )
+
+
+def _mostrar_footer():
+    """Pie de página del módulo"""
+    st.markdown("---")
+    st.markdown("""
+    <div style='text-align: center; color: #666; font-size: 14px;'>
+        🏥 <strong>Sistema de Pruebas de Seguridad Eléctrica - MEDIFLOW</strong><br>
+        Garantizando la seguridad eléctrica de los equipos médicos según NTP IEC 60601-1
+    </div>
+    """, unsafe_allow_html=True)
 
-# Cargar datos desde Google Sheets
-@st.cache_data
-def cargar_datos():
-    info = st.secrets["google_service_account"]
-    scope = ['https://www.googleapis.com/auth/spreadsheets',
-             'https://www.googleapis.com/auth/drive']
-    credenciales = ServiceAccountCredentials.from_json_keyfile_dict(info, scope)
-    cliente = gspread.authorize(credenciales)
-    hoja = cliente.open("Base de datos").sheet1
-    datos = hoja.get_all_records()
-    return pd.DataFrame(datos)
 
 # Función principal para el módulo de pruebas de seguridad eléctrica
 def mostrar_pruebas_seguridad_electrica():
@@ -271,92 +391,30 @@ def mostrar_pruebas_seguridad_electrica():
         if st.button("Inspeccionar celdas fusionadas"):
             inspeccionar_plantilla(drive_service, PLANTILLA_ID)
 
-    # Cargar base de datos
-    df = cargar_datos()
-
-    # ============== SELECTOR DE EQUIPOS (igual que en el módulo anterior) ==============
-    st.markdown("### 🔍 Selección de Equipo")
-    
-    equipos = []
-    for _, row in df.iterrows():
-        equipo = {
-            'codigo_nuevo': row.get('Codigo nuevo', ''),
-            'equipo': row.get('EQUIPO', ''),
-            'marca': row.get('MARCA', ''),
-            'modelo': row.get('MODELO', ''),
-            'serie': row.get('SERIE', ''),
-            'area': row.get('AREA', ''),
-            'ubicacion': row.get('UBICACION', ''),
-        }
-        equipos.append(equipo)
+    # Índice del inventario compartido
+    indice = obtener_indice_equipos()
 
-    metodo_seleccion = st.radio(
-        "¿Cómo deseas seleccionar el equipo?",
-        ["🔍 Selector inteligente", "⌨️ Código manual"],
+    modo = st.radio(
+        "Seleccione una opción:",
+        ["📝 Informe individual", "📦 Campaña por lote (CSV/Excel)"],
         horizontal=True
     )
+    if modo == "📦 Campaña por lote (CSV/Excel)":
+        mostrar_generacion_lote(drive_service, indice, PLANTILLA_ID, CARPETA_INFORMES_ID)
+        _mostrar_footer()
+        return
 
-    marca = modelo = equipo_nombre = serie = codigo_equipo = ""
-    area_equipo = ubicacion_equipo = ""
-
-    if metodo_seleccion == "🔍 Selector inteligente":
-        areas_disponibles = sorted(list(set([eq['area'] for eq in equipos if eq['area']])))
-        area_filtro = st.selectbox("🏢 Filtrar por Área", ["Todas"] + areas_disponibles)
-        
-        equipos_filtrados = equipos
-        if area_filtro != "Todas":
-            equipos_filtrados = [eq for eq in equipos if eq['area'] == area_filtro]
-        
-        if equipos_filtrados:
-            opciones_equipos = []
-            for eq in equipos_filtrados:
-                opcion = f"{eq['codigo_nuevo']} - {eq['equipo']}"
-                if eq['area']:
-                    opcion += f" ({eq['area']})"
-                if eq['ubicacion']:
-                    opcion += f" - {eq['ubicacion']}"
-                opciones_equipos.append(opcion)
-            
-            equipo_seleccionado = st.selectbox("🔧 Seleccionar Equipo", opciones_equipos)
-            indice_equipo = opciones_equipos.index(equipo_seleccionado)
-            equipo_data = equipos_filtrados[indice_equipo]
-            
-            codigo_equipo = equipo_data['codigo_nuevo']
-            equipo_nombre = equipo_data['equipo']
-            marca = equipo_data['marca']
-            modelo = equipo_data['modelo']
-            serie = equipo_data['serie']
-            area_equipo = equipo_data['area']
-            ubicacion_equipo = equipo_data['ubicacion']
-            
-            with st.expander("🔍 Detalles del Equipo Seleccionado", expanded=True):
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.write(f"**🏷️ Código:** {codigo_equipo}")
-                    st.write(f"**⚙️ Equipo:** {equipo_nombre}")
-                    st.write(f"**🏭 Marca:** {marca}")
-                with col2:
-                    st.write(f"**📱 Modelo:** {modelo}")
-                    st.write(f"**🔢 Serie:** {serie}")
-                    st.write(f"**📍 Área:** {area_equipo}")
-        else:
-            st.warning("⚠️ No se encontraron equipos para el área seleccionada")
+    # ============== SELECTOR DE EQUIPOS (igual que en el módulo anterior) ==============
+    st.markdown("### 🔍 Selección de Equipo")
     
-    else:  # Código manual
-        codigo_input = st.text_input("🔍 Ingrese el código del equipo (Ej: EQU-0000001)")
-        equipo_info = df[df["Codigo nuevo"] == codigo_input]
-        
-        if not equipo_info.empty:
-            equipo_row = equipo_info.iloc[0]
-            codigo_equipo = codigo_input
-            marca = equipo_row["MARCA"]
-            modelo = equipo_row["MODELO"]
-            equipo_nombre = equipo_row["EQUIPO"]
-            serie = equipo_row["SERIE"]
-            area_equipo = equipo_row.get("AREA", "")
-            ubicacion_equipo = equipo_row.get("UBICACION", "")
-            
-            st.success(f"✅ **Equipo encontrado:** {equipo_nombre}")
+    equipo_data = selector_equipo(indice) or {}
+    codigo_equipo = equipo_data.get('codigo_nuevo', '')
+    equipo_nombre = equipo_data.get('equipo', '')
+    marca = equipo_data.get('marca', '')
+    modelo = equipo_data.get('modelo', '')
+    serie = equipo_data.get('serie', '')
+    area_equipo = equipo_data.get('area', '')
+    ubicacion_equipo = equipo_data.get('ubicacion', '')
 
     # ============== FORMULARIO ESPECÍFICO PARA PRUEBAS DE SEGURIDAD ELÉCTRICA ==============
     with st.form("formulario_seguridad_electrica"):
@@ -743,7 +801,7 @@ def mostrar_pruebas_seguridad_electrica():
             resultado_final, archivo_editado = crear_informe_seguridad_electrica(
                 drive_service, 
                 PLANTILLA_ID, 
-                CARPETA_INFORMES_ID, 
+                carpeta_destino(drive_service, codigo_equipo, SUBCARPETA_INFORMES, CARPETA_INFORMES_ID), 
                 datos_formulario
             )
             
@@ -781,10 +839,4 @@ def mostrar_pruebas_seguridad_electrica():
             status_text.empty()
 
     # Footer
-    st.markdown("---")
-    st.markdown("""
-    <div style='text-align: center; color: #666; font-size: 14px;'>
-        🏥 <strong>Sistema de Pruebas de Seguridad Eléctrica - MEDIFLOW</strong><br>
-        Garantizando la seguridad eléctrica de los equipos médicos según NTP IEC 60601-1
-    </div>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+    _mostrar_footer()